@@ -0,0 +1,203 @@
+"""
+Measures the news scraping of the "get recent stock news" tool against a local fixture HTTP server.
+
+The server imitates the cafef.vn search page and articles, each response delayed like a remote site. The script
+checks that news_fetcher parses the fixture pages to the expected summaries and contents. It then times the previous
+scraper (a new connection per request, the articles one after the other, BeautifulSoup's html.parser) against
+news_fetcher: pooled connections, the articles at the same time with lxml, cold and then with the articles cached.
+An article that times out is reported as unavailable without holding up the others.
+
+Usage:
+    python benchmarks/news_fetcher.py --delay 0.2 --paragraphs 40 --repeat 3
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from timeit import default_timer as timer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+from bs4 import BeautifulSoup
+
+# Make the project modules importable when the script is run from the project directory or from benchmarks/
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+import news_fetcher
+from news_fetcher import article_cache, create_session, fetch_news_with_content
+
+ARTICLES = 6  # One more than news_fetcher reads, only the first five are fetched
+
+
+def article_summary(number):
+    """
+    Returns the summary of a fixture article.
+    """
+    return f"Tóm tắt bài viết số {number} về cổ phiếu HPG."
+
+
+def article_paragraphs(number, paragraphs):
+    """
+    Returns the paragraphs of a fixture article.
+    """
+    return [f"Đoạn {index} của bài viết {number}: doanh thu quý tăng trưởng ổn định, biên lợi nhuận cải thiện."
+            for index in range(paragraphs)]
+
+
+def search_page(query):
+    """
+    Returns a search page listing the fixture articles, with an unrelated list before them.
+    """
+    items = "".join(f"""
+        <div class="item">
+            <h3 class="titlehidden"><a href="/bai-viet-{number}.chn">{query} bài {number}</a></h3>
+            <p class="sapo">{article_summary(number)}</p>
+        </div>""" for number in range(ARTICLES))
+    return f"""<html><head><title>Tìm kiếm</title></head><body>
+        <div class="list-section"><div class="item-list">Không liên quan</div></div>
+        <div class="list-section list-event">{items}</div>
+        </body></html>"""
+
+
+def article_page(number, paragraphs):
+    """
+    Returns a fixture article page, with the scripts and menus of a real page around the content.
+    """
+    menu = "".join(f"<li><a href='/muc-{index}.chn'>Mục {index}</a></li>" for index in range(200))
+    body = "".join(f"<p>{paragraph}</p>" for paragraph in article_paragraphs(number, paragraphs))
+    return f"""<html><head><script>var tracking = {{}};</script></head><body>
+        <ul class="menu">{menu}</ul>
+        <div class="detail-content afcbc-body" data-role="content">{body}</div>
+        <div class="footer">{menu}</div>
+        </body></html>"""
+
+
+def start_fixture_server(delay, slow_article, slow_delay, paragraphs):
+    """
+    Starts the fixture server in a thread.
+
+    :return: The server, its base URL is http://127.0.0.1:<server.server_port>.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Keep-alive, so pooled connections can be reused
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/tim-kiem.chn":
+                body = search_page(parse_qs(url.query).get("keywords", [""])[0])
+            elif url.path.startswith("/bai-viet-"):
+                number = int(url.path[len("/bai-viet-"):-len(".chn")])
+                if number == slow_article:
+                    time.sleep(slow_delay)
+                body = article_page(number, paragraphs)
+            else:
+                self.send_error(404)
+                return
+            time.sleep(delay)
+            payload = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def previous_scraper(base_url, query):
+    """
+    The scraper news_fetcher replaced: requests.get without a session, the articles one after the other.
+    """
+    response = requests.get(f"{base_url}/tim-kiem.chn", params={'keywords': query})
+    response.raise_for_status()
+    soup = BeautifulSoup(response.text, 'html.parser')
+    articles = []
+    for item in soup.find('div', class_='list-section list-event').find_all('div', class_='item')[:5]:
+        link = base_url + item.find('h3', class_='titlehidden').find('a')['href']
+        article = requests.get(link)
+        article.raise_for_status()
+        content_div = BeautifulSoup(article.text, 'html.parser').find('div', class_='detail-content afcbc-body')
+        content = "\n".join(p.text.strip() for p in content_div.find_all('p'))
+        articles.append({'summary': item.find('p', class_='sapo').text.strip(), 'content': content})
+    return articles
+
+
+def check(articles, paragraphs, timed_out=()):
+    """
+    Checks that the scraped articles are the first five fixture articles, the timed out ones without content.
+    """
+    assert len(articles) == 5, f"{len(articles)} articles scraped instead of 5"
+    for number, article in enumerate(articles):
+        assert article["summary"] == article_summary(number), article["summary"]
+        expected = ("Content not available" if number in timed_out
+                    else "\n".join(article_paragraphs(number, paragraphs)))
+        assert article["content"] == expected, f"article {number}: {article['content'][:80]}"
+
+
+def measure(function, repeat):
+    """
+    Runs a function several times, returns its result and median duration.
+    """
+    durations = []
+    for _ in range(repeat):
+        start = timer()
+        result = function()
+        durations.append(timer() - start)
+    return result, statistics.median(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--delay", type=float, default=0.2, help="Seconds every fixture response is delayed")
+    parser.add_argument("--paragraphs", type=int, default=40, help="Paragraphs of every fixture article")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of every scraper, the median is reported")
+    args = parser.parse_args()
+
+    server = start_fixture_server(args.delay, slow_article=None, slow_delay=0, paragraphs=args.paragraphs)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    session = create_session()
+
+    previous, previous_time = measure(lambda: previous_scraper(base_url, "HPG"), args.repeat)
+    check(previous, args.paragraphs)
+
+    def cold():
+        article_cache.clear()
+        return fetch_news_with_content("HPG", base_url, session)
+
+    articles, cold_time = measure(cold, args.repeat)
+    check(articles, args.paragraphs)
+    articles, warm_time = measure(lambda: fetch_news_with_content("HPG", base_url, session), args.repeat)
+    check(articles, args.paragraphs)
+    server.shutdown()
+
+    # One article slower than the read timeout: the others are still returned, the tool waits at most the timeout
+    slow_server = start_fixture_server(args.delay, slow_article=2, slow_delay=3.0, paragraphs=args.paragraphs)
+    news_fetcher.NEWS_READ_TIMEOUT = 1.0
+    article_cache.clear()
+    start = timer()
+    articles = fetch_news_with_content("HPG", f"http://127.0.0.1:{slow_server.server_port}", session)
+    timeout_time = timer() - start
+    check(articles, args.paragraphs, timed_out={2})
+    slow_server.shutdown()
+
+    print(f"\n{'scraper':>40} {'seconds':>8} {'speedup':>8}")
+    for label, duration in (("previous (sequential, html.parser)", previous_time),
+                            ("news_fetcher, cold cache", cold_time),
+                            ("news_fetcher, articles cached", warm_time)):
+        print(f"{label:>40} {duration:>8.3f} {previous_time / duration:>7.1f}x")
+    print(f"\nWith one article slower than the 1 s read timeout: {timeout_time:.2f} s, the 4 other articles returned")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Measures the hit rate and latency of the local ticker resolver used by the "get company ticker" tool.
+
+Generates questions about the companies of data-02.csv, naming each company by its ticker (in capitals, in lowercase,
+or next to a second ticker), its full name, its name without the legal form ("Công ty Cổ phần", "Ngân hàng Thương mại
+Cổ phần"...), the same without diacritics or with a typo, plus questions about no company. For every variant it
+reports how many questions were resolved to the right ticker, to a wrong one, to no company, or left ambiguous (sent
+to the LLM fallback with the candidates) and how many of those have the right ticker among the candidates, and the
+resolve latency.
+It also compares the size of the fallback prompt with the previous prompt, which held the whole company list.
+
+Usage:
+    python benchmarks/ticker_resolver.py --companies 400 --seed 0
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import re
+import statistics
+import sys
+from timeit import default_timer as timer
+
+# Make the project modules importable when the script is run from the project directory or from benchmarks/
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+from ticker_resolver import TickerResolver, build_fallback_prompt, normalize
+
+TEMPLATES = (
+    "Phân tích cổ phiếu {}",
+    "Có nên mua cổ phiếu {} không?",
+    "Đánh giá tình hình tài chính của {} năm nay",
+    "Triển vọng {} trong quý tới",
+    "CEO của {} là ai?",
+)
+NO_COMPANY_QUESTIONS = (
+    "Đánh giá thị trường hiện tại?",
+    "Thị trường chứng khoán tuần này thế nào?",
+    "Có nên mua vàng lúc này không?",
+    "Lãi suất ngân hàng tháng này ra sao?",
+    "Phân tích cổ phiếu ngành thép",
+    "VN-Index có vượt 1300 điểm không?",
+    "Tỷ giá USD VND hôm nay",
+    "lai suat ngan hang hom nay",
+)
+# The legal forms the questions leave out of the company names
+LEGAL_FORM = re.compile(r"^(Tổng Công ty Cổ phần|Công ty Cổ phần|Tổng Công ty|Công ty TNHH|Ngân hàng Thương mại Cổ phần)"
+                        r"\s+", re.IGNORECASE)
+
+
+def short_name(name):
+    """
+    Returns the name without its legal form, e.g. "Tập đoàn Hòa Phát".
+    """
+    return LEGAL_FORM.sub("", name)
+
+
+def with_typo(rng, text):
+    """
+    Swaps two letters in the longest word of the text.
+    """
+    words = text.split()
+    index = max(range(len(words)), key=lambda i: len(words[i]))
+    word = words[index]
+    if len(word) < 4:
+        return text
+    position = rng.randrange(1, len(word) - 2)
+    words[index] = word[:position] + word[position + 1] + word[position] + word[position + 2:]
+    return " ".join(words)
+
+
+def percentile(values, fraction):
+    """
+    Returns a percentile of the values.
+    """
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--companies", type=int, default=400, help="Number of companies asked about")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the questions")
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    company_path = os.path.join(PROJECT_DIR, "data-02.csv")
+    start = timer()
+    resolver = TickerResolver.from_csv(company_path, os.path.join(PROJECT_DIR, "ticker_aliases.csv"))
+    load_time = timer() - start
+    with open(company_path, newline="", encoding="utf-8") as file:
+        companies = [(row["company_ticker"], row["company_name"]) for row in csv.DictReader(file)]
+    sample = rng.sample(companies, min(args.companies, len(companies)))
+
+    variants = {
+        "ticker": [(ticker, rng.choice(TEMPLATES).format(ticker)) for ticker, _ in sample],
+        "lowercase": [(ticker, rng.choice(TEMPLATES).format(ticker.lower())) for ticker, _ in sample],
+        # The first ticker is the one expected, the LLM fallback is asked to choose
+        "two tickers": [(ticker, rng.choice(TEMPLATES).format(f"{ticker} so với {other}"))
+                        for (ticker, _), (other, _) in zip(sample, sample[1:] + sample[:1])],
+        "full name": [(ticker, rng.choice(TEMPLATES).format(name)) for ticker, name in sample],
+        "short name": [(ticker, rng.choice(TEMPLATES).format(short_name(name))) for ticker, name in sample],
+        "no diacritics": [(ticker, normalize(rng.choice(TEMPLATES).format(short_name(name))))
+                          for ticker, name in sample],
+        "typo": [(ticker, rng.choice(TEMPLATES).format(with_typo(rng, short_name(name)))) for ticker, name in sample],
+        "no company": [("UNKNOWN", question) for question in NO_COMPANY_QUESTIONS],
+    }
+
+    with open(company_path, encoding="utf-8") as file:
+        previous_prompt_chars = len(json.dumps(file.read()))
+    print(f"Index of {len(resolver.names)} companies and {len(resolver.aliases)} aliases built in "
+          f"{load_time * 1000:.1f} ms\n")
+    print(f"{'questions':>14} {'count':>6} {'right':>7} {'wrong':>7} {'unknown':>8} {'to LLM':>7} {'p50 us':>8} "
+          f"{'p99 us':>8} {'LLM has it':>11} {'LLM prompt chars':>17}")
+    for variant, questions in variants.items():
+        right = wrong = unknown = ambiguous = candidate_hits = 0
+        latencies = []
+        prompt_chars = []
+        for expected, question in questions:
+            start = timer()
+            resolution = resolver.resolve(question)
+            latencies.append(timer() - start)
+            if resolution.method == "ambiguous":
+                ambiguous += 1
+                candidate_hits += expected in {ticker for ticker, _, _ in resolution.candidates}
+                prompt_chars.append(len(build_fallback_prompt(question, resolution.candidates)))
+            elif resolution.ticker == expected:
+                right += 1
+            elif resolution.method == "none":
+                unknown += 1
+            else:
+                wrong += 1
+        count = len(questions)
+        mean_prompt = f"{statistics.mean(prompt_chars):.0f}" if prompt_chars else "-"
+        has_it = f"{candidate_hits / ambiguous:.1%}" if ambiguous and variant != "no company" else "-"
+        print(f"{variant:>14} {count:>6} {right / count:>7.1%} {wrong / count:>7.1%} {unknown / count:>8.1%} "
+              f"{ambiguous / count:>7.1%} "
+              f"{percentile(latencies, 0.5) * 1e6:>8.0f} {percentile(latencies, 0.99) * 1e6:>8.0f} "
+              f"{has_it:>11} {mean_prompt:>17}")
+    print(f"\nThe previous prompt sent the whole company list on every question: {previous_prompt_chars} characters")
+
+
+if __name__ == "__main__":
+    main()
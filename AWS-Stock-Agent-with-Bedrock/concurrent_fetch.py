@@ -0,0 +1,86 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
+
+# Threads shared by the tools of every session, the fetches wait on the network
+FETCH_WORKERS = int(os.environ.get("FETCH_WORKERS", "16"))
+# Seconds a single fetch may take before its result is given up on
+FETCH_TIMEOUT = float(os.environ.get("FETCH_TIMEOUT", "20"))
+
+# Seconds to connect and to wait for the response of an HTTP request sent without a timeout, e.g. by Vnstock
+REQUEST_CONNECT_TIMEOUT = float(os.environ.get("REQUEST_CONNECT_TIMEOUT", "5"))
+REQUEST_READ_TIMEOUT = float(os.environ.get("REQUEST_READ_TIMEOUT", "15"))
+
+_executor = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="fetch")
+
+
+# Function to give the requests sent without a timeout, e.g. by Vnstock, a connect and read timeout, so a hung data
+# source cannot hold a fetch worker forever. requests waits without limit when no timeout is passed
+def set_default_request_timeout(connect=REQUEST_CONNECT_TIMEOUT, read=REQUEST_READ_TIMEOUT):
+    request = getattr(requests.Session.request, "without_default_timeout", requests.Session.request)
+
+    def request_with_timeout(self, method, url, *args, **kwargs):
+        # Positional arguments follow the order of Session.request, timeout is the 7th after the URL
+        if len(args) < 7 and kwargs.get("timeout") is None:
+            kwargs["timeout"] = (connect, read)
+        return request(self, method, url, *args, **kwargs)
+
+    request_with_timeout.without_default_timeout = request
+    requests.Session.request = request_with_timeout
+
+
+set_default_request_timeout()
+
+
+# Function to run independent fetches at the same time and collect what finished in time
+# tasks: a dict of name to a function without arguments, e.g. the eight statements of a company
+# default: a function returning the result of a fetch that failed or timed out, e.g. pd.DataFrame
+# Returns the results in the order of the tasks, and the timing of every fetch: its duration in seconds and its
+# status, "ok", "error" or "timeout". The call waits at most timeout seconds from when the fetches are submitted,
+# queued or running. A fetch still queued then is cancelled, a running one keeps going until its requests time out
+def fetch_concurrently(tasks, default=None, timeout=FETCH_TIMEOUT):
+    submitted = time.perf_counter()
+    started = {}
+    finished = {}
+    lock = threading.Lock()
+
+    def run(name, task):
+        with lock:
+            started[name] = time.perf_counter()
+        try:
+            return task()
+        finally:
+            with lock:
+                finished[name] = time.perf_counter()
+
+    futures = {_executor.submit(run, name, task): name for name, task in tasks.items()}
+    # One deadline for every fetch, a busy pool cannot make the call wait longer
+    _, not_done = wait(futures, timeout=timeout)
+
+    results = {}
+    timings = {}
+    for future, name in futures.items():
+        if future in not_done and not future.done():
+            future.cancel()
+            results[name] = default() if default else None
+            timings[name] = (round(time.perf_counter() - submitted, 3), "timeout")
+            continue
+        try:
+            results[name] = future.result()
+            status = "ok"
+        except Exception as e:
+            print(f"Error fetching {name}: {e}")
+            results[name] = default() if default else None
+            status = "error"
+        with lock:
+            timings[name] = (round(finished.get(name, time.perf_counter()) - started.get(name, submitted), 3), status)
+    return results, timings
+
+
+# Function to format the timings of fetch_concurrently for the logs, slowest first
+def format_timings(timings):
+    return ", ".join(f"{name} {duration:.2f}s{'' if status == 'ok' else ' ' + status}"
+                     for name, (duration, status) in sorted(timings.items(), key=lambda item: -item[1][0]))
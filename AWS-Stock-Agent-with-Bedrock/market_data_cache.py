@@ -0,0 +1,156 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+# Vietnamese market time, UTC+7 all year
+MARKET_TIMEZONE = timezone(timedelta(hours=7))
+# The HOSE and HNX sessions end at 15:00, the day's prices are final after that
+MARKET_CLOSE_HOUR = 15
+# Statements of the previous quarter are published during the first weeks of a quarter, they are refreshed daily then
+REPORTING_SEASON_DAYS = int(os.environ.get("REPORTING_SEASON_DAYS", "50"))
+# Where the cached market data is stored, shared by every session of the app
+MARKET_DATA_CACHE_PATH = os.environ.get("MARKET_DATA_CACHE_PATH", "market_data.sqlite3")
+
+
+# Function to get the time the prices fetched at a given time are final: the next market close on a weekday
+def end_of_trading_day(fetched_at):
+    fetched = datetime.fromtimestamp(fetched_at, MARKET_TIMEZONE)
+    close = fetched.replace(hour=MARKET_CLOSE_HOUR, minute=0, second=0, microsecond=0)
+    if fetched >= close:
+        close += timedelta(days=1)
+    # Nothing trades on Saturday and Sunday, Friday's prices hold until Monday's close
+    while close.weekday() >= 5:
+        close += timedelta(days=1)
+    return close.timestamp()
+
+
+# Function to get the time statements fetched at a given time may have changed: the next day during the reporting
+# season at the start of a quarter, the start of the next quarter otherwise
+def end_of_reporting_period(fetched_at):
+    fetched = datetime.fromtimestamp(fetched_at, MARKET_TIMEZONE)
+    quarter_start = fetched.replace(month=3 * ((fetched.month - 1) // 3) + 1, day=1, hour=0, minute=0, second=0,
+                                    microsecond=0)
+    if fetched - quarter_start < timedelta(days=REPORTING_SEASON_DAYS):
+        return (fetched.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)).timestamp()
+    if quarter_start.month == 10:
+        return quarter_start.replace(year=quarter_start.year + 1, month=1).timestamp()
+    return quarter_start.replace(month=quarter_start.month + 3).timestamp()
+
+
+# How long each dataset stays fresh, a function from the fetch time to the expiry time
+DATASET_TTLS = {
+    "price_history": end_of_trading_day,
+    "financial_statement": end_of_reporting_period,
+}
+
+
+class MarketDataCache:
+    """
+    Cache of the DataFrames fetched from Vnstock, in memory and in a local SQLite file shared by every session.
+
+    Every dataset has its own freshness rule (DATASET_TTLS): prices are fresh until the market close, statements
+    until the next reporting season. An expired entry is refetched; when the source fails, or returns nothing, the
+    expired copy is returned instead, so a question can still be answered while the source is down.
+    """
+
+    def __init__(self, path=MARKET_DATA_CACHE_PATH, ttls=None):
+        self.path = path
+        self.ttls = dict(DATASET_TTLS, **(ttls or {}))
+        self._memory = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stale": 0, "errors": 0}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # One connection shared by the threads of the app, every access holds the lock
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("""CREATE TABLE IF NOT EXISTS market_data (
+                dataset TEXT NOT NULL, key TEXT NOT NULL, fetched_at REAL NOT NULL, expires_at REAL NOT NULL,
+                frame BLOB NOT NULL, PRIMARY KEY (dataset, key))""")
+
+    # Function to read an entry, from memory first, as (fetched_at, expires_at, frame) or None
+    def _read(self, dataset, key):
+        with self._lock:
+            entry = self._memory.get((dataset, key))
+            if entry is None:
+                row = self._connection.execute(
+                    "SELECT fetched_at, expires_at, frame FROM market_data WHERE dataset = ? AND key = ?",
+                    (dataset, key)).fetchone()
+                if row is None:
+                    return None
+                # The store only holds frames this cache pickled itself
+                entry = (row[0], row[1], pickle.loads(row[2]))
+                self._memory[(dataset, key)] = entry
+            return entry
+
+    # Function to store an entry in memory and on disk
+    def _write(self, dataset, key, frame, fetched_at):
+        expires_at = self.ttls[dataset](fetched_at)
+        with self._lock:
+            self._memory[(dataset, key)] = (fetched_at, expires_at, frame)
+            with self._connection:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO market_data (dataset, key, fetched_at, expires_at, frame) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (dataset, key, fetched_at, expires_at, pickle.dumps(frame, protocol=pickle.HIGHEST_PROTOCOL)))
+
+    # Function to count a cache outcome
+    def _count(self, outcome):
+        with self._lock:
+            self._stats[outcome] += 1
+
+    # Function to get a dataset from the cache, fetching it when it is missing or expired
+    def get(self, dataset, key, fetch):
+        if dataset not in self.ttls:
+            raise KeyError(f"No freshness rule for dataset {dataset}, add it to DATASET_TTLS")
+        entry = self._read(dataset, key)
+        now = time.time()
+        if entry is not None and now < entry[1]:
+            self._count("hits")
+            return entry[2].copy()
+        try:
+            frame = fetch()
+        except Exception:
+            if entry is None:
+                self._count("errors")
+                raise
+            print(f"Error refreshing {dataset} {key}, using the copy from "
+                  f"{datetime.fromtimestamp(entry[0], MARKET_TIMEZONE):%Y-%m-%d %H:%M}")
+            self._count("stale")
+            return entry[2].copy()
+        # An empty frame is how the sources report most failures, it never replaces data
+        if isinstance(frame, pd.DataFrame) and frame.empty:
+            if entry is not None:
+                self._count("stale")
+                return entry[2].copy()
+            self._count("misses")
+            return frame
+        self._count("misses")
+        self._write(dataset, key, frame, now)
+        return frame.copy()
+
+    # Function to get the hit, miss, stale and error counts of this process
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    # Function to remove the entries of a dataset, or every entry
+    def clear(self, dataset=None):
+        with self._lock:
+            if dataset is None:
+                self._memory.clear()
+                with self._connection:
+                    self._connection.execute("DELETE FROM market_data")
+            else:
+                self._memory = {key: entry for key, entry in self._memory.items() if key[0] != dataset}
+                with self._connection:
+                    self._connection.execute("DELETE FROM market_data WHERE dataset = ?", (dataset,))
+
+
+market_data_cache = MarketDataCache()
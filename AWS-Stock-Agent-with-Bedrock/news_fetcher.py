@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from lxml import html
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from concurrent_fetch import FETCH_WORKERS, fetch_concurrently, format_timings
+
+# The news site searched, overridable to point the scraper at a local fixture server
+NEWS_BASE_URL = os.environ.get("NEWS_BASE_URL", "https://cafef.vn")
+# Seconds to connect and to wait for the response of a news request
+NEWS_CONNECT_TIMEOUT = float(os.environ.get("NEWS_CONNECT_TIMEOUT", "3"))
+NEWS_READ_TIMEOUT = float(os.environ.get("NEWS_READ_TIMEOUT", "10"))
+# Seconds a parsed article stays cached, articles rarely change once published
+ARTICLE_CACHE_TTL = float(os.environ.get("ARTICLE_CACHE_TTL", "21600"))
+ARTICLE_CACHE_SIZE = int(os.environ.get("ARTICLE_CACHE_SIZE", "512"))
+# The number of articles read for a question
+NEWS_ARTICLES = 5
+# The site pages are UTF-8, lxml would guess Latin-1 for a page without a charset
+NEWS_ENCODING = "utf-8"
+
+# A class matching XPath condition, "item" must not match "item-list"
+CLASS_CONDITION = "contains(concat(' ', normalize-space(@class), ' '), ' {} ')"
+
+
+# Function to create the HTTP session shared by the news requests, its connections are reused between requests
+def create_session(pool_size=FETCH_WORKERS):
+    session = requests.Session()
+    # A refused or reset connection is retried once, a slow response is not, the read timeout bounds it
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=Retry(total=1, read=False))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"User-Agent": "Mozilla/5.0 (compatible; StockAgent/1.0)"})
+    return session
+
+
+_session = create_session()
+
+
+class ArticleCache:
+    """
+    Parsed article contents by URL, each kept for ttl seconds, the least recently used dropped past max_entries.
+    """
+
+    def __init__(self, ttl=ARTICLE_CACHE_TTL, max_entries=ARTICLE_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Function to get a cached article content, None when it is missing or expired
+    def get(self, url):
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                return None
+            if time.monotonic() >= entry[0]:
+                del self._entries[url]
+                return None
+            self._entries.move_to_end(url)
+            return entry[1]
+
+    # Function to cache an article content
+    def set(self, url, content):
+        with self._lock:
+            self._entries[url] = (time.monotonic() + self.ttl, content)
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    # Function to remove every article
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+article_cache = ArticleCache()
+
+
+# Function to get a page and parse it with lxml
+def get_page(url, params=None, session=None):
+    response = (session or _session).get(url, params=params, timeout=(NEWS_CONNECT_TIMEOUT, NEWS_READ_TIMEOUT))
+    response.raise_for_status()  # Ensure the request was successful
+    return html.fromstring(response.content, parser=html.HTMLParser(encoding=NEWS_ENCODING))
+
+
+# Function to search the news site and return the latest articles, as dicts with a link and a summary
+def fetch_news(query, base_url=NEWS_BASE_URL, session=None):
+    page = get_page(f"{base_url}/tim-kiem.chn", params={'keywords': query}, session=session)
+    # The items of the news container
+    items = page.xpath(f"//div[{CLASS_CONDITION.format('list-section')} and {CLASS_CONDITION.format('list-event')}]"
+                       f"//div[{CLASS_CONDITION.format('item')}]")
+    articles = []
+    for item in items:
+        title_links = item.xpath(f".//h3[{CLASS_CONDITION.format('titlehidden')}]//a[@href]")
+        if not title_links:
+            continue
+        summaries = item.xpath(f".//p[{CLASS_CONDITION.format('sapo')}]")
+        summary = summaries[0].text_content().strip() if summaries else 'No summary available'
+        articles.append({'link': base_url + title_links[0].get('href'), 'summary': summary})
+        if len(articles) == NEWS_ARTICLES:
+            break
+    return articles
+
+
+# Function to fetch the main content of an article, cached by URL
+def fetch_article_content(url, session=None):
+    content = article_cache.get(url)
+    if content is not None:
+        return content
+    page = get_page(url, session=session)
+    # The specific container holding the main content
+    containers = page.xpath(f"//div[{CLASS_CONDITION.format('detail-content')} and "
+                            f"{CLASS_CONDITION.format('afcbc-body')}]")
+    if not containers:
+        # Not cached, the page may be served without its content once
+        return "Content not found"
+    content = "\n".join(paragraph.text_content().strip() for paragraph in containers[0].iter("p"))
+    article_cache.set(url, content)
+    return content
+
+
+# Function to fetch the latest news about a query with the content of every article, the articles at the same time
+def fetch_news_with_content(query, base_url=NEWS_BASE_URL, session=None):
+    articles = fetch_news(query, base_url, session)
+    contents, timings = fetch_concurrently(
+        {f"article {number}": (lambda link=article['link']: fetch_article_content(link, session))
+         for number, article in enumerate(articles, 1)},
+        default=lambda: "Content not available", timeout=NEWS_CONNECT_TIMEOUT + NEWS_READ_TIMEOUT)
+    print(f"fetch news for {query}: {format_timings(timings)}")
+    return [{'summary': article['summary'], 'content': contents[f"article {number}"]}
+            for number, article in enumerate(articles, 1)]
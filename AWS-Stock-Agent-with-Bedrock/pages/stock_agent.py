@@ -9,12 +9,16 @@ from datetime import datetime, timedelta
 import pandas as pd
 import os
 from vnstock3 import Vnstock
-from bs4 import BeautifulSoup
 import re
-import requests
+import threading
 from langchain.agents import initialize_agent, Tool
 from langchain.callbacks import StreamlitCallbackHandler
 import base
+from ticker_resolver import TickerResolver, build_fallback_prompt
+from market_data_cache import market_data_cache
+from concurrent_fetch import fetch_concurrently, format_timings
+from news_fetcher import fetch_news_with_content
+from tool_digest import digest_financial_data, digest_price_history, format_raw_frame, raw_frame_names
 
 # Setting page title and header
 
@@ -97,74 +101,22 @@ def invoke_bedrock_model(prompt,max_tokens=2000):
     response_body = json.loads(response['body'].read().decode())
     return response_body['content'][0]['text']
 
+# Load the company list into the ticker resolver once per process, Streamlit re-runs this page on every message
+@st.cache_resource(show_spinner=False)
+def get_ticker_resolver():
+    return TickerResolver.from_csv('data-02.csv', 'ticker_aliases.csv')
+
 def get_stock_ticker(question):
-    # load company name & company tiker
-    with open('data-02.csv', 'r') as file:
-        company_data = file.read()        
-
-    prompt = f"""You are an AI assistant designed to extract company ticker symbols and company names from user input. 
-            You have access to a comprehensive list of Vietnamese company tickers and their corresponding company names.
-            Instructions:
-            1. Carefully analyze the user's input.
-            2. Identify any mentions of company names or ticker symbols.
-            3. Cross-reference the identified information with your list of company tickers and names.
-            4. If a match is found, extract the company ticker and full company name.
-            5. If multiple companies are mentioned, focus on the most prominent or relevant one.
-            6. If no clear match is found, use your best judgment to infer the company based on context.
-            7. Format your response as a JSON object with the following keys:
-                - company_ticker: The ticker symbol of the identified company (in uppercase)
-                - company_name: The full name of the identified company
-            Rules:
-            - Always provide a response, even if you're not 100% certain.
-            - If you cannot identify a company, use "UNKNOWN" for both the ticker and name.
-            - Ensure the company_ticker is in uppercase letters.
-            - Provide the full, official company name for company_name.
-
-            Example user inputs and expected outputs:
-
-            Input: "Đánh gía cổ phiếu HPG?"
-            Output:
-            {{
-            "company_ticker": "HPG",
-            "company_name": "Công ty Cổ phần Tập đoàn Hòa Phát"
-            }}
-
-            Input: "Định giá cổ phiếu ngân hàng sài gòn thương tín"
-            Output:
-            {{
-            "company_ticker": "STB",
-            "company_name": "Ngân hàng Thương mại Cổ phần Sài Gòn Thương Tín"
-            }}
-
-            Input: "Phân tích tình hình tài chính công ty đầu tư xây dựng Kiên Giang"
-            Output:
-            {{
-            "company_ticker": "CKG",
-            "company_name": "Công ty Cổ phần Tập đoàn Tư vấn Đầu tư Xây dựng Kiên Giang"
-            }}
-
-            Input: "Đánh giá thị trường hiện tại?"
-            Output:
-            {{
-            "company_ticker": "UNKNOWN",
-            "company_name": "UNKNOWN"
-            }}
-
-            Remember to always format your response as a JSON object with the specified keys, regardless of the input or your level of certainty.
-            Additional Guidelines:
-            - Focus only on Vietnamese companies in the provided list
-            - Use the exact company name and ticker from the list - do not modify or paraphrase them
-            <context>
-            Vietnamese company list: {json.dumps(company_data)}
-            </context>
-
-            Input: {question}
-
-            Output: JSON array of objects with keys 'company_name' and 'company_ticker'.
-            Respond only with the JSON array. Do not include any explanations or additional text.
-        """
-    initial_response = invoke_bedrock_model(prompt)
-    company_name, company_ticker = parse_response(initial_response)    
+    # Resolve the ticker locally: exact tickers, aliases, then the company names
+    resolution = get_ticker_resolver().resolve(question)
+    company_name, company_ticker = resolution.name, resolution.ticker
+
+    # Only ask the model when several companies match the question about as well, with just those candidates
+    if resolution.method == "ambiguous":
+        initial_response = invoke_bedrock_model(build_fallback_prompt(question, resolution.candidates))
+        company_name, company_ticker = parse_response(initial_response)
+        if company_ticker not in {ticker for ticker, _, _ in resolution.candidates}:
+            company_name, company_ticker = "UNKNOWN", "UNKNOWN"
 
     with open("company.json", 'w') as file:
         file.write(str(json.dumps({'company_name': company_name, 'company_ticker': company_ticker})))
@@ -175,43 +127,81 @@ def get_stock_ticker(question):
 def get_stock_price(ticker, history=1000):
     with open("company.json", 'a') as file:
         file.write(f'\nget stock price for ticker: {ticker}')
-    today = date.today()
-    start_date = today - timedelta(days=history)
-    stock = Vnstock().stock(symbol=ticker.strip(), source='TCBS')
-    data = stock.quote.history(start=start_date.strftime('%Y-%m-%d'),end=today.strftime('%Y-%m-%d'))
-    return data
-
-# Function to safely get data and handle exceptions
-def safe_get_data(func, *args, **kwargs):
-    try:
-        return func(*args, **kwargs)
-    except Exception as e:
-        print(f"Error getting data: {e}")
-        return pd.DataFrame()
+    ticker = ticker.strip()
+
+    def fetch_history():
+        today = date.today()
+        start_date = today - timedelta(days=history)
+        stock = Vnstock().stock(symbol=ticker, source='TCBS')
+        return stock.quote.history(start=start_date.strftime('%Y-%m-%d'),end=today.strftime('%Y-%m-%d'))
+
+    # Prices are cached until the market close, repeat questions about a ticker do not reach TCBS
+    return market_data_cache.get("price_history", f"{ticker}:{history}", fetch_history)
 
 # Function to get financial data
 def get_financial_data(ticker):
-    # Create a stock object for financial data
     ticker = ticker.strip().upper()
-    stock_finance = Vnstock().stock(symbol=ticker, source='VCI')
-    
-    # Create a dictionary to store all dataframes
-    company_data = {
-        'Balance Sheet Yearly': safe_get_data(stock_finance.finance.balance_sheet, period='year', lang='en'),
-        'Balance Sheet Quarterly': safe_get_data(stock_finance.finance.balance_sheet, period='quarter', lang='en'),
-        'Income Statement Yearly': safe_get_data(stock_finance.finance.income_statement, period='year', lang='en'),
-        'Income Statement Quarterly': safe_get_data(stock_finance.finance.income_statement, period='quarter', lang='en'),
-        'Cash Flow Yearly': safe_get_data(stock_finance.finance.cash_flow, period='year', lang='en'),
-        'Cash Flow Quarterly': safe_get_data(stock_finance.finance.cash_flow, period='quarter', lang='en'),
-        'Financial Ratios Yearly': safe_get_data(stock_finance.finance.ratio, period='year', lang='en'),
-        'Financial Ratios Quarterly': safe_get_data(stock_finance.finance.ratio, period='quarter', lang='en'),
-    }
+    stock_finance = None
+    stock_lock = threading.Lock()
+
+    # Create the stock object for financial data only if a statement has to be fetched, once for all the threads
+    def get_stock_finance():
+        nonlocal stock_finance
+        with stock_lock:
+            if stock_finance is None:
+                stock_finance = Vnstock().stock(symbol=ticker, source='VCI')
+            return stock_finance
+
+    # Statements are cached until the next reporting season, refetched on a miss
+    def get_statement(report, period):
+        return market_data_cache.get(
+            "financial_statement", f"{ticker}:{report}:{period}",
+            lambda: getattr(get_stock_finance().finance, report)(period=period, lang='en'))
+
+    # The eight statements are independent requests, fetch them at the same time: the tool takes as long as the
+    # slowest one instead of the sum. A statement that fails or times out is left empty
+    company_data, timings = fetch_concurrently({
+        'Balance Sheet Yearly': lambda: get_statement('balance_sheet', 'year'),
+        'Balance Sheet Quarterly': lambda: get_statement('balance_sheet', 'quarter'),
+        'Income Statement Yearly': lambda: get_statement('income_statement', 'year'),
+        'Income Statement Quarterly': lambda: get_statement('income_statement', 'quarter'),
+        'Cash Flow Yearly': lambda: get_statement('cash_flow', 'year'),
+        'Cash Flow Quarterly': lambda: get_statement('cash_flow', 'quarter'),
+        'Financial Ratios Yearly': lambda: get_statement('ratio', 'year'),
+        'Financial Ratios Quarterly': lambda: get_statement('ratio', 'quarter'),
+    }, default=pd.DataFrame)
+    print(f"get financial data for ticker {ticker}: {format_timings(timings)}")
     return company_data
 
+# The tools hand the agent a digest of the frames, every step of the agent re-reads the whole scratchpad
+def get_stock_data_digest(ticker):
+    ticker = ticker.strip().upper()
+    return digest_price_history(ticker, get_stock_price(ticker))
+
+def get_financial_data_digest(ticker):
+    ticker = ticker.strip().upper()
+    return digest_financial_data(ticker, get_financial_data(ticker))
+
+# Function to get the rows of a frame the digests left out, input "<TICKER> <dataset>" with an optional ", <rows>"
+def get_raw_data(request):
+    name, _, rows = request.strip().strip('"').partition(",")
+    name = " ".join(name.split())
+    rows = int(rows) if rows.strip().isdigit() else 20
+    ticker = name.split(" ")[0].upper() if name else ""
+    for kept in raw_frame_names(ticker):
+        if kept.lower() == name.lower():
+            return format_raw_frame(kept, rows)
+    available = raw_frame_names(ticker)
+    if not available:
+        return f"No data kept for {ticker}, use get stock data or get financial data first"
+    return f"Unknown dataset {name}, available: {', '.join(available)}"
+
 def get_financial_statements(ticker):
-    stock = Vnstock().stock(symbol=ticker.upper(), source='VCI')
-    data = stock.finance.balance_sheet(period='year', lang='en')
-    return data
+    ticker = ticker.upper()
+    # Shares the cached yearly balance sheet of get_financial_data
+    return market_data_cache.get(
+        "financial_statement", f"{ticker}:balance_sheet:year",
+        lambda: Vnstock().stock(symbol=ticker, source='VCI').finance.balance_sheet(period='year', lang='en'))
 
 # Script to scrap top5 googgle news for given company name
 def google_query(search_term):
@@ -225,52 +215,8 @@ def google_query(search_term):
 def get_recent_stock_news(ticker):
     # get company name from ticker
     ticker = ticker.strip().upper()
-    articles = fetch_news(ticker)
-    content = []
-    for article in articles:
-        content.append({'summary': article['summary'], 'content':fetch_article_content(article['link'])})
-    return content
-
-#search for news and scrap 5 recent news
-def fetch_news(query):
-    base_url = "https://cafef.vn/tim-kiem.chn"
-    # Configure the request parameters
-    params = {'keywords': query}
-    # Make the request
-    response = requests.get(base_url, params=params)
-    response.raise_for_status()  # Ensure the request was successful
-    # Parse the HTML content
-    soup = BeautifulSoup(response.text, 'html.parser')
-    # Find the container with the news items
-    news_container = soup.find('div', class_='list-section list-event')
-    news_items = news_container.find_all('div', class_='item')
-    # List to hold news data
-    articles = []
-    # Loop through each news item
-    for item in news_items:
-        title_element = item.find('h3', class_='titlehidden').find('a')
-        title = title_element.text.strip()
-        link = 'https://cafef.vn' + title_element['href']
-        summary = item.find('p', class_='sapo').text.strip() if item.find('p', class_='sapo') else 'No summary available'
-        # Append news info to the list
-        articles.append({'link': link, 'summary': summary})
-    return articles[:5]
-
-# fetch article content from link
-def fetch_article_content(url):
-    # Send a GET request to the URL
-    response = requests.get(url)
-    response.raise_for_status()  # Ensure the request was successful
-    # Parse the HTML content
-    soup = BeautifulSoup(response.text, 'html.parser')
-    # Find the specific container holding the main content
-    content_div = soup.find('div', class_='detail-content afcbc-body')
-    if not content_div:
-        return "Content not found"
-    # Extract all paragraph texts within the container
-    paragraphs = content_div.find_all('p')
-    main_content = "\n".join(p.text.strip() for p in paragraphs)
-    return main_content
+    # Search for the 5 recent news, then read the articles at the same time, the contents are cached by URL
+    return fetch_news_with_content(ticker)
 
 def initializeAgent():
     
@@ -315,6 +261,7 @@ def initializeAgent():
         - get stock data: Retrieve stock information
         - get recent stock news: Fetch recent stock news
         - get financial data: Obtain company financial data
+        - get raw data: Read the rows of a dataset the other tools summarized
 
         Analysis Steps:
         1. Use "get company ticker" to identify company and ticker. Once you have this information, immediately proceed to step 2.
@@ -322,12 +269,13 @@ def initializeAgent():
         3. Use "get recent stock news" with the exact ticker from step 1. After obtaining news, proceed to step 4.
         4. Use "get financial data" with the exact ticker from step 1. 
         5. After completing steps 1-4, analyze all collected information to answer the user's query.
+        The stock and financial data are summaries; use "get raw data" only if the analysis needs rows they left out.
 
         IMPORTANT: Follow this exact format for your response, ensuring you progress through all steps:
 
         Question: [User's input question]
         Thought: [Your reasoning about the current step, including what you've learned so far and what you need to do next]
-        Action: action to take, should be one of [get company ticker, get stock data, get recent stock news, get financial data]
+        Action: action to take, should be one of [get company ticker, get stock data, get recent stock news, get financial data, get raw data]
         Action Input: [Input for the chosen action]
         Observation: [Result of the action]
         Thought: [Analyze the result and determine the next step. If you have completed a step, explicitly state that you're moving to the next one.]
@@ -360,8 +308,8 @@ tools = [
     ),
     Tool(
         name="get stock data",
-        func=get_stock_price,
-        description="Retrieve historical share price data for stock analysis. Input: EXACT company ticker. Output: historic share price data."
+        func=get_stock_data_digest,
+        description="Retrieve historical share price data for stock analysis. Input: EXACT company ticker. Output: a summary of the price history: returns, moving averages, 52-week range, volatility, volume and the last sessions."
     ),
     Tool(
         name="get recent stock news",
@@ -370,9 +318,9 @@ tools = [
     ),
     Tool(
         name="get financial data",
-        func=get_financial_data,
+        func=get_financial_data_digest,
         description="""Retrieve comprehensive financial data for a company. Input: EXACT company ticker. 
-                Output: A dictionary containing the following financial reports:
+                Output: A summary of the key metrics, with their YoY and QoQ changes and key ratios, of the following financial reports:
                 1. Balance Sheet (Yearly and Quarterly)
                 2. Income Statement (Yearly and Quarterly)
                 3. Cash Flow Statement (Yearly and Quarterly)
@@ -381,6 +329,13 @@ tools = [
                 Use this data to conduct in-depth financial analysis, assess the company's financial health, 
                 track performance trends, and evaluate key financial metrics over time.
         """
+    ),
+    Tool(
+        name="get raw data",
+        func=get_raw_data,
+        description="""Read the rows of a dataset summarized by get stock data or get financial data.
+                Input: EXACT company ticker and dataset name, optionally followed by a comma and the number of latest rows,
+                e.g. "HPG price history, 30" or "HPG Income Statement Quarterly". Output: the rows in CSV format."""
     )
 ]
 
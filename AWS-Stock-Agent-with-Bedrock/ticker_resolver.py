@@ -0,0 +1,262 @@
+import csv
+import math
+import re
+import unicodedata
+from collections import defaultdict, namedtuple
+
+# Abbreviations of Vietnamese company names, expanded so "Ngân hàng TMCP ..." matches "Ngân hàng Thương mại Cổ phần ..."
+ABBREVIATIONS = {
+    "tmcp": "thuong mai co phan",
+    "ctcp": "cong ty co phan",
+    "tct": "tong cong ty",
+    "nh": "ngan hang",
+    "tphcm": "thanh pho ho chi minh",
+    "tp": "thanh pho",
+    "hcm": "ho chi minh",
+}
+
+# The legal forms in the company names, left out of the matching since questions rarely spell them out
+LEGAL_FORM_PATTERN = re.compile(r"\b(tong cong ty co phan|cong ty co phan|cong ty tnhh|tong cong ty|cong ty cp|"
+                                r"thuong mai co phan|cong ty|co phan)\b")
+
+# A ticker written in the question, e.g. "HPG", "A32" or "hpg", not part of a longer word
+TICKER_PATTERN = re.compile(r"(?<!\w)[A-Za-z][A-Za-z0-9]{2}(?!\w)")
+# Acronyms that are also listed tickers but are rarely meant as one, e.g. "CEO của HPG", "tỷ giá USD". Like a ticker
+# not written in capitals ("lai", "tin", "dat" are words without their diacritics), they are only offered to the
+# model as candidates when nothing else in the question resolves
+TICKER_STOPLIST = {"API", "BIG", "CAN", "CEO", "CPI", "ETF", "EUR", "FDI", "GDP", "IPO", "NAV", "SJC", "TOP", "USD",
+                   "VND", "VNI"}
+
+# A company is resolved from its name when it scores at least MIN_SCORE and MIN_MARGIN more than the next one
+MIN_SCORE = 0.6
+MIN_MARGIN = 0.15
+# Below this score a company is not even a candidate, the question is about no company in particular
+MIN_CANDIDATE_SCORE = 0.35
+# The number of corrected question words remembered, questions reuse the same few words
+CORRECTION_CACHE_SIZE = 4096
+# A question word that is in no company name is read as the closest name word at least this similar (trigram Dice)
+MIN_WORD_SIMILARITY = 0.5
+
+# The result of resolving a question:
+# - ticker, name: the company found, "UNKNOWN" when the question is ambiguous or about no company
+# - score: how much of the company name is in the question, 1.0 for a ticker or an alias
+# - method: "ticker", "alias", "name", "ambiguous" or "none"
+# - candidates: the best (ticker, name, score) matches, for the LLM to choose from when the question is ambiguous:
+#   several tickers, a ticker not in capitals or an acronym, or several names scoring about the same
+Resolution = namedtuple("Resolution", ["ticker", "name", "score", "method", "candidates"])
+
+
+# Function to fold a text for matching: lowercase, without Vietnamese diacritics or punctuation, abbreviations expanded
+def normalize(text):
+    text = text.lower().replace("đ", "d")
+    text = "".join(char for char in unicodedata.normalize("NFD", text) if unicodedata.category(char) != "Mn")
+    words = re.sub(r"[^a-z0-9]+", " ", text).split()
+    return " ".join(ABBREVIATIONS.get(word, word) for word in words)
+
+
+# Function to get the trigrams of a word, padded so its start and end count
+def trigrams(word):
+    padded = f" {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# Function to get the words and word bigrams of a normalized text, the n-grams a name is matched on
+def ngrams(words):
+    return set(words) | {f"{first} {second}" for first, second in zip(words, words[1:])}
+
+
+class TickerResolver:
+    """
+    Maps a question to the ticker of the Vietnamese company it is about, without calling a model.
+
+    Tickers written in the question are looked up exactly, then the aliases (e.g. "Vietcombank"), then the company
+    names. Names and questions are compared without diacritics, on their words and word bigrams, weighted by how rare
+    they are across the company names, so what every name shares ("Công ty Cổ phần") counts for little. A question
+    word that is in no name, e.g. a typo, is matched to the closest name word through a trigram index. When the best
+    names score too close to each other the question is ambiguous, and the candidates are returned for a model to
+    choose from.
+    """
+
+    def __init__(self, companies, aliases=None, min_score=MIN_SCORE, min_margin=MIN_MARGIN,
+                 min_candidate_score=MIN_CANDIDATE_SCORE):
+        self.names = {}
+        self.aliases = {}
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.min_candidate_score = min_candidate_score
+        company_ngrams = {}
+        for ticker, name in companies:
+            ticker = ticker.strip().upper()
+            self.names[ticker] = name.strip()
+            company_ngrams[ticker] = ngrams(self.name_words(name))
+        # Inverted index from n-gram to the companies whose name has it, weighted by inverse document frequency
+        self._index = defaultdict(list)
+        for ticker, grams in company_ngrams.items():
+            for gram in grams:
+                self._index[gram].append(ticker)
+        self._idf = {gram: math.log(len(company_ngrams) / len(tickers)) for gram, tickers in self._index.items()}
+        self._weights = {ticker: sum(self._idf[gram] for gram in grams) for ticker, grams in company_ngrams.items()}
+        # Trigram index of the name words, to correct the question words that are in no name
+        self._word_index = defaultdict(list)
+        self._word_trigram_counts = {}
+        for word in {gram for gram in self._index if " " not in gram}:
+            word_trigrams = trigrams(word)
+            self._word_trigram_counts[word] = len(word_trigrams)
+            for gram in word_trigrams:
+                self._word_index[gram].append(word)
+        self._corrections = {}
+        for alias, ticker in (aliases or {}).items():
+            self.add_alias(alias, ticker)
+
+    # Function to get the words a company name is matched on, without its legal form
+    @staticmethod
+    def name_words(name):
+        normalized = normalize(name)
+        # A name that is only a legal form keeps it, e.g. "Công ty Cổ phần 32" keeps "32"
+        return LEGAL_FORM_PATTERN.sub(" ", normalized).split() or normalized.split()
+
+    # Function to load the companies, and optionally the aliases, from CSV files
+    @classmethod
+    def from_csv(cls, company_path, alias_path=None, **kwargs):
+        with open(company_path, newline="", encoding="utf-8") as file:
+            companies = [(row["company_ticker"], row["company_name"]) for row in csv.DictReader(file)]
+        aliases = {}
+        if alias_path:
+            with open(alias_path, newline="", encoding="utf-8") as file:
+                aliases = {row["alias"]: row["company_ticker"] for row in csv.DictReader(file)}
+        return cls(companies, aliases, **kwargs)
+
+    # Function to add another name a company is known by, e.g. its brand
+    def add_alias(self, alias, ticker):
+        ticker = ticker.strip().upper()
+        if ticker not in self.names:
+            raise KeyError(f"Unknown ticker {ticker} for alias {alias}")
+        self.aliases[normalize(alias)] = ticker
+
+    # Function to find the tickers written in the question, in order
+    # Returns the tickers written in capitals, and the tickers written otherwise or in TICKER_STOPLIST
+    def find_tickers(self, question):
+        tickers = []
+        uncertain = []
+        for word in TICKER_PATTERN.findall(question):
+            ticker = word.upper()
+            if ticker not in self.names or ticker in tickers or ticker in uncertain:
+                continue
+            if word == ticker and ticker not in TICKER_STOPLIST:
+                tickers.append(ticker)
+            else:
+                uncertain.append(ticker)
+        return tickers, [ticker for ticker in uncertain if ticker not in tickers]
+
+    # Function to list tickers as candidates for the model, they match exactly
+    def ticker_candidates(self, tickers):
+        return [(ticker, self.names[ticker], 1.0) for ticker in tickers]
+
+    # Function to find the longest alias in the question
+    def find_alias(self, normalized_question):
+        padded = f" {normalized_question} "
+        matches = [alias for alias in self.aliases if f" {alias} " in padded]
+        return max(matches, key=len) if matches else None
+
+    # Function to find the name word closest to a word that is in no name, by trigram similarity
+    def closest_word(self, word, min_similarity=MIN_WORD_SIMILARITY):
+        if len(word) < 4:
+            return None
+        key = (word, min_similarity)
+        if key in self._corrections:
+            return self._corrections[key]
+        word_trigrams = trigrams(word)
+        shared = defaultdict(int)
+        for gram in word_trigrams:
+            for candidate in self._word_index.get(gram, ()):
+                shared[candidate] += 1
+        best, best_similarity = None, min_similarity
+        for candidate, count in shared.items():
+            # Dice coefficient of the trigram sets
+            similarity = 2 * count / (len(word_trigrams) + self._word_trigram_counts[candidate])
+            if similarity >= best_similarity:
+                best, best_similarity = candidate, similarity
+        if len(self._corrections) >= CORRECTION_CACHE_SIZE:
+            self._corrections.clear()
+        self._corrections[key] = best
+        return best
+
+    # Function to score the company names against the question, best first
+    def candidates(self, question, limit=5):
+        words = [word if word in self._index else self.closest_word(word) or word
+                 for word in normalize(question).split()]
+        matched = defaultdict(float)
+        for gram in ngrams(words):
+            for ticker in self._index.get(gram, ()):
+                matched[ticker] += self._idf[gram]
+        if not matched:
+            return []
+        # How much of the company name is in the question, scaled down when another name explains more of the
+        # question, so "Vang Thăng Long" prefers "Công ty Cổ phần Vang Thăng Long" to "Tổng Công ty Thăng Long"
+        most_matched = max(matched.values())
+        ranked = sorted(((ticker, weight / self._weights[ticker] * math.sqrt(weight / most_matched))
+                         for ticker, weight in matched.items()), key=lambda item: item[1], reverse=True)[:limit]
+        return [(ticker, self.names[ticker], round(score, 3)) for ticker, score in ranked]
+
+    # Function to find the company whose name the question quotes, None when no name scores clearly above the others
+    def match_name(self, candidates):
+        if not candidates:
+            return None
+        runner_up = candidates[1][2] if len(candidates) > 1 else 0.0
+        if candidates[0][2] >= self.min_score and candidates[0][2] - runner_up >= self.min_margin:
+            return candidates[0]
+        return None
+
+    # Function to resolve the company a question is about
+    def resolve(self, question):
+        normalized_question = normalize(question)
+        tickers, uncertain_tickers = self.find_tickers(question)
+        # Several tickers, e.g. a comparison: the model chooses the company the question is about
+        if len(tickers) > 1:
+            return Resolution("UNKNOWN", "UNKNOWN", 1.0, "ambiguous", self.ticker_candidates(tickers))
+        alias = None if tickers else self.find_alias(normalized_question)
+        if tickers or alias:
+            ticker, method = (tickers[0], "ticker") if tickers else (self.aliases[alias], "alias")
+            quoted = tickers[0].lower() if tickers else alias
+            # A ticker or alias can be a word of another company's name, e.g. "DHC" in "DHC Suối Đôi": when the
+            # question quotes such a name, the name wins. Only scored when some name has the word, it rarely does
+            if quoted.split()[0] in self._index:
+                candidates = self.candidates(question)
+                named = self.match_name(candidates)
+                name_words = self.name_words(named[1]) if named else []
+                if (named and named[0] != ticker and len(name_words) > len(quoted.split())
+                        and f" {quoted} " in f" {' '.join(name_words)} "):
+                    return Resolution(named[0], named[1], named[2], "name", candidates)
+            return Resolution(ticker, self.names[ticker], 1.0, method, [])
+        candidates = [candidate for candidate in self.candidates(question)
+                      if candidate[2] >= self.min_candidate_score]
+        named = self.match_name(candidates)
+        if named:
+            return Resolution(named[0], named[1], named[2], "name", candidates)
+        # A ticker not in capitals or an acronym, e.g. "phân tích hpg": the model decides whether it is meant
+        candidates = self.ticker_candidates(uncertain_tickers) + [
+            candidate for candidate in candidates if candidate[0] not in uncertain_tickers]
+        if not candidates:
+            return Resolution("UNKNOWN", "UNKNOWN", 0.0, "none", [])
+        return Resolution("UNKNOWN", "UNKNOWN", candidates[0][2], "ambiguous", candidates)
+
+
+# Function to build the prompt asking a model to choose between the candidates of an ambiguous question
+def build_fallback_prompt(question, candidates):
+    candidate_list = "\n".join(f"{ticker},{name}" for ticker, name, _ in candidates)
+    return f"""You are an AI assistant designed to extract company ticker symbols and company names from user input.
+            The user's input may be about one of the Vietnamese companies below, or about none of them.
+            Instructions:
+            1. Identify which company of the list the input is about.
+            2. If the input is about none of them, use "UNKNOWN" for both the ticker and name.
+            3. Use the exact company name and ticker from the list - do not modify or paraphrase them.
+            <context>
+            company_ticker,company_name
+            {candidate_list}
+            </context>
+
+            Input: {question}
+
+            Output: JSON array of objects with keys 'company_name' and 'company_ticker'.
+            Respond only with the JSON array. Do not include any explanations or additional text.
+        """
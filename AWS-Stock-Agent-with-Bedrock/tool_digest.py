@@ -0,0 +1,312 @@
+import math
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Token budgets of the digests the agent sees instead of the raw DataFrames
+PRICE_DIGEST_TOKENS = int(os.environ.get("PRICE_DIGEST_TOKENS", "600"))
+FINANCIAL_DIGEST_TOKENS = int(os.environ.get("FINANCIAL_DIGEST_TOKENS", "1500"))
+# Rough characters per token of the digests, mostly numbers and short English labels, erring on the short side
+CHARS_PER_TOKEN = 3
+# The most rows of a raw frame the "get raw data" tool returns at once
+RAW_DATA_MAX_ROWS = int(os.environ.get("RAW_DATA_MAX_ROWS", "60"))
+# The raw frames kept for the "get raw data" tool, the least recently digested are dropped first
+RAW_FRAMES_KEPT = int(os.environ.get("RAW_FRAMES_KEPT", "64"))
+
+# Sessions in a week, a month... on the Vietnamese exchanges, for the returns over those horizons
+RETURN_HORIZONS = {"1W": 5, "1M": 21, "3M": 63, "6M": 126, "1Y": 252}
+MOVING_AVERAGES = (20, 50, 200)
+SESSIONS_PER_YEAR = 252
+# Periods of every statement metric shown in the digest, the latest first
+STATEMENT_PERIODS = {"year": 3, "quarter": 4}
+
+# The metrics of each statement shown in the digest, found by the first column whose name matches
+KEY_METRICS = {
+    "Income Statement": {
+        "Revenue": r"^(net )?revenue|^net sales",
+        "Gross profit": r"^gross profit",
+        "Operating profit": r"^operating profit",
+        "Net profit": r"attribut\w* to parent|^net profit",
+    },
+    "Balance Sheet": {
+        "Total assets": r"^total assets",
+        "Liabilities": r"^(total )?liabilities",
+        "Equity": r"^owner'?s equity|^total equity",
+        "Cash": r"^cash and cash equivalents",
+        "Inventories": r"^(net )?inventories",
+    },
+    "Cash Flow": {
+        "Operating cash flow": r"from operating activities",
+        "Investing cash flow": r"from investing activities",
+        "Financing cash flow": r"from financ\w* activities",
+    },
+    "Financial Ratios": {
+        "P/E": r"^p/e",
+        "P/B": r"^p/b",
+        "EPS": r"^eps",
+        "ROE": r"^roe",
+        "ROA": r"^roa",
+        "Net margin": r"^net profit margin",
+        "Debt/Equity": r"^debt/equity|borrowings\)/equity",
+        "Current ratio": r"^current ratio",
+    },
+}
+# Statements without a key metric found show their first numeric columns instead
+FALLBACK_METRICS = 4
+# The columns holding the period of a statement, in the English and Vietnamese layouts of the sources
+YEAR_COLUMNS = ("yearReport", "year", "Năm")
+QUARTER_COLUMNS = ("lengthReport", "quarter", "Kỳ")
+LABEL_COLUMNS = ("ticker", "CP")
+
+_raw_frames = OrderedDict()
+_raw_frames_lock = threading.Lock()
+
+
+# Function to estimate the tokens of a text from its length
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+# Function to keep the lines of a digest that fit the token budget
+# lines: (priority, text) in display order, priority 0 lines are always kept, then the lowest priorities first
+# until the budget is spent
+# Returns the kept lines in display order, with a note of how many were left out
+def fit_to_budget(lines, max_tokens, omitted_note):
+    budget = max_tokens * CHARS_PER_TOKEN
+    kept = set()
+    used = 0
+    full = False
+    for position, (priority, text) in sorted(enumerate(lines), key=lambda item: item[1][0]):
+        # Once a line does not fit, the lower priorities are left out too, a metric is never shown without its table
+        full = full or (priority > 0 and used + len(text) + 1 > budget)
+        if priority == 0 or not full:
+            kept.add(position)
+            used += len(text) + 1
+    text = "\n".join(line for position, (_, line) in enumerate(lines) if position in kept)
+    if len(kept) < len(lines):
+        text += f"\n({len(lines) - len(kept)} lines left out to fit the prompt, {omitted_note})"
+    return text
+
+
+# Function to format a number compactly: statement values in billions stay whole, raw VND values get a suffix
+def format_number(value):
+    if value is None or not np.isfinite(value):
+        return "n/a"
+    magnitude = abs(value)
+    for threshold, suffix in ((1e12, "T"), (1e9, "B"), (1e6, "M")):
+        if magnitude >= threshold:
+            return f"{value / threshold:.2f}{suffix}"
+    if magnitude >= 1000:
+        return f"{value:,.0f}"
+    return f"{value:,.2f}"
+
+
+# Function to format a change as a signed percentage
+def format_change(value):
+    return "n/a" if value is None or not np.isfinite(value) else f"{value:+.1%}"
+
+
+# Function to get the relative change from a base, measured against the size of the base so a loss shrinking reads
+# as an improvement
+def relative_change(current, base):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        change = (current - base) / np.abs(base)
+    return change.replace([np.inf, -np.inf], np.nan) if isinstance(change, pd.Series) else change
+
+
+# Function to remember the raw frame behind a digest, for the "get raw data" tool
+def keep_raw_frame(name, frame):
+    with _raw_frames_lock:
+        _raw_frames[name] = frame
+        _raw_frames.move_to_end(name)
+        while len(_raw_frames) > RAW_FRAMES_KEPT:
+            _raw_frames.popitem(last=False)
+
+
+# Function to get a raw frame kept by the digests, None when it was never digested or was dropped
+def get_raw_frame(name):
+    with _raw_frames_lock:
+        return _raw_frames.get(name)
+
+
+# Function to list the names of the raw frames kept for a ticker
+def raw_frame_names(ticker):
+    with _raw_frames_lock:
+        return [name for name in _raw_frames if name.startswith(f"{ticker} ")]
+
+
+# Function to format the last rows of a kept raw frame as CSV, for the "get raw data" tool
+def format_raw_frame(name, rows=RAW_DATA_MAX_ROWS):
+    frame = get_raw_frame(name)
+    if frame is None:
+        return None
+    rows = max(1, min(rows, RAW_DATA_MAX_ROWS))
+    header = f"{name}: last {min(rows, len(frame))} of {len(frame)} rows"
+    return f"{header}\n{flatten_columns(frame).tail(rows).to_csv(index=False)}"
+
+
+# Function to flatten the two-level columns of the ratio tables, e.g. ("Chỉ tiêu định giá", "P/E") to "P/E"
+def flatten_columns(frame):
+    if isinstance(frame.columns, pd.MultiIndex):
+        frame = frame.copy()
+        frame.columns = [column[-1] for column in frame.columns]
+    return frame.loc[:, ~frame.columns.duplicated()]
+
+
+# Function to digest a price history: returns, moving averages, range, volatility, volume and the last sessions
+def digest_price_history(ticker, frame, max_tokens=PRICE_DIGEST_TOKENS):
+    name = f"{ticker} price history"
+    if frame is None or frame.empty or "close" not in frame:
+        return f"No price history found for {ticker}"
+    keep_raw_frame(name, frame)
+    dates = pd.to_datetime(frame["time"] if "time" in frame else frame.index)
+    prices = pd.DataFrame({"close": frame["close"].to_numpy(dtype=float)}, index=pd.DatetimeIndex(dates))
+    for column in ("open", "high", "low", "volume"):
+        prices[column] = frame[column].to_numpy(dtype=float) if column in frame else np.nan
+    prices = prices.sort_index()
+    close = prices["close"]
+    last = close.iloc[-1]
+    sessions = len(close)
+
+    returns = ", ".join(f"{horizon} {format_change(last / close.iloc[-1 - offset] - 1)}"
+                        for horizon, offset in RETURN_HORIZONS.items() if sessions > offset)
+    averages = {window: close.rolling(window).mean().iloc[-1] for window in MOVING_AVERAGES if sessions >= window}
+    year = prices.iloc[-SESSIONS_PER_YEAR:]
+    log_returns = np.log(year["close"]).diff().dropna()
+    volatility = log_returns.std() * math.sqrt(SESSIONS_PER_YEAR) if len(log_returns) > 1 else np.nan
+    drawdown = (close / close.cummax() - 1).min()
+    # Relative strength index over 14 sessions, Wilder's smoothing
+    delta = close.diff()
+    gain = delta.clip(lower=0).ewm(alpha=1 / 14, adjust=False).mean().iloc[-1]
+    loss = -delta.clip(upper=0).ewm(alpha=1 / 14, adjust=False).mean().iloc[-1]
+    rsi = 100.0 if loss == 0 else 100 - 100 / (1 + gain / loss)
+    monthly = close.groupby(close.index.to_period("M")).last().iloc[-12:]
+
+    lines = [
+        (0, f"{name} from {dates.min():%Y-%m-%d} to {dates.max():%Y-%m-%d}, {sessions} sessions, prices as returned "
+            f"by the source"),
+        (0, f"Last close {format_number(last)} on {close.index[-1]:%Y-%m-%d}; change {returns}, "
+            f"whole period {format_change(last / close.iloc[0] - 1)}"),
+        (1, "Moving averages: " + ", ".join(f"MA{window} {format_number(value)} (close {format_change(last / value - 1)})"
+                                            for window, value in averages.items())),
+        (1, f"52-week high {format_number(year['high'].max())}, low {format_number(year['low'].min())}, close range "
+            f"{format_number(year['close'].min())}-{format_number(year['close'].max())}; annualized volatility "
+            f"{format_number(volatility * 100)}%; max drawdown over the period {format_change(drawdown)}; "
+            f"RSI14 {rsi:.0f}"),
+        (2, f"Average volume: 20 sessions {format_number(prices['volume'].iloc[-20:].mean())}, 100 sessions "
+            f"{format_number(prices['volume'].iloc[-100:].mean())}, last session "
+            f"{format_number(prices['volume'].iloc[-1])}"),
+        (3, "Month-end closes: " + ", ".join(f"{period} {format_number(value)}" for period, value in monthly.items())),
+        (3, "Last sessions (date open/high/low/close volume):"),
+    ]
+    # The most recent sessions are worth the most, older ones are left out first
+    recent = prices.iloc[-5:]
+    for age, (day, row) in enumerate(reversed(list(recent.iterrows()))):
+        lines.append((4 + age, f"  {day:%Y-%m-%d} {format_number(row['open'])}/{format_number(row['high'])}/"
+                               f"{format_number(row['low'])}/{format_number(row['close'])} "
+                               f"{format_number(row['volume'])}"))
+    return fit_to_budget(lines, max_tokens, f'the full history is available with "get raw data": "{name}"')
+
+
+# Function to sort a statement by period and label its rows, e.g. "2023" or "2023-Q4"
+def statement_periods(frame):
+    frame = flatten_columns(frame)
+    year_column = next((column for column in YEAR_COLUMNS if column in frame), None)
+    quarter_column = next((column for column in QUARTER_COLUMNS if column in frame), None)
+    if year_column is None:
+        return frame.select_dtypes(include="number"), [str(label) for label in frame.index]
+    sort_columns = [year_column] + ([quarter_column] if quarter_column else [])
+    frame = frame.sort_values(sort_columns).reset_index(drop=True)
+    years = frame[year_column].astype(int).astype(str)
+    if quarter_column:
+        quarters = pd.to_numeric(frame[quarter_column], errors="coerce")
+        labels = years.where(~quarters.between(1, 4), years + "-Q" + quarters.fillna(0).astype(int).astype(str))
+    else:
+        labels = years
+    values = frame.drop(columns=[column for column in sort_columns + list(LABEL_COLUMNS) if column in frame])
+    return values.select_dtypes(include="number"), labels.tolist()
+
+
+# Function to find the key metric columns of a statement, {label: column}
+def find_metrics(statement, columns):
+    patterns = KEY_METRICS.get(statement, {})
+    metrics = {}
+    for label, pattern in patterns.items():
+        column = next((column for column in columns if re.search(pattern, str(column).strip(), re.IGNORECASE)), None)
+        if column is not None and column not in metrics.values():
+            metrics[label] = column
+    if not metrics:
+        metrics = {str(column): column for column in list(columns)[:FALLBACK_METRICS]}
+    return metrics
+
+
+# Function to digest one statement: its key metrics over the last periods with their YoY, and QoQ, changes
+# Returns the metric lines and the latest value of every key metric, for the computed ratios
+def digest_statement(name, frame, priority):
+    statement, _, frequency = name.rpartition(" ")
+    quarterly = frequency == "Quarterly"
+    values, labels = statement_periods(frame)
+    metrics = find_metrics(statement, values.columns)
+    periods = STATEMENT_PERIODS["quarter" if quarterly else "year"]
+    lines = []
+    for rank, (label, column) in enumerate(metrics.items()):
+        series = values[column].astype(float).reset_index(drop=True)
+        # Vectorized over the periods: the same quarter of last year is 4 rows back
+        changes = {"YoY": relative_change(series, series.shift(4 if quarterly else 1))}
+        if quarterly:
+            changes["QoQ"] = relative_change(series, series.shift(1))
+        shown = []
+        for position in range(len(series) - 1, max(len(series) - 1 - periods, -1), -1):
+            deltas = ", ".join(f"{kind} {format_change(change.iloc[position])}" for kind, change in changes.items()
+                               if np.isfinite(change.iloc[position]))
+            shown.append(f"{labels[position]} {format_number(series.iloc[position])}"
+                         + (f" ({deltas})" if deltas else ""))
+        lines.append((priority + rank, f"  {label}: " + "; ".join(shown)))
+    latest = {label: values[column].astype(float).iloc[-1] for label, column in metrics.items() if len(values)}
+    return lines, latest, labels[-1] if labels else "n/a"
+
+
+# Function to compute the key ratios of the latest year from the statements, so they do not depend on the ratio table
+def computed_ratios(latest):
+    income, balance, cash_flow = (latest.get(f"{statement} Yearly", {})
+                                  for statement in ("Income Statement", "Balance Sheet", "Cash Flow"))
+    ratios = {
+        "gross margin": (income.get("Gross profit"), income.get("Revenue")),
+        "net margin": (income.get("Net profit"), income.get("Revenue")),
+        "ROE": (income.get("Net profit"), balance.get("Equity")),
+        "ROA": (income.get("Net profit"), balance.get("Total assets")),
+        "liabilities/assets": (balance.get("Liabilities"), balance.get("Total assets")),
+        "operating cash flow/net profit": (cash_flow.get("Operating cash flow"), income.get("Net profit")),
+    }
+    return ", ".join(f"{name} {numerator / denominator:.1%}" for name, (numerator, denominator) in ratios.items()
+                     if numerator is not None and denominator and np.isfinite(numerator / denominator))
+
+
+# Function to digest the eight statements of get_financial_data into the key metrics, their changes and key ratios
+def digest_financial_data(ticker, company_data, max_tokens=FINANCIAL_DIGEST_TOKENS):
+    lines = [(0, f"{ticker} financial data, key metrics of the latest periods (values as reported, latest first)")]
+    latest = {}
+    missing = []
+    # Yearly statements first, the quarterly ones are the first left out of a tight budget
+    ordered = sorted(company_data.items(), key=lambda item: item[0].endswith("Quarterly"))
+    for position, (name, frame) in enumerate(ordered):
+        full_name = f"{ticker} {name}"
+        if frame is None or frame.empty:
+            missing.append(name)
+            continue
+        keep_raw_frame(full_name, frame)
+        priority = 1 + position * 10
+        metric_lines, latest[name], last_period = digest_statement(name, frame, priority + 1)
+        lines.append((priority, f"{name} (last period {last_period}):"))
+        lines.extend(metric_lines)
+    ratios = computed_ratios(latest)
+    if ratios:
+        lines.insert(1, (1, f"Computed from the latest yearly statements: {ratios}"))
+    if missing:
+        lines.append((0, f"Not available: {', '.join(missing)}"))
+    return fit_to_budget(lines, max_tokens,
+                         f'every statement is available with "get raw data", e.g. "{ticker} Balance Sheet Yearly"')
@@ -1,16 +1,37 @@
 from langchain.callbacks.base import BaseCallbackHandler
+from usage_tracker import count_tokens, record_usage, tokens_from_llm_result
 
 class AnthropicTokenCounter(BaseCallbackHandler):
-    def __init__(self, llm):
+    """
+    Callback adding up the tokens of every LLM call made with it, and recording each call in the active usage
+    trackers. Counts come from the usage Bedrock reports, the local tokenizer is used when a response has none.
+    """
+
+    def __init__(self, llm, kind="rag_answer"):
         self.llm = llm
+        self.kind = kind
         self.input_tokens = 0
         self.output_tokens = 0
+        # Local prompt counts of the calls in flight, by run ID
+        self._prompt_tokens = {}
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._prompt_tokens[run_id] = sum(count_tokens(p) for p in prompts)
 
-    def on_llm_start(self, serialized, prompts, **kwargs):
-        for p in prompts:
-            self.input_tokens += self.llm.get_num_tokens(p)
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        prompt_tokens = self._prompt_tokens.pop(run_id, 0)
+        usage = tokens_from_llm_result(response)
+        if usage is not None:
+            input_tokens, output_tokens = usage
+            source = "bedrock"
+        else:
+            input_tokens = prompt_tokens
+            output_tokens = sum(count_tokens(generation.text)
+                                for generations in response.generations for generation in generations)
+            source = "tokenizer"
+        self.input_tokens += input_tokens
+        self.output_tokens += output_tokens
+        record_usage(self.llm.model_id, input_tokens, output_tokens, kind=self.kind, source=source)
 
-    def on_llm_end(self, response, **kwargs):
-        results = response.flatten()
-        for r in results:
-            self.output_tokens = self.llm.get_num_tokens(r.generations[0][0].text)
\ No newline at end of file
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._prompt_tokens.pop(run_id, None)
@@ -0,0 +1,73 @@
+"""
+Checks the judge output parser against the committed regression corpus, benchmarks/judge_output_corpus.jsonl.
+
+Every case of the corpus is a judge output, well-formed or mutated by benchmarks/judge_output_fuzz.py, with the
+score, thoughts and parse error it parsed to when the corpus was saved. The script checks that every output still
+parses to them without raising, and to the same tags when it is fed in chunks. It exits with status 1 listing the
+cases that changed, so it can gate a change of judge_output_parser. When a parsing change is intended, regenerate
+the corpus with judge_output_fuzz.py --save-corpus and review the diff.
+
+Usage:
+    python benchmarks/check_judge_output_corpus.py
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+# Make the evaluator modules importable when the script is run from the project directory or from benchmarks/
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+
+from judge_output_parser import TagExtractor, parse_judge_output
+from judge_output_fuzz import parse_chunked
+
+DEFAULT_CORPUS = os.path.join(BENCHMARKS_DIR, "judge_output_corpus.jsonl")
+
+
+def check_case(rng, case):
+    """
+    Parses one corpus output and compares it with its recorded parse.
+
+    :return: The description of the difference, or None if the output parses as recorded.
+    """
+    output = case["output"]
+    try:
+        score, thoughts, parse_error = parse_judge_output(output, "corpus")
+        whole = TagExtractor(("score", "thoughts")).feed(output).close()
+    except Exception as error:
+        return f"raised {error!r}"
+    parsed = {"score": score, "thoughts": thoughts, "error": parse_error["error"] if parse_error else None}
+    changed = [f"{field} {case[field]!r} -> {parsed[field]!r}" for field in parsed if parsed[field] != case[field]]
+    chunked = parse_chunked(rng, output)
+    if (chunked.results, chunked.errors) != (whole.results, whole.errors):
+        changed.append("parses differently in chunks")
+    return "; ".join(changed) or None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="The JSON lines corpus to check")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the chunk sizes")
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    # The malformed outputs are expected, only the differences with the corpus are reported
+    logging.getLogger("judge_output_parser").setLevel(logging.ERROR)
+
+    with open(args.corpus, encoding="utf-8") as corpus_file:
+        cases = [json.loads(line) for line in corpus_file if line.strip()]
+    failures = []
+    for number, case in enumerate(cases, start=1):
+        difference = check_case(rng, case)
+        if difference is not None:
+            failures.append(f"case {number}: {difference}: {case['output'][:100]!r}")
+    print(f"{len(cases)} corpus outputs, {len(failures)} parsed differently")
+    for failure in failures[:20]:
+        print("  " + failure)
+    sys.exit(1 if failures or not cases else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Benchmarks the judge step of the Model Evaluator against a local HTTP stub of bedrock-runtime.
+
+Compares the per-evaluation wall time of the pooled judge client (one aioboto3 client shared by all nine
+criteria and all evaluations) with the previous behaviour of opening a fresh session and client per criterion.
+No AWS account is needed, the stub answers every InvokeModel call with a fixed score after a simulated delay.
+
+Usage:
+    python benchmarks/judge_client_benchmark.py --evaluations 10 --latency-ms 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from timeit import default_timer as timer
+
+# Make the evaluator modules importable when the script is run from the project directory or from benchmarks/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Canned judge answer returned by the stub for every criterion
+STUB_RESPONSE = {
+    "content": [{"type": "text", "text": "<thoughts>Stubbed evaluation.</thoughts>\n<score>4</score>"}],
+    "usage": {"input_tokens": 3000, "output_tokens": 40},
+}
+
+
+class BedrockStubHandler(BaseHTTPRequestHandler):
+    """
+    Minimal bedrock-runtime InvokeModel endpoint, keeping connections alive like the real service.
+    """
+    protocol_version = "HTTP/1.1"
+    latency = 0.05
+
+    def do_POST(self):
+        # Drain the request body so the connection can be reused
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        # Simulate the model latency
+        threading.Event().wait(self.latency)
+        body = json.dumps(STUB_RESPONSE).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-Amzn-Bedrock-Input-Token-Count", str(STUB_RESPONSE["usage"]["input_tokens"]))
+        self.send_header("X-Amzn-Bedrock-Output-Token-Count", str(STUB_RESPONSE["usage"]["output_tokens"]))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Keep the benchmark output readable
+        pass
+
+
+def start_stub_server(latency):
+    """
+    Starts the bedrock-runtime stub on a free local port in a background thread.
+
+    :param latency: Simulated model latency in seconds.
+    :return: The running server.
+    """
+    BedrockStubHandler.latency = latency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), BedrockStubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def configure_stub_environment(server):
+    """
+    Points the evaluator at the stub and provides throwaway credentials through a temporary AWS profile.
+
+    :param server: The running stub server.
+    :return: None
+    """
+    config_dir = tempfile.mkdtemp()
+    config_path = os.path.join(config_dir, "config")
+    with open(config_path, "w") as f:
+        f.write("[default]\nregion = us-east-1\naws_access_key_id = stub\naws_secret_access_key = stub\n")
+    os.environ["AWS_CONFIG_FILE"] = config_path
+    os.environ["AWS_SHARED_CREDENTIALS_FILE"] = config_path
+    os.environ["profile_name"] = "default"
+    os.environ["region_name"] = "us-east-1"
+    os.environ["bedrock_endpoint_url"] = f"http://127.0.0.1:{server.server_address[1]}"
+    # Keep any response cache file out of the working directory
+    os.environ["cache_path"] = os.path.join(config_dir, "responses.sqlite3")
+
+
+async def run_evaluations(evaluation_steps, evaluations, source_text):
+    """
+    Runs the judge orchestrator several times in a row and times each evaluation.
+
+    :param evaluation_steps: The imported evaluation_steps module.
+    :param evaluations: The number of evaluations to run.
+    :param source_text: The source text sent with every judge request.
+    :return: A list with the wall time of every evaluation in seconds.
+    """
+    timings = []
+    for i in range(evaluations):
+        start = timer()
+        await evaluation_steps.evaluate_model_output_orchestrator(
+            source_text, f"stub-model-{i}", "A stubbed summary.", "Summarize this document in 2 sentences.",
+            "Task Adherence: stub", "5 - Excellent: stub")
+        timings.append(timer() - start)
+    return timings
+
+
+async def benchmark_fresh_clients(evaluation_steps, evaluations, source_text):
+    """
+    Times the evaluations when every criterion opens its own session and client, as before the shared pool.
+
+    :return: A list with the wall time of every evaluation in seconds.
+    """
+    import aioboto3
+    opened_contexts = []
+
+    async def fresh_bedrock_client(max_pool_connections=None):
+        # Build a new session and client for every call
+        session = aioboto3.Session(profile_name=os.getenv("profile_name"))
+        client_context = session.client(service_name="bedrock-runtime", region_name=os.getenv("region_name"),
+                                        endpoint_url=os.getenv("bedrock_endpoint_url"))
+        opened_contexts.append(client_context)
+        return await client_context.__aenter__()
+
+    shared_get_bedrock_client = evaluation_steps.get_bedrock_client
+    evaluation_steps.get_bedrock_client = fresh_bedrock_client
+    try:
+        timings = []
+        for _ in range(evaluations):
+            timings += await run_evaluations(evaluation_steps, 1, source_text)
+            # Close the nine clients of this evaluation, as the old per-criterion context managers did
+            while opened_contexts:
+                await opened_contexts.pop().__aexit__(None, None, None)
+        return timings
+    finally:
+        evaluation_steps.get_bedrock_client = shared_get_bedrock_client
+
+
+async def benchmark_pooled_client(evaluation_steps, evaluations, source_text, max_pool_connections):
+    """
+    Times the evaluations when all criteria and evaluations share one pooled client.
+
+    :return: A list with the wall time of every evaluation in seconds.
+    """
+    async with evaluation_steps.shared_bedrock_client(max_pool_connections):
+        return await run_evaluations(evaluation_steps, evaluations, source_text)
+
+
+def summarize(name, timings):
+    """
+    Formats the timing statistics of one benchmark variant.
+
+    :return: A formatted result line.
+    """
+    return (f"{name:<8} evaluations={len(timings):<4} mean={statistics.mean(timings) * 1000:8.1f} ms  "
+            f"median={statistics.median(timings) * 1000:8.1f} ms  max={max(timings) * 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--evaluations", type=int, default=10, help="Number of nine-criteria evaluations per variant")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Simulated latency of each stubbed call")
+    parser.add_argument("--source-chars", type=int, default=12000, help="Size of the source text sent to the judge")
+    parser.add_argument("--max-pool-connections", type=int, default=None,
+                        help="Connection pool size of the shared client (default: judge_max_pool_connections)")
+    args = parser.parse_args()
+
+    server = start_stub_server(args.latency_ms / 1000)
+    configure_stub_environment(server)
+    # Import after the environment points at the stub
+    import evaluation_steps
+    from response_cache import response_cache
+    # Every judge call has to reach the stub, a cached score would time the cache instead of the client
+    response_cache.enabled = False
+
+    source_text = "Lorem ipsum dolor sit amet. " * (args.source_chars // 28)
+    fresh = asyncio.run(benchmark_fresh_clients(evaluation_steps, args.evaluations, source_text))
+    pooled = asyncio.run(benchmark_pooled_client(evaluation_steps, args.evaluations, source_text,
+                                                 args.max_pool_connections))
+    server.shutdown()
+
+    print(summarize("fresh", fresh))
+    print(summarize("pooled", pooled))
+    print(f"per-evaluation speedup: {statistics.mean(fresh) / statistics.mean(pooled):.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Compares the fused rubric judge mode with the per-criterion judge mode on a real document.
+
+For every candidate model, the summary is generated once and then judged by both modes. The report lists the
+judge token usage, cost and latency of each mode and how closely the fused scores agree with the per-criterion
+scores. It is printed and saved to reports/ through write_evaluation_results.
+
+Candidate summaries are read from the response cache when available (pass --no-cache to regenerate them). The
+judge calls always bypass the cache, otherwise cached answers would report no token usage or latency.
+
+Usage:
+    python benchmarks/judge_mode_comparison.py --pdf document.pdf \
+        --models anthropic.claude-3-haiku-20240307-v1:0 meta.llama3-8b-instruct-v1:0
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+from timeit import default_timer as timer
+
+# Make the evaluator modules importable when the script is run from the project directory or from benchmarks/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from evaluation_steps import (JUDGE_CRITERIA, JUDGE_MODEL_ID, JUDGE_MODES, collect_judge_usage,
+                              dynamic_grading_criteria, evaluate_model_output_orchestrator, shared_bedrock_client)
+from plotting_and_reporting import write_evaluation_results
+from pricing_calculator import calculate_total_price
+from response_cache import response_cache
+from text_extractor_and_summarizer import summarize_document, text_extraction
+
+
+async def judge_all(source_text, summaries, task, evaluation_criteria, grading_scale, judge_mode):
+    """
+    Judges every candidate summary with one judge mode.
+
+    :return: A dict of model ID to its scoring rubric.
+    """
+    async with shared_bedrock_client():
+        results = await asyncio.gather(*[
+            evaluate_model_output_orchestrator(source_text, model, summary, task, evaluation_criteria,
+                                               grading_scale, judge_mode)
+            for model, summary in summaries.items()
+        ])
+    return {model: rubric for model, (_, _, rubric) in zip(summaries, results)}
+
+
+def score_of(rubric, criterion):
+    """
+    Returns the numeric score of a criterion in a scoring rubric, or None if the judge did not return one.
+    """
+    return rubric[f"model_{criterion}_score"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", required=True, help="PDF document to summarize")
+    parser.add_argument("--models", nargs="+", required=True, help="Candidate model IDs")
+    parser.add_argument("--task", default="Summarize this document in 2 sentences.", help="Task prompt")
+    parser.add_argument("--max-tokens", default=4096, type=int, help="Maximum tokens of the candidate summaries")
+    parser.add_argument("--no-cache", action="store_true", help="Regenerate the candidate summaries")
+    args = parser.parse_args()
+    if args.no_cache:
+        response_cache.enabled = False
+
+    source_text = text_extraction(args.pdf)
+    # Generate every candidate summary once, both judge modes score the same summaries
+    summaries = {}
+    for model in args.models:
+        summaries[model] = summarize_document(model, args.task, source_text, args.max_tokens)[0]
+    evaluation_criteria, grading_scale = dynamic_grading_criteria(args.task)
+    # Every judge call has to reach Bedrock for its tokens and latency to be measured
+    response_cache.enabled = False
+
+    usage_by_mode = {}
+    latency_by_mode = {}
+    rubrics_by_mode = {}
+    for judge_mode in JUDGE_MODES:
+        with collect_judge_usage() as usage:
+            start = timer()
+            rubrics_by_mode[judge_mode] = asyncio.run(
+                judge_all(source_text, summaries, args.task, evaluation_criteria, grading_scale, judge_mode))
+            latency_by_mode[judge_mode] = timer() - start
+        usage_by_mode[judge_mode] = usage
+
+    lines = [f"Judge mode comparison for {args.pdf} ({len(source_text)} characters, {len(summaries)} models)", ""]
+    lines.append("| Judge mode | Calls | Input tokens | Output tokens | Cost ($) | Wall time (s) | Mean call latency (s) |")
+    lines.append("|---|---|---|---|---|---|---|")
+    costs = {}
+    for judge_mode, usage in usage_by_mode.items():
+        input_tokens = sum(call["input_tokens"] for call in usage)
+        output_tokens = sum(call["output_tokens"] for call in usage)
+        costs[judge_mode] = calculate_total_price(input_tokens, output_tokens, JUDGE_MODEL_ID)[2]
+        lines.append(f"| {judge_mode} | {len(usage)} | {input_tokens} | {output_tokens} | {costs[judge_mode]:.4f} | "
+                     f"{latency_by_mode[judge_mode]:.2f} | "
+                     f"{statistics.mean(call['latency'] for call in usage):.2f} |")
+    if costs["fused"]:
+        lines.append(f"\nCost reduction: {costs['per_criterion'] / costs['fused']:.1f}x")
+
+    lines += ["", "| Criterion | Exact agreement | Within 1 point | Mean absolute difference |", "|---|---|---|---|"]
+    for criterion in JUDGE_CRITERIA:
+        pairs = [(score_of(rubrics_by_mode["per_criterion"][model], criterion),
+                  score_of(rubrics_by_mode["fused"][model], criterion)) for model in summaries]
+        pairs = [(a, b) for a, b in pairs if a is not None and b is not None]
+        if not pairs:
+            lines.append(f"| {criterion} | n/a | n/a | n/a |")
+            continue
+        differences = [abs(a - b) for a, b in pairs]
+        lines.append(f"| {criterion} | {sum(d == 0 for d in differences) / len(pairs):.0%} | "
+                     f"{sum(d <= 1 for d in differences) / len(pairs):.0%} | {statistics.mean(differences):.2f} |")
+
+    report = "\n".join(lines)
+    print(report)
+    write_evaluation_results(report, eval_name="judge_mode_comparison")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Fuzzes the judge output parser and compares its speed with the previous regex parser.
+
+Generates a corpus of judge outputs, well-formed ones and mutated ones (truncated, unclosed, nested, misordered or
+uppercase tags, stray "<" and ">", missing or out of range scores, very long thoughts), and checks that:
+    - parsing never raises, a malformed output gives a structured parse error instead
+    - feeding an output in random chunks gives the same result as parsing it at once
+    - every well-formed output parses to the score it was generated with
+Then times both parsers on long outputs, including outputs full of stray "<" that make the regex backtrack.
+The script exits with status 1 if an invariant does not hold.
+
+--save-corpus writes the generated outputs with their current parse as the regression corpus checked by
+benchmarks/check_judge_output_corpus.py, regenerate it only when a parsing change is intended.
+
+Usage:
+    python benchmarks/judge_output_fuzz.py --cases 5000 --seed 0
+    python benchmarks/judge_output_fuzz.py --cases 400 --seed 0 --save-corpus benchmarks/judge_output_corpus.jsonl
+"""
+import argparse
+import json
+import os
+import random
+import re
+import statistics
+import sys
+from timeit import default_timer as timer
+
+# Make the evaluator modules importable when the script is run from the project directory or from benchmarks/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from judge_output_parser import TagExtractor, parse_judge_output
+
+WORDS = ("the", "summary", "covers", "main", "points", "accurately", "but", "omits", "a", "detail", "score", "<",
+         ">", "a < b", "x > y", "</", "<3", "5>", "é", "—", "\n")
+
+
+def regex_parse_xml(xml, tag):
+    """
+    The previous parser, kept as the baseline.
+    """
+    pattern = f'<{tag}>(?:<[^/]*?>.*?</[^>]*?>|[^<]*?)+</{tag}>'
+    matches = re.findall(pattern, xml, re.DOTALL)
+    if matches:
+        return " ".join(re.sub(f'^<{tag}>|</{tag}>$', '', match, flags=re.DOTALL) for match in matches).strip()
+    return ""
+
+
+def random_thoughts(rng, words):
+    """
+    Returns random thoughts of the given number of words.
+    """
+    return " ".join(rng.choice(WORDS[:10]) for _ in range(words))
+
+
+def well_formed(rng, words=40):
+    """
+    Returns a well-formed judge output and its score.
+    """
+    score = rng.randint(0, 5)
+    return f"<thoughts>{random_thoughts(rng, words)}</thoughts>\n<score>{score}</score>", score
+
+
+def mutate(rng, output):
+    """
+    Applies one random mutation to a judge output.
+    """
+    mutation = rng.randrange(10)
+    if mutation == 0:
+        return output[:rng.randrange(len(output) + 1)]
+    if mutation == 1:
+        return output.replace("</score>", "").replace("</thoughts>", "", rng.randint(0, 1))
+    if mutation == 2:
+        return output.replace("<score>", "<score><score>").replace("</score>", "</score></score>")
+    if mutation == 3:
+        return output.replace("</thoughts>", "").replace("</score>", "</score></thoughts>")
+    if mutation == 4:
+        return output.upper()
+    if mutation == 5:
+        position = rng.randrange(len(output) + 1)
+        return output[:position] + rng.choice(WORDS[11:]) * rng.randint(1, 50) + output[position:]
+    if mutation == 6:
+        return re.sub(r"<score>.*?</score>", f"<score>{rng.choice(['', 'n/a', '7', '-1', '3.5', '4/5'])}</score>",
+                      output)
+    if mutation == 7:
+        return output.replace("<score>", "")
+    if mutation == 8:
+        return "".join(rng.choice(WORDS) for _ in range(rng.randint(0, 200)))
+    return output + "</score>" * rng.randint(1, 3)
+
+
+def generate_outputs(rng, cases):
+    """
+    Generates the fuzzed judge outputs, every fourth one well-formed.
+
+    :return: A list of (output, score) tuples, the score is None for the mutated outputs.
+    """
+    outputs = []
+    for case in range(cases):
+        output, score = well_formed(rng)
+        if case % 4 != 0:
+            output, score = mutate(rng, output), None
+        outputs.append((output, score))
+    return outputs
+
+
+def save_corpus(path, outputs):
+    """
+    Writes the outputs with their current parse as a JSON lines regression corpus.
+    """
+    with open(path, "w", encoding="utf-8") as corpus_file:
+        for output, _ in outputs:
+            score, thoughts, parse_error = parse_judge_output(output, "corpus")
+            case = {"output": output, "score": score, "thoughts": thoughts,
+                    "error": parse_error["error"] if parse_error else None}
+            corpus_file.write(json.dumps(case, ensure_ascii=False) + "\n")
+
+
+def parse_chunked(rng, output):
+    """
+    Feeds an output to a TagExtractor in random chunks.
+    """
+    extractor = TagExtractor(("score", "thoughts"))
+    position = 0
+    while position < len(output):
+        size = rng.randint(1, 20)
+        extractor.feed(output[position:position + size])
+        position += size
+    extractor.close()
+    return extractor
+
+
+def median_time(function, repeats=5):
+    """
+    Returns the median wall time of a function over several runs.
+    """
+    times = []
+    for _ in range(repeats):
+        start = timer()
+        function()
+        times.append(timer() - start)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", type=int, default=5000, help="Number of fuzzed outputs")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the corpus")
+    parser.add_argument("--save-corpus", help="Also write the outputs and their parse to this JSON lines file")
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    failures = []
+    errors = 0
+    outputs = generate_outputs(rng, args.cases)
+    for case, (output, score) in enumerate(outputs):
+        try:
+            parsed_score, thoughts, parse_error = parse_judge_output(output, "fuzz")
+            whole = TagExtractor(("score", "thoughts")).feed(output).close()
+        except Exception as error:
+            failures.append(f"case {case} raised {error!r}: {output[:100]!r}")
+            continue
+        errors += parse_error is not None
+        chunked = parse_chunked(rng, output)
+        if (chunked.results, chunked.errors) != (whole.results, whole.errors):
+            failures.append(f"case {case} parses differently in chunks: {output[:100]!r}")
+        if score is not None and parsed_score != score:
+            failures.append(f"case {case} parsed {parsed_score!r} instead of {score}: {output[:100]!r}")
+    print(f"{args.cases} outputs, {errors} structured parse errors, {len(failures)} invariant failures")
+    for failure in failures[:20]:
+        print("  " + failure)
+    if args.save_corpus:
+        save_corpus(args.save_corpus, outputs)
+        print(f"Saved the corpus to {args.save_corpus}")
+
+    print(f"\n{'output':>28} {'chars':>9} {'regex ms':>9} {'extractor ms':>13}")
+    long_output = well_formed(rng, words=20000)[0]
+    stray_output = "<thoughts>" + "a <b " * 4000 + "</thoughts><score>3</score>"
+    unclosed_output = "<thoughts>" + "<x>" * 2000 + random_thoughts(rng, 2000) + "<score>3"
+    for name, output in (("long thoughts", long_output), ("stray <", stray_output),
+                         ("unclosed nested tags", unclosed_output)):
+        regex_time = median_time(lambda: (regex_parse_xml(output, "score"), regex_parse_xml(output, "thoughts")))
+        extractor_time = median_time(lambda: parse_judge_output(output, "benchmark"))
+        print(f"{name:>28} {len(output):>9} {regex_time * 1000:>9.2f} {extractor_time * 1000:>13.2f}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Measures what Bedrock prompt caching saves on the judge requests of a multi-model run.
+
+For every candidate model, the summary is generated once and then judged twice, without and with prompt cache
+points on the judge system prompts (the rubric and source text shared by every model). The report lists, per
+variant, the judge calls, uncached and cached input tokens, the judge cost and the latency of the calls that read
+the cache compared to the others. It is printed and saved to reports/ through write_evaluation_results.
+
+The judge model has to support prompt caching, select one with judge_model_id, e.g.
+judge_model_id=anthropic.claude-3-7-sonnet-20250219-v1:0. Candidate summaries are read from the response cache when
+available (pass --no-cache to regenerate them), the judge calls always bypass it.
+
+Usage:
+    python benchmarks/judge_prompt_cache.py --pdf document.pdf \
+        --models anthropic.claude-3-haiku-20240307-v1:0 meta.llama3-8b-instruct-v1:0 --judge-mode per_criterion
+"""
+import argparse
+import asyncio
+import os
+import sys
+from timeit import default_timer as timer
+
+# Make the evaluator modules importable when the script is run from the project directory or from benchmarks/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import evaluation_steps
+from evaluation_steps import (JUDGE_MODEL_ID, JUDGE_MODES, dynamic_grading_criteria,
+                              evaluate_model_output_orchestrator, shared_bedrock_client, supports_prompt_caching)
+from plotting_and_reporting import write_evaluation_results
+from response_cache import response_cache
+from text_extractor_and_summarizer import summarize_document, text_extraction
+from usage_tracker import track_usage
+
+
+async def judge_all(source_text, summaries, task, evaluation_criteria, grading_scale, judge_mode):
+    """
+    Judges every candidate summary concurrently, as a run of final_evaluator does.
+    """
+    async with shared_bedrock_client():
+        await asyncio.gather(*[
+            evaluate_model_output_orchestrator(source_text, model, summary, task, evaluation_criteria,
+                                               grading_scale, judge_mode)
+            for model, summary in summaries.items()
+        ])
+
+
+def format_latency(latency):
+    """
+    Formats a mean latency that may be missing.
+    """
+    return "n/a" if latency is None else f"{latency:.2f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", required=True, help="PDF document to summarize")
+    parser.add_argument("--models", nargs="+", required=True, help="Candidate model IDs")
+    parser.add_argument("--task", default="Summarize this document in 2 sentences.", help="Task prompt")
+    parser.add_argument("--max-tokens", default=4096, type=int, help="Maximum tokens of the candidate summaries")
+    parser.add_argument("--judge-mode", default="per_criterion", choices=JUDGE_MODES, help="Judge mode to measure")
+    parser.add_argument("--no-cache", action="store_true", help="Regenerate the candidate summaries")
+    args = parser.parse_args()
+    if not supports_prompt_caching(JUDGE_MODEL_ID):
+        parser.error(f"The judge model {JUDGE_MODEL_ID} does not support prompt caching, set judge_model_id")
+    if args.no_cache:
+        response_cache.enabled = False
+
+    source_text = text_extraction(args.pdf)
+    # Generate every candidate summary once, both variants judge the same summaries
+    summaries = {}
+    for model in args.models:
+        summaries[model] = summarize_document(model, args.task, source_text, args.max_tokens)[0]
+    evaluation_criteria, grading_scale = dynamic_grading_criteria(args.task)
+    # Every judge call has to reach Bedrock for its tokens and latency to be measured
+    response_cache.enabled = False
+
+    lines = [f"Judge prompt caching for {args.pdf} ({len(source_text)} characters, {len(summaries)} models, "
+             f"{args.judge_mode} judge mode, judge {JUDGE_MODEL_ID})", "",
+             "| Prompt caching | Calls | Cache hits | Uncached input tokens | Cached input tokens | Input cost ($) | "
+             "Wall time (s) | Mean latency, cache hit (s) | Mean latency, cache miss (s) |",
+             "|---|---|---|---|---|---|---|---|---|"]
+    for prompt_caching in (False, True):
+        evaluation_steps.JUDGE_PROMPT_CACHING = prompt_caching
+        with track_usage() as usage:
+            start = timer()
+            asyncio.run(judge_all(source_text, summaries, args.task, evaluation_criteria, grading_scale,
+                                  args.judge_mode))
+            wall_time = timer() - start
+        cache_summary = usage.prompt_cache_summary("judge")[JUDGE_MODEL_ID]
+        judge_usage = usage.by_model("judge")[JUDGE_MODEL_ID]
+        input_cost = usage.costs("judge")[JUDGE_MODEL_ID]["input_cost"]
+        lines.append(f"| {'on' if prompt_caching else 'off'} | {cache_summary['calls']} | "
+                     f"{cache_summary['cache_hits']} | {cache_summary['uncached_input_tokens']} | "
+                     f"{cache_summary['cached_input_tokens']} | {input_cost:.4f} | {wall_time:.2f} | "
+                     f"{format_latency(cache_summary['mean_latency_cache_hit'])} | "
+                     f"{format_latency(cache_summary['mean_latency_cache_miss'])} |")
+        if prompt_caching:
+            lines.append(f"\nSaving with prompt caching: ${cache_summary['saving']:.4f} on "
+                         f"{judge_usage['cache_read_tokens'] + judge_usage['cache_write_tokens']} cacheable tokens")
+
+    report = "\n".join(lines)
+    print(report)
+    write_evaluation_results(report, eval_name="judge_prompt_cache")
+
+
+if __name__ == "__main__":
+    main()
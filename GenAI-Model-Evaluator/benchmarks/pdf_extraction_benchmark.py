@@ -0,0 +1,123 @@
+"""
+Benchmarks PDF text extraction across document sizes.
+
+Generates text-only PDFs of increasing page counts in a temporary directory and compares:
+    - serial: the previous extractor, walking every page and concatenating with text +=
+    - single process: text_extraction(workers=1), one reader and a list join
+    - parallel: text_extraction(), page batches extracted by a process pool
+and reports the time until the first page is available from iter_page_texts. Every variant is checked to
+return the same text as the serial extractor.
+
+Usage:
+    python benchmarks/pdf_extraction_benchmark.py --pages 10 100 300 --repeats 3
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+from timeit import default_timer as timer
+
+from pypdf import PdfReader
+
+# Make the evaluator modules importable when the script is run from the project directory or from benchmarks/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from text_extractor_and_summarizer import iter_page_texts, text_extraction
+
+
+def write_text_pdf(path, pages, lines_per_page=45):
+    """
+    Writes a PDF with the given number of pages of Helvetica text, without any PDF library.
+
+    :param path: The output path.
+    :param pages: The number of pages.
+    :param lines_per_page: Optional. The number of text lines per page.
+    :return: None
+    """
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for page in range(pages):
+        lines = [f"Page {page + 1} line {line + 1}: quarterly revenue grew while operating costs were held flat."
+                 for line in range(lines_per_page)]
+        stream = "BT /F1 10 Tf 40 800 Td 14 TL " + " ".join(f"({text}) '" for text in lines) + " ET"
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream.encode("latin-1")))
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> "
+                       b"/Contents %d 0 R >>" % len(objects))
+        page_ids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        " ".join(f"{page_id} 0 R" for page_id in page_ids).encode(), pages)
+    # Write the objects and the cross-reference table pointing at them
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref_offset = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    with open(path, "wb") as pdf:
+        pdf.write(output)
+
+
+def serial_extraction(pdf_path):
+    """
+    The previous extractor, kept as the baseline.
+    """
+    reader = PdfReader(pdf_path)
+    text = ""
+    for page in reader.pages:
+        text += page.extract_text()
+        text += "\n"
+    return text
+
+
+def time_first_page(pdf_path):
+    """
+    Returns the time until iter_page_texts yields the first page.
+    """
+    start = timer()
+    pages = iter_page_texts(pdf_path)
+    next(pages)
+    elapsed = timer() - start
+    # Finish the generator so its worker processes shut down
+    for _ in pages:
+        pass
+    return elapsed
+
+
+def median_time(function, repeats):
+    """
+    Returns the median wall time of a function over several runs, with the result of the last run.
+    """
+    times = []
+    for _ in range(repeats):
+        start = timer()
+        result = function()
+        times.append(timer() - start)
+    return statistics.median(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 50, 100, 300], help="PDF sizes in pages")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per variant, the median is reported")
+    args = parser.parse_args()
+
+    print(f"{'pages':>6} {'serial s':>9} {'1 proc s':>9} {'parallel s':>10} {'speedup':>8} {'first page s':>13}")
+    with tempfile.TemporaryDirectory() as directory:
+        for pages in args.pages:
+            pdf_path = os.path.join(directory, f"document-{pages}.pdf")
+            write_text_pdf(pdf_path, pages)
+            serial_time, expected = median_time(lambda: serial_extraction(pdf_path), args.repeats)
+            single_time, single_text = median_time(lambda: text_extraction(pdf_path, workers=1), args.repeats)
+            parallel_time, parallel_text = median_time(lambda: text_extraction(pdf_path), args.repeats)
+            assert single_text == expected and parallel_text == expected, "extracted text differs from the baseline"
+            first_page_time = time_first_page(pdf_path)
+            print(f"{pages:>6} {serial_time:>9.3f} {single_time:>9.3f} {parallel_time:>10.3f} "
+                  f"{serial_time / parallel_time:>7.1f}x {first_page_time:>13.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+import asyncio
+import functools
+import glob
+import hashlib
+import io
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from dotenv import load_dotenv
+from text_extractor_and_summarizer import text_extraction
+from evaluation_steps import dynamic_grading_criteria, shared_bedrock_client
+from orchestrator import evaluate_models
+from pricing_calculator import project_costs
+from rate_limiter import RateLimiter, bedrock_limiter_metrics, limit_bedrock_calls
+
+# Setting up a logger with default settings
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+# Loading environment variables from a .env file
+load_dotenv()
+
+# Default number of Bedrock calls (candidate and judge) sent per second across the whole corpus
+DEFAULT_REQUESTS_PER_SECOND = float(os.getenv("corpus_requests_per_second", "5"))
+# Default number of documents evaluated at the same time
+DEFAULT_DOCUMENT_CONCURRENCY = int(os.getenv("corpus_document_concurrency", "4"))
+# Default location of the per-document results, a .csv file or a directory of Parquet parts
+DEFAULT_CORPUS_OUTPUT = os.path.join("reports", "corpus_results.csv")
+
+
+def load_corpus(corpus):
+    """
+    Lists the PDF documents of a corpus.
+
+    :param corpus: A directory searched recursively for PDF files, or a manifest file: either a .csv file with a
+    header and a "path" column (otherwise its first column is used) or a text file with one path per line.
+    Relative paths in a manifest are resolved against the manifest's directory.
+    :return: The sorted, de-duplicated list of document paths.
+    """
+    if os.path.isdir(corpus):
+        return sorted(glob.glob(os.path.join(corpus, "**", "*.pdf"), recursive=True))
+    manifest_dir = os.path.dirname(os.path.abspath(corpus))
+    if corpus.lower().endswith(".csv"):
+        manifest_df = pd.read_csv(corpus)
+        paths = manifest_df['path' if 'path' in manifest_df.columns else manifest_df.columns[0]].dropna()
+    else:
+        with open(corpus) as manifest:
+            paths = [line.strip() for line in manifest if line.strip() and not line.startswith("#")]
+    return sorted({os.path.normpath(os.path.join(manifest_dir, path)) for path in paths})
+
+
+def load_corpus_results(output_path):
+    """
+    Reads the per-document results written so far.
+
+    :param output_path: The .csv file or Parquet directory the results are written to.
+    :return: A DataFrame of the results, empty if nothing was written yet.
+    """
+    if output_path.endswith(".csv"):
+        if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+            return pd.DataFrame()
+        with open(output_path, "rb") as results_file:
+            content = results_file.read()
+        # A crash can leave a truncated last line behind, without its newline: it is left out and its document
+        # evaluated again
+        content = content[:content.rfind(b"\n") + 1]
+        if not content:
+            return pd.DataFrame()
+        results_df = pd.read_csv(io.BytesIO(content), on_bad_lines="skip")
+    elif glob.glob(os.path.join(output_path, "*.parquet")):
+        results_df = pd.read_parquet(output_path)
+    else:
+        return pd.DataFrame()
+    return latest_results(results_df)
+
+
+def latest_results(results_df):
+    """
+    Keeps the latest row of every (Document, Model) pair, outputs written before resumes skipped every written pair
+    can hold several.
+
+    :param results_df: The per-document results.
+    :return: The results without duplicate pairs.
+    """
+    if results_df.empty or not {'Document', 'Model'} <= set(results_df.columns):
+        return results_df
+    return results_df.drop_duplicates(subset=['Document', 'Model'], keep="last").reset_index(drop=True)
+
+
+def append_corpus_results(rows, document, output_path):
+    """
+    Appends the results of one document to the output.
+
+    CSV results are appended to a single file. Parquet results are written as one part file per document, renamed
+    into place once complete, so a crash never leaves a partial part behind.
+
+    :param rows: The result rows of the document.
+    :param document: The path of the document.
+    :param output_path: The .csv file or Parquet directory the results are written to.
+    :return: None
+    """
+    results_df = pd.DataFrame(rows)
+    if output_path.endswith(".csv"):
+        if os.path.dirname(output_path):
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+            truncate_partial_line(output_path)
+        if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+            # Keep the column order of the existing header
+            header = pd.read_csv(output_path, nrows=0).columns
+            results_df.reindex(columns=header).to_csv(output_path, mode="a", header=False, index=False)
+        else:
+            results_df.to_csv(output_path, index=False)
+        return
+    os.makedirs(output_path, exist_ok=True)
+    # Name the part after the document and the models, re-running missing models adds a new part
+    part_name = hashlib.sha1(f"{document}|{'|'.join(results_df['Model'])}".encode("utf-8")).hexdigest()[:20]
+    part_path = os.path.join(output_path, f"part-{part_name}.parquet")
+    results_df.to_parquet(part_path + ".tmp", index=False)
+    os.replace(part_path + ".tmp", part_path)
+
+
+def truncate_partial_line(output_path):
+    """
+    Removes the truncated last line a crash left in a CSV output, so the next rows do not continue it.
+
+    :param output_path: The .csv file the results are written to.
+    :return: None
+    """
+    with open(output_path, "rb+") as results_file:
+        results_file.seek(0, os.SEEK_END)
+        size = results_file.tell()
+        results_file.seek(size - 1)
+        if results_file.read(1) == b"\n":
+            return
+        # Rows are short, the last newline is in the final block unless the file is a single partial line
+        block = min(size, 1 << 20)
+        results_file.seek(size - block)
+        tail = results_file.read(block)
+        if tail.rfind(b"\n") < 0 and block < size:
+            return
+        results_file.truncate(size - block + tail.rfind(b"\n") + 1)
+
+
+def aggregate_corpus_results(results_df):
+    """
+    Aggregates the per-document results into statistics per model.
+
+    :param results_df: The per-document results.
+    :return: A DataFrame with one row per model: number of documents, mean and median summary score, mean, p50 and
+    p90 time length, mean time to first token, total cost and mean cost per 1000 documents.
+    """
+    if results_df.empty:
+        return pd.DataFrame()
+    # A document evaluated twice counts once, with its latest results
+    results_df = latest_results(results_df).copy()
+    for column in ['Summary Score', 'Time Length', 'Time To First Token', 'Total Cost', 'Total Cost(1000)']:
+        if column not in results_df:
+            results_df[column] = None
+        results_df[column] = pd.to_numeric(results_df[column], errors="coerce")
+    grouped = results_df.groupby('Model')
+    summary_df = pd.DataFrame({
+        'Documents': grouped['Document'].nunique(),
+        'Mean Summary Score': grouped['Summary Score'].mean(),
+        'Median Summary Score': grouped['Summary Score'].median(),
+        'Mean Time Length': grouped['Time Length'].mean(),
+        'P50 Time Length': grouped['Time Length'].quantile(0.5),
+        'P90 Time Length': grouped['Time Length'].quantile(0.9),
+        'Mean Time To First Token': grouped['Time To First Token'].mean(),
+        'Total Cost': grouped['Total Cost'].sum(),
+        'Mean Cost(1000)': grouped['Total Cost(1000)'].mean(),
+    })
+    return summary_df.reset_index().sort_values(by='Mean Summary Score', ascending=False)
+
+
+async def evaluate_corpus_async(documents, models, prompt, max_tokens, dynamic_evaluation_criteria,
+                                dynamic_grading_scale, output_path, completed, requests_per_second,
+                                document_concurrency, extraction_workers, provider_concurrency=None,
+                                judge_concurrency=None, judge_mode=None):
+    """
+    Extracts every document in a process pool and evaluates the models on it, writing each document's results as
+    soon as they are complete.
+
+    :param completed: The set of (document, model) pairs already present in the output, they are not evaluated
+    again.
+    :return: The number of documents evaluated.
+    """
+    loop = asyncio.get_running_loop()
+    evaluated_count = 0
+
+    async def evaluate_document(pool, document, pending_models):
+        nonlocal evaluated_count
+        try:
+            # Extract the text in the process pool, one document per worker
+            input_text_data = await loop.run_in_executor(pool, functools.partial(text_extraction, document, workers=1))
+            model_results = await evaluate_models(
+                pending_models, prompt, input_text_data, max_tokens, dynamic_evaluation_criteria,
+                dynamic_grading_scale, concurrent=True, provider_concurrency=provider_concurrency,
+                judge_concurrency=judge_concurrency, judge_mode=judge_mode)
+        except Exception:
+            # A failed document does not stop the corpus, it is retried on the next run
+            logger.exception("Could not evaluate %s", document)
+            return
+        rows = []
+        for result, final_score_rubric in model_results:
+            row = {'Document': document, **result.format()}
+            # Keep the per-criterion scores, the written rationales stay in the judge output
+            row.update({criterion: score for criterion, score in final_score_rubric.items()
+                        if criterion.endswith("_score")})
+            rows.append(row)
+        if rows:
+            append_corpus_results(rows, document, output_path)
+        evaluated_count += 1
+        logger.info("Evaluated %s (%d models)", document, len(rows))
+
+    with ProcessPoolExecutor(max_workers=extraction_workers) as pool, \
+            limit_bedrock_calls(RateLimiter(requests_per_second)):
+        # Only the models missing from the output are evaluated, the documents are listed lazily
+        work = ((document, [model for model in models if (document, model) not in completed])
+                for document in documents)
+        work = ((document, pending_models) for document, pending_models in work if pending_models)
+
+        async def document_worker():
+            # Each worker extracts and evaluates one document at a time, only document_concurrency texts are in
+            # memory. The workers share the generator, it is only advanced between awaits
+            for document, pending_models in work:
+                await evaluate_document(pool, document, pending_models)
+
+        # Every document shares one pooled judge client
+        async with shared_bedrock_client():
+            await asyncio.gather(*(document_worker() for _ in range(max(1, document_concurrency))))
+    return evaluated_count
+
+
+def final_corpus_evaluator(corpus, models, task_prompt="Summarize this document in 2 sentences.", max_tokens='4096',
+                           output_path=DEFAULT_CORPUS_OUTPUT, requests_per_second=None, document_concurrency=None,
+                           extraction_workers=None, provider_concurrency=None, judge_concurrency=None,
+                           judge_mode=None, documents_per_day=None):
+    """
+    Evaluate multiple models over a corpus of PDF documents.
+
+    Results are written to output_path as each document completes. Re-running with the same output path resumes the
+    evaluation: documents (and models) already in the output are skipped.
+
+    :param corpus: A directory of PDF files, or a manifest of PDF paths (see load_corpus).
+    :param models: List of models to evaluate.
+    :param task_prompt: Optional. The task prompt given to every model.
+    :param max_tokens: Optional. The maximum number of tokens to generate.
+    :param output_path: Optional. A .csv file, or a directory for Parquet part files. Defaults to
+    reports/corpus_results.csv.
+    :param requests_per_second: Optional. Global cap on the Bedrock calls (candidate and judge) sent per second.
+    Defaults to the corpus_requests_per_second environment variable, or 5.
+    :param document_concurrency: Optional. The number of documents evaluated at the same time.
+    :param extraction_workers: Optional. The number of processes extracting text. Defaults to the CPU count.
+    :param provider_concurrency: Optional. Cap on in-flight candidate calls per provider within a document.
+    :param judge_concurrency: Optional. Number of models judged at the same time within a document.
+    :param judge_mode: Optional. "per_criterion" or "fused", see final_evaluator.
+    :param documents_per_day: Optional. Projects the daily and monthly cost of every model and pricing tier at this
+    volume from the measured token counts, saved to corpus_projection.csv.
+
+    :return: A tuple containing:
+        - DataFrame: The per-document results of every model.
+        - DataFrame: The aggregate statistics per model.
+    """
+    # List the documents and find what a previous run already evaluated
+    documents = load_corpus(corpus)
+    existing_results_df = load_corpus_results(output_path)
+    completed = set()
+    if not existing_results_df.empty:
+        # Every written row is complete, truncated lines are left out when loading. A row without a score (the judge
+        # output did not parse) is kept as it is, evaluating it again would only add a duplicate
+        written_df = existing_results_df.dropna(subset=['Document', 'Model'])
+        completed = set(zip(written_df['Document'], written_df['Model']))
+    logger.info("Corpus of %d documents, %d (document, model) pairs already evaluated", len(documents),
+                len(completed))
+    #create dynamic grading critera for the prompt, shared by every document
+    dynamic_evaluation_criteria, dynamic_grading_scale = dynamic_grading_criteria(task_prompt)
+    asyncio.run(evaluate_corpus_async(documents, models, task_prompt, max_tokens, dynamic_evaluation_criteria,
+                                      dynamic_grading_scale, output_path, completed,
+                                      requests_per_second or DEFAULT_REQUESTS_PER_SECOND,
+                                      document_concurrency or DEFAULT_DOCUMENT_CONCURRENCY, extraction_workers,
+                                      provider_concurrency, judge_concurrency, judge_mode))
+    # Report the concurrency each model settled on, and how often Bedrock throttled it
+    logger.info("Bedrock limits: %s", bedrock_limiter_metrics())
+    # Aggregate everything written so far, including the results of previous runs
+    results_df = load_corpus_results(output_path)
+    summary_df = aggregate_corpus_results(results_df)
+    if not summary_df.empty:
+        # Save the aggregate statistics next to the per-document results
+        summary_path = os.path.join(os.path.dirname(output_path.rstrip(os.sep)) or ".", "corpus_summary.csv")
+        summary_df.to_csv(summary_path, index=False)
+        logger.info("Corpus summary:\n%s", summary_df)
+        if documents_per_day and {'Input Tokens', 'Output Tokens'} <= set(results_df.columns):
+            # What-if costs at the projected volume, from every document evaluated so far
+            projection_df = project_costs(results_df.dropna(subset=['Input Tokens', 'Output Tokens']),
+                                          documents_per_day)
+            projection_df.to_csv(os.path.join(os.path.dirname(summary_path), "corpus_projection.csv"), index=False)
+            logger.info("Cost projection:\n%s", projection_df)
+    return results_df, summary_df
@@ -5,7 +5,15 @@ import json
 import os
 import asyncio
 import aioboto3
-import re
+import hashlib
+import weakref
+import contextvars
+from contextlib import asynccontextmanager, contextmanager
+from botocore.config import Config
+from response_cache import ResponseCache, response_cache
+from rate_limiter import timed_call_with_backoff_async
+from usage_tracker import record_usage
+from judge_output_parser import extract_tags, parse_judge_output
 
 # Setting up a logger with default settings
 logger = logging.getLogger()
@@ -15,52 +23,169 @@ load_dotenv()
 # Setting up the default boto3 session with a specified AWS profile name
 boto3.setup_default_session(profile_name=os.getenv("profile_name"))
 
-async def get_bedrock_client():
+# The model used as the judge for every evaluation criterion
+JUDGE_MODEL_ID = os.getenv("judge_model_id", "anthropic.claude-3-sonnet-20240229-v1:0")
+# Version of the judge prompts, bump it whenever a rubric or prompt changes so cached judge answers are not reused
+JUDGE_PROMPT_VERSION = "1"
+# Version of the prompt generating the task adherence criteria, bump it whenever it changes so cached criteria are
+# generated again
+GRADING_CRITERIA_VERSION = "1"
+# Judge evaluation modes: one request per criterion, or a single fused request scoring every criterion
+JUDGE_MODES = ("per_criterion", "fused")
+# Judge mode used when evaluate_model_output_orchestrator is not given one
+DEFAULT_JUDGE_MODE = os.getenv("judge_mode", "per_criterion")
+# Collects the usage of judge calls while set, see collect_judge_usage
+judge_usage = contextvars.ContextVar("judge_usage", default=None)
+# Size of the connection pool of the shared judge client, every criterion of every model in a run shares it
+JUDGE_MAX_POOL_CONNECTIONS = int(os.getenv("judge_max_pool_connections", "50"))
+# Shared judge clients, one per event loop since aiohttp connections are bound to the loop that opened them
+_shared_bedrock_clients = weakref.WeakKeyDictionary()
+# Models supporting Bedrock prompt caching, cross-region inference profiles (e.g. "us.") included
+PROMPT_CACHING_MODELS = (
+    "anthropic.claude-3-5-haiku-20241022-v1:0",
+    "anthropic.claude-3-7-sonnet-20250219-v1:0",
+    "anthropic.claude-sonnet-4-20250514-v1:0",
+    "anthropic.claude-opus-4-20250514-v1:0",
+)
+# Set judge_prompt_caching=false to never send prompt cache points, even to models supporting them
+JUDGE_PROMPT_CACHING = os.getenv("judge_prompt_caching", "true").lower() in ("1", "true", "yes")
+# The first judge request of every system prompt, per event loop, the others wait for it to write the prompt cache
+_prompt_cache_writes = weakref.WeakKeyDictionary()
+
+
+def supports_prompt_caching(model_id):
     """
-    Asynchronously creates and returns a client for interacting with the Bedrock Runtime service.
+    Checks whether Bedrock supports prompt cache points for a model.
 
-    This function uses aioboto3, an asynchronous version of the AWS SDK for Python (Boto3), to create a client
-    for the Bedrock Runtime service. It retrieves the AWS profile name and region name from environment variables.
+    :param model_id: The model ID or cross-region inference profile ID.
+    :return: True if the model supports prompt caching.
+    """
+    return model_id.split(".", 1)[-1] in PROMPT_CACHING_MODELS or model_id in PROMPT_CACHING_MODELS
+
+
+# The default judge model, Claude 3 Sonnet, does not support prompt caching: say so once, the judge prompts are then
+# sent in full and the single-writer coordination is skipped
+if JUDGE_PROMPT_CACHING and not supports_prompt_caching(JUDGE_MODEL_ID):
+    logger.warning("Judge model %s does not support Bedrock prompt caching, judge prompts are sent without cache "
+                   "points. Set judge_model_id to a model in PROMPT_CACHING_MODELS to use it.", JUDGE_MODEL_ID)
 
-    Returns:
-        aioboto3.client: A client object for interacting with the Bedrock Runtime service.
+
+async def _open_bedrock_client(max_pool_connections):
+    """
+    Opens a long-lived aioboto3 client for the Bedrock Runtime service.
+
+    :param max_pool_connections: The maximum number of pooled HTTP connections kept by the client.
+    :return: A tuple containing the client context manager and the opened client.
     """
-    
     if os.getenv("profile_name") is None:
         os.environ["profile_name"] = "default"
         os.environ["region_name"] = "us-east-1"
-    
+
     # Create an aioboto3 session using the specified profile name
     session = aioboto3.Session(profile_name=os.getenv("profile_name"))
-    # Asynchronously create a client for the Bedrock Runtime service
-    async with session.client(
-            service_name='bedrock-runtime',
-            region_name=os.getenv("region_name"),
+    # Create a client for the Bedrock Runtime service, bedrock_endpoint_url allows pointing it at a local stub.
+    # Throttled calls are retried by call_with_backoff_async, which adapts the concurrency, not by botocore
+    client_context = session.client(
+        service_name='bedrock-runtime',
+        region_name=os.getenv("region_name"),
+        endpoint_url=os.getenv("bedrock_endpoint_url"),
+        config=Config(max_pool_connections=max_pool_connections, retries={"total_max_attempts": 1}),
+    )
+    # Enter the client context once, it is exited by close_bedrock_client
+    client = await client_context.__aenter__()
+    return client_context, client
 
-    ) as client:
-        return client
 
+async def get_bedrock_client(max_pool_connections=None):
+    """
+    Asynchronously returns the shared client for interacting with the Bedrock Runtime service.
+
+    The first call in an event loop opens the client, every later call in the same loop reuses it, so the
+    session, credentials and HTTP connections are set up once per run instead of once per criterion.
+    Call close_bedrock_client (or use shared_bedrock_client) before the event loop ends.
 
-async def model_execution(client, user_prompt, system_prompt):
+    :param max_pool_connections: Optional. The connection pool size used when the client is opened. Defaults to
+    JUDGE_MAX_POOL_CONNECTIONS.
+    :return: aioboto3.client: A client object for interacting with the Bedrock Runtime service.
     """
-    Asynchronously executes a model using specified prompts, provided by each evaluation function
-    and returns the score and evaluation summary.
+    loop = asyncio.get_running_loop()
+    # Open the client once per event loop, concurrent callers all wait on the same future
+    if loop not in _shared_bedrock_clients:
+        _shared_bedrock_clients[loop] = asyncio.ensure_future(
+            _open_bedrock_client(max_pool_connections or JUDGE_MAX_POOL_CONNECTIONS))
+    try:
+        client_context, client = await asyncio.shield(_shared_bedrock_clients[loop])
+    except Exception:
+        # Do not keep a failed client around, the next call retries
+        _shared_bedrock_clients.pop(loop, None)
+        raise
+    return client
+
+
+async def close_bedrock_client():
+    """
+    Closes the shared Bedrock Runtime client of the running event loop, if one was opened.
+
+    :return: None
+    """
+    future = _shared_bedrock_clients.pop(asyncio.get_running_loop(), None)
+    if future is None:
+        return
+    client_context, client = await future
+    await client_context.__aexit__(None, None, None)
+
+
+@asynccontextmanager
+async def shared_bedrock_client(max_pool_connections=None):
+    """
+    Async context manager that opens the shared Bedrock Runtime client and closes it on exit. Nested contexts reuse
+    the client, only the outermost one closes it.
+
+    :param max_pool_connections: Optional. The connection pool size of the client.
+    :return: The shared aioboto3 client.
+    """
+    opened_here = asyncio.get_running_loop() not in _shared_bedrock_clients
+    client = await get_bedrock_client(max_pool_connections)
+    try:
+        yield client
+    finally:
+        if opened_here:
+            await close_bedrock_client()
+
+
+async def invoke_judge(client, user_prompt, system_prompt, max_tokens=10000, use_cache=True):
+    """
+    Asynchronously invokes the judge model with the given prompts and returns its raw output text.
+
+    Answers are cached by judge model, prompts, max tokens and JUDGE_PROMPT_VERSION. When a usage collector is
+    active (see collect_judge_usage), the token counts and latency of every call sent to Bedrock are appended to it.
+
+    The system prompt holds the rubric and the source text, only the user prompt changes between the candidate
+    models. If the judge model supports it, the system prompt is sent with a prompt cache point so Bedrock reuses
+    it across models; the first request of every system prompt is sent alone, the others wait for it to write the
+    cache instead of all missing it at once.
     :param client: An aioboto3 client object for invoking Amazon Bedrock and the specific model.
     :param user_prompt: The user prompt used during model execution.
-    :param system_prompt: The system prompt for the model execution and unique to the specific evaluation function.
-    :return: A tuple containing the score of the evaluation and evaluation summary.
+    :param system_prompt: The system prompt for the model execution.
+    :param max_tokens: Optional. The maximum number of tokens the judge may generate.
+    :param use_cache: Optional. Set to False to send the request even if its answer is cached, the new answer
+    replaces the cached one. Defaults to True.
+    :return: The output text of the judge model.
     """
     # Construct the content payload with user prompt
     content = [{
         "type": "text",
         "text": user_prompt
     }]
+    prompt_caching = JUDGE_PROMPT_CACHING and supports_prompt_caching(JUDGE_MODEL_ID)
     # Construct the prompt object with model execution parameters, formatted for the Claue 3 Messages API
     prompt = {
         "anthropic_version": "bedrock-2023-05-31",
-        "max_tokens": 10000,
+        "max_tokens": max_tokens,
         "temperature": 0,
-        "system": system_prompt,
+        # End the cacheable prefix after the system prompt, the rubric and source text shared by every model
+        "system": [{"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}]
+        if prompt_caching else system_prompt,
         "messages": [
             {
                 "role": "user",
@@ -70,74 +195,114 @@ async def model_execution(client, user_prompt, system_prompt):
     }
     # Convert the prompt object to a JSON string
     prompt = json.dumps(prompt)
-    # Invoke the model asynchronously with the provided prompt
-    response = await client.invoke_model(
-        body=prompt,
-        modelId="anthropic.claude-3-sonnet-20240229-v1:0",
-        accept="application/json",
-        contentType="application/json"
-    )
-    # Read the response body and parse it as JSON
-    response_body = await response['body'].read()
-    response_json = json.loads(response_body)
-    # Extract the output text from the response
+    # Reuse the judge answer if this exact request was already evaluated with the current judge prompts
+    cache_key = ResponseCache.make_key("judge", model_id=JUDGE_MODEL_ID, system_prompt=system_prompt,
+                                       user_prompt=user_prompt, max_tokens=max_tokens,
+                                       prompt_version=JUDGE_PROMPT_VERSION)
+    cached = response_cache.get("judge", cache_key) if use_cache else None
+    if cached is not None:
+        record_usage(JUDGE_MODEL_ID, cached["usage"]["input_tokens"], cached["usage"]["output_tokens"], kind="judge",
+                     cached=True)
+        return cached["output_text"]
+    cache_write = None
+    if prompt_caching:
+        cache_writes = _prompt_cache_writes.setdefault(asyncio.get_running_loop(), {})
+        # Key the writes by a digest, the system prompts contain the whole source text
+        prefix_key = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+        cache_write = cache_writes.get(prefix_key)
+        if cache_write is None:
+            # This request writes the prompt cache, the requests with the same system prompt wait for it
+            cache_writes[prefix_key] = asyncio.get_running_loop().create_future()
+        else:
+            # Wait until the prompt cache was written, a failed write only means this request writes it
+            await asyncio.shield(cache_write)
+    async def send_request():
+        # Invoke the model asynchronously with the provided prompt
+        response = await client.invoke_model(
+            body=prompt,
+            modelId=JUDGE_MODEL_ID,
+            accept="application/json",
+            contentType="application/json"
+        )
+        # Read the response body and parse it as JSON
+        response_body = await response['body'].read()
+        return json.loads(response_body)
+
+    try:
+        # Send the request under the adaptive limiter of the judge model and the active rate limiter, retrying
+        # throttled requests. The latency is that of the successful request
+        response_json, latency = await timed_call_with_backoff_async(JUDGE_MODEL_ID, send_request)
+    finally:
+        if prompt_caching and cache_write is None:
+            # Release the requests waiting for the prompt cache, whether it was written or not
+            cache_writes[prefix_key].set_result(None)
+    usage = response_json["usage"]
+    # Record the usage of this call if a collector is active
+    usage_collector = judge_usage.get()
+    if usage_collector is not None:
+        usage_collector.append({
+            "input_tokens": usage["input_tokens"],
+            "output_tokens": usage["output_tokens"],
+            "cache_read_input_tokens": usage.get("cache_read_input_tokens", 0),
+            "cache_creation_input_tokens": usage.get("cache_creation_input_tokens", 0),
+            "latency": latency,
+        })
+    record_usage(JUDGE_MODEL_ID, usage["input_tokens"], usage["output_tokens"], kind="judge",
+                 cache_read_tokens=usage.get("cache_read_input_tokens", 0),
+                 cache_write_tokens=usage.get("cache_creation_input_tokens", 0), latency=latency)
+    # Extract the output text from the response and cache it
     output_text = response_json['content'][0]['text']
-    # Extract score and evaluation summary from the output text
-    score = parse_xml(output_text, "score").strip()
-    evaluation_summary = parse_xml(output_text, "thoughts").strip()
-    # Return the score and evaluation summary
-    return score, evaluation_summary
+    response_cache.put("judge", cache_key, {"output_text": output_text, "usage": response_json["usage"]})
+    return output_text
 
 
-def parse_xml(xml, tag):
+async def model_execution(client, user_prompt, system_prompt, criterion=None):
     """
-    Parse XML-like content to extract the value associated with a specific tag, handling one level of nested same tags.
-    :param xml: The XML-like content as a string.
-    :param tag: The tag whose value needs to be extracted.
-    :return: The value associated with the specified tag or an empty string if the tag is not found.
+    Asynchronously executes a model using specified prompts, provided by each evaluation function
+    and returns the score and evaluation summary.
+    :param client: An aioboto3 client object for invoking Amazon Bedrock and the specific model.
+    :param user_prompt: The user prompt used during model execution.
+    :param system_prompt: The system prompt for the model execution and unique to the specific evaluation function.
+    :param criterion: Optional. The criterion being evaluated, reported in the parse error.
+    :return: A tuple containing the score of the evaluation (None if the judge output has no valid score),
+    evaluation summary and parse error (see parse_judge_output).
     """
-    try:
-        # Construct a regex pattern to find content inside the specified tag,
-        # This pattern attempts to skip over any nested tags of the same type.
-        pattern = f'<{tag}>(?:<[^/]*?>.*?</[^>]*?>|[^<]*?)+</{tag}>'
-        # Find the outermost tags first
-        matches = re.findall(pattern, xml, re.DOTALL)
-        if matches:
-            # If there are matches, strip the outermost tag and find again to handle nested same tags
-            clean_matches = []
-            for match in matches:
-                # Strip the outermost tag
-                content = re.sub(f'^<{tag}>|</{tag}>$', '', match, flags=re.DOTALL)
-                # Append cleaned content
-                clean_matches.append(content)
-            return " ".join(clean_matches).strip()
-        return ""
-    except re.error as e:
-        # Return an empty string if a regex error occurs
-        print(f"Regex error: {e}")
-        return ""
+    # Invoke the judge model and get its output text
+    output_text = await invoke_judge(client, user_prompt, system_prompt)
+    # Extract score and evaluation summary from the output text in a single pass
+    return parse_judge_output(output_text, criterion)
 
 
-async def eval_model_accuracy(model, summary, source_text):
+@contextmanager
+def collect_judge_usage():
     """
-    Evaluates the accuracy of a model's summary based on a source text.
+    Context manager collecting the token usage and latency of every judge call made inside it, including calls
+    made by tasks started inside it.
 
-    :param model: The model being evaluated, specifically the model that generated the specific summary.
-    :param summary: The summary generated by the model, that is being evaluated.
-    :param source_text: The original source text extracted from the pdfs.
-    :return: A tuple containing the score and evaluation summary.
+    :return: A list that receives one dict per judge call with input_tokens, output_tokens,
+    cache_read_input_tokens, cache_creation_input_tokens and latency.
     """
-    # Constructing the system prompt providing instructions, the source text, and evaluation criteria to evaluate model accuracy
-    system_prompt = f"""
-As an AI evaluator, you will be given a source body of text and an AI model's attempt to summarize that text.
-Evaluate the AI's summarization of the <source_body> provide a grade based on Accuracy
-Evaluate the AI model's summary based on the provided <evaluation_criteria>
-Only perform your evaluation based of the model's summary using the provided <evaluation_criteria>; other criteria (Completeness, Logical Flow, Paragraph and Sentence Structure, Conciseness, Clarity, Objectivity, and Tone) will be evaluated in a different method.
-Respond with a score of 0-5 using the details in <evaluation_grading> as a guide
+    usage_collector = []
+    token = judge_usage.set(usage_collector)
+    try:
+        yield usage_collector
+    finally:
+        judge_usage.reset(token)
+
 
+def parse_xml(xml, tag):
+    """
+    Parse XML-like content to extract the value associated with a specific tag, handling nested same tags.
+    :param xml: The XML-like content as a string.
+    :param tag: The tag whose value needs to be extracted.
+    :return: The value associated with the specified tag or an empty string if the tag is not found.
+    """
+    # Scan the content once with the tag extractor, see judge_output_parser.TagExtractor
+    return extract_tags(xml, (tag,)).text(tag)
 
 
-<evaluation_criteria>
+# Criteria and grading scale the judge uses to score accuracy
+ACCURACY_EVALUATION_CRITERIA = """
 1. Accuracy:
    - How well did the summary accurately represent the key information, facts, and details present in the source text.
    - Are there contradictions or factual errors in the summary when compared to the source text.
@@ -145,9 +310,9 @@ Respond with a score of 0-5 using the details in <evaluation_grading> as a guide
    - Are the Numerical data, proper nouns, and other specific details from the source text accurately represented in the summary.
 
 
-</evaluation_criteria>
+"""
 
-<evaluation_grading>
+ACCURACY_EVALUATION_GRADING = """
 5 - Excellent:
 Accuracy: The summary accurately captures the key points and factual information from the source text without any errors or misrepresentations.
 
@@ -166,7 +331,31 @@ Accuracy: The summary is riddled with inaccuracies and misrepresentations, signi
 0 - Unacceptable:
 Accuracy: The summary is completely inaccurate and bears no resemblance to the source text, misrepresenting the information entirely.
 
-</evaluation_grading>
+"""
+
+
+async def eval_model_accuracy(model, summary, source_text):
+    """
+    Evaluates the accuracy of a model's summary based on a source text.
+
+    :param model: The model being evaluated, specifically the model that generated the specific summary.
+    :param summary: The summary generated by the model, that is being evaluated.
+    :param source_text: The original source text extracted from the pdfs.
+    :return: A tuple containing the score and evaluation summary.
+    """
+    # Constructing the system prompt providing instructions, the source text, and evaluation criteria to evaluate model accuracy
+    system_prompt = f"""
+As an AI evaluator, you will be given a source body of text and an AI model's attempt to summarize that text.
+Evaluate the AI's summarization of the <source_body> provide a grade based on Accuracy
+Evaluate the AI model's summary based on the provided <evaluation_criteria>
+Only perform your evaluation based of the model's summary using the provided <evaluation_criteria>; other criteria (Completeness, Logical Flow, Paragraph and Sentence Structure, Conciseness, Clarity, Objectivity, and Tone) will be evaluated in a different method.
+Respond with a score of 0-5 using the details in <evaluation_grading> as a guide
+
+
+
+<evaluation_criteria>{ACCURACY_EVALUATION_CRITERIA}</evaluation_criteria>
+
+<evaluation_grading>{ACCURACY_EVALUATION_GRADING}</evaluation_grading>
 
 
 The source body of text that the summaries are based off of:
@@ -194,34 +383,16 @@ model's summary to be evaluated:
 </summary>
 
 """
-    # Acquiring an asynchronous client for invoking the evaluation model
-    async with await get_bedrock_client() as client:
-        # Executing the model asynchronously with the constructed prompts
-        result = await model_execution(client, user_prompt, system_prompt)
+    # Acquiring the shared asynchronous client for invoking the evaluation model
+    client = await get_bedrock_client()
+    # Executing the model asynchronously with the constructed prompts
+    result = await model_execution(client, user_prompt, system_prompt, "accuracy")
     # Returning the result of model execution
     return result
 
 
-async def eval_model_completeness(model, summary, source_text):
-    """
-    Evaluates the completeness of a model's summary based on a source text.
-
-    :param model: The model being evaluated, specifically the model that generated the specific summary.
-    :param summary: The summary generated by the model, that is being evaluated.
-    :param source_text: The original source text extracted from the pdfs.
-    :return: A tuple containing the score and evaluation summary.
-    """
-    # Constructing the system prompt providing instructions, the source text, and evaluation criteria to evaluate model completeness
-    system_prompt = f"""
-As an AI evaluator, you will be given a source body of text and an AI model's attempt to summarize that text.
-Evaluate the AI's summarization of the <source_body> provide a grade based on Completeness 
-Evaluate the AI model's summary based on the provided <evaluation_criteria>
-Only perform your evaluation based of the model's summary using the provided <evaluation_criteria>; other criteria (Accuracy, Logical Flow, Paragraph and Sentence Structure, Conciseness, Clarity, Objectivity, and Tone) will be evaluated in a different method.
-Respond with a score of 0-5 using the details in <evaluation_grading> as a guide
-
-
-
-<evaluation_criteria>
+# Criteria and grading scale the judge uses to score completeness
+COMPLETENESS_EVALUATION_CRITERIA = """
 
 
 1. Completeness:
@@ -229,9 +400,9 @@ Respond with a score of 0-5 using the details in <evaluation_grading> as a guide
    - Does the summary capture all critical information or important details from the source text.
    - How well does the summary provide a comprehensive overview of the source text, capturing its essence and main themes.
 
-</evaluation_criteria>
+"""
 
-<evaluation_grading>
+COMPLETENESS_EVALUATION_GRADING = """
 5 - Excellent:
 Completeness: The summary covers all relevant aspects of the topic or question in an exhaustive and comprehensive manner. It leaves no significant gaps or omissions, addressing even nuanced or complex aspects of the subject matter.
 
@@ -250,7 +421,31 @@ Completeness: The summary provides only a superficial or cursory coverage of the
 0 - Unacceptable:
 Completeness: The summary fails to address the topic or question adequately, leaving out essential information or aspects necessary for a complete understanding.
 
-</evaluation_grading>
+"""
+
+
+async def eval_model_completeness(model, summary, source_text):
+    """
+    Evaluates the completeness of a model's summary based on a source text.
+
+    :param model: The model being evaluated, specifically the model that generated the specific summary.
+    :param summary: The summary generated by the model, that is being evaluated.
+    :param source_text: The original source text extracted from the pdfs.
+    :return: A tuple containing the score and evaluation summary.
+    """
+    # Constructing the system prompt providing instructions, the source text, and evaluation criteria to evaluate model completeness
+    system_prompt = f"""
+As an AI evaluator, you will be given a source body of text and an AI model's attempt to summarize that text.
+Evaluate the AI's summarization of the <source_body> provide a grade based on Completeness 
+Evaluate the AI model's summary based on the provided <evaluation_criteria>
+Only perform your evaluation based of the model's summary using the provided <evaluation_criteria>; other criteria (Accuracy, Logical Flow, Paragraph and Sentence Structure, Conciseness, Clarity, Objectivity, and Tone) will be evaluated in a different method.
+Respond with a score of 0-5 using the details in <evaluation_grading> as a guide
+
+
+
+<evaluation_criteria>{COMPLETENESS_EVALUATION_CRITERIA}</evaluation_criteria>
+
+<evaluation_grading>{COMPLETENESS_EVALUATION_GRADING}</evaluation_grading>
 
 
 The source body of text that the summaries are based off of:
@@ -278,42 +473,24 @@ model's summary to be evaluated:
 </summary>
 
 """
-    # Acquiring an asynchronous client for invoking the evaluation model
-    async with await get_bedrock_client() as client:
-        # Executing the model asynchronously with the constructed prompts
-        result = await model_execution(client, user_prompt, system_prompt)
+    # Acquiring the shared asynchronous client for invoking the evaluation model
+    client = await get_bedrock_client()
+    # Executing the model asynchronously with the constructed prompts
+    result = await model_execution(client, user_prompt, system_prompt, "completeness")
     # Returning the result of model execution
     return result
 
 
-async def eval_model_flow(model, summary, source_text):
-    """
-    Evaluates the logical flow of a model's summary based on a source text.
-
-    :param model: The model being evaluated, specifically the model that generated the specific summary.
-    :param summary: The summary generated by the model, that is being evaluated.
-    :param source_text: The original source text extracted from the pdfs.
-    :return: A tuple containing the score and evaluation summary.
-    """
-    # Constructing the system prompt providing instructions, the source text, and evaluation criteria to evaluate model flow
-    system_prompt = f"""
-As an AI evaluator, you will be given a source body of text and an AI model's attempt to summarize that text.
-Evaluate the AI's summarization of the <source_body> provide a grade based on Logical Flow 
-Evaluate the AI model's summary based on the provided <evaluation_criteria>
-Only perform your evaluation based of the model's summary using the provided <evaluation_criteria>; other criteria (Completeness, Accuracy, Paragraph and Sentence Structure, Conciseness, Clarity, Objectivity, and Tone) will be evaluated in a different method.
-Respond with a score of 0-5 using the details in <evaluation_grading> as a guide
-
-
-
-<evaluation_criteria>
+# Criteria and grading scale the judge uses to score flow
+FLOW_EVALUATION_CRITERIA = """
 1. Logical Flow:
    - Does the summary present information in a logical, coherent, and easy-to-follow manner?
    - Is there a clear progression of ideas, with smooth transitions between points?
    - Does the organization of the summary mirror the structure and flow of the source text?
    - Is there a natural, intuitive flow that aids comprehension and maintains the intended meaning of the original text?
-</evaluation_criteria>
+"""
 
-<evaluation_grading>
+FLOW_EVALUATION_GRADING = """
 5 - Excellent:
 Logical Flow: The summary follows an exceptionally logical and coherent structure, mirroring the organization and progression of ideas in the source text. Transitions between points are seamless, and the flow of information is natural, easy to follow, and aids in comprehension.
 
@@ -331,7 +508,31 @@ Logical Flow: The summary lacks a clear logical flow or coherent structure, pres
 
 0 - Unacceptable:
 Logical Flow: The summary fails to establish any discernible logical flow or coherent progression of ideas. The information is presented in a completely disorganized and incoherent manner, rendering the summary difficult or impossible to follow.
-</evaluation_grading>
+"""
+
+
+async def eval_model_flow(model, summary, source_text):
+    """
+    Evaluates the logical flow of a model's summary based on a source text.
+
+    :param model: The model being evaluated, specifically the model that generated the specific summary.
+    :param summary: The summary generated by the model, that is being evaluated.
+    :param source_text: The original source text extracted from the pdfs.
+    :return: A tuple containing the score and evaluation summary.
+    """
+    # Constructing the system prompt providing instructions, the source text, and evaluation criteria to evaluate model flow
+    system_prompt = f"""
+As an AI evaluator, you will be given a source body of text and an AI model's attempt to summarize that text.
+Evaluate the AI's summarization of the <source_body> provide a grade based on Logical Flow 
+Evaluate the AI model's summary based on the provided <evaluation_criteria>
+Only perform your evaluation based of the model's summary using the provided <evaluation_criteria>; other criteria (Completeness, Accuracy, Paragraph and Sentence Structure, Conciseness, Clarity, Objectivity, and Tone) will be evaluated in a different method.
+Respond with a score of 0-5 using the details in <evaluation_grading> as a guide
+
+
+
+<evaluation_criteria>{FLOW_EVALUATION_CRITERIA}</evaluation_criteria>
+
+<evaluation_grading>{FLOW_EVALUATION_GRADING}</evaluation_grading>
 
 The source body of text that the summaries are based off of:
 <source_body>
@@ -358,34 +559,16 @@ model's summary to be evaluated:
 </summary>
 
 """
-    # Acquiring an asynchronous client for invoking the evaluation model
-    async with await get_bedrock_client() as client:
-        # Executing the model asynchronously with the constructed prompts
-        result = await model_execution(client, user_prompt, system_prompt)
+    # Acquiring the shared asynchronous client for invoking the evaluation model
+    client = await get_bedrock_client()
+    # Executing the model asynchronously with the constructed prompts
+    result = await model_execution(client, user_prompt, system_prompt, "flow")
     # Returning the result of model execution
     return result
 
 
-async def eval_model_structure(model, summary, source_text):
-    """
-    Evaluates the structure of a model's summary based on a source text.
-
-    :param model: The model being evaluated, specifically the model that generated the specific summary.
-    :param summary: The summary generated by the model, that is being evaluated.
-    :param source_text: The original source text extracted from the pdfs.
-    :return: A tuple containing the score and evaluation summary.
-    """
-    # Constructing the system prompt providing instructions, the source text, and evaluation criteria to evaluate model structure
-    system_prompt = f"""
-As an AI evaluator, you will be given a source body of text and an AI model's attempt to summarize that text.
-Evaluate the AI's summarization of the <source_body> provide a grade based on Paragraph and Sentence Structure
-Evaluate the AI model's summary based on the provided <evaluation_criteria>
-Only perform your evaluation based of the model's summary using the provided <evaluation_criteria>; other criteria (Completeness, Accuracy, Logical Flow, Conciseness, Clarity, Objectivity, and Tone) will be evaluated in a different method.
-Respond with a score of 0-5 using the details in <evaluation_grading> as a guide
-
-
-
-<evaluation_criteria>
+# Criteria and grading scale the judge uses to score structure
+STRUCTURE_EVALUATION_CRITERIA = """
 
 1. Paragraph and Sentence Structure:
    - How well-structured and organized are the paragraphs in the summary?
@@ -394,9 +577,9 @@ Respond with a score of 0-5 using the details in <evaluation_grading> as a guide
    - Is there appropriate use of varied sentence structures (simple, compound, complex) to enhance readability and flow?
    - Are there any issues with run-on sentences, fragmented sentences, or awkward phrasing that hinder clarity?
 
-</evaluation_criteria>
+"""
 
-<evaluation_grading>
+STRUCTURE_EVALUATION_GRADING = """
 5 - Excellent:
 Paragraph and Sentence Structure: The summary exhibits exceptional paragraph organization and sentence structure. Paragraphs are clearly delineated and flow seamlessly, with smooth transitions between ideas. Sentences within each paragraph are well-crafted, concise, and easy to comprehend. There is effective use of varied sentence structures, enhancing readability and flow. The writing is polished and error-free.
 
@@ -415,7 +598,31 @@ Paragraph and Sentence Structure: The summary displays poor paragraph organizati
 0 - Unacceptable:
 Paragraph and Sentence Structure: The summary lacks any discernible paragraph organization or proper sentence structure. Paragraphs are disjointed or nonexistent, with no logical flow or transitions between ideas. Sentences within each paragraph are incomprehensible or severely flawed, rendering the text unintelligible. There is no variation in sentence structures, and the writing is riddled with errors and awkward phrasing, making it impossible to understand.
 
-</evaluation_grading>
+"""
+
+
+async def eval_model_structure(model, summary, source_text):
+    """
+    Evaluates the structure of a model's summary based on a source text.
+
+    :param model: The model being evaluated, specifically the model that generated the specific summary.
+    :param summary: The summary generated by the model, that is being evaluated.
+    :param source_text: The original source text extracted from the pdfs.
+    :return: A tuple containing the score and evaluation summary.
+    """
+    # Constructing the system prompt providing instructions, the source text, and evaluation criteria to evaluate model structure
+    system_prompt = f"""
+As an AI evaluator, you will be given a source body of text and an AI model's attempt to summarize that text.
+Evaluate the AI's summarization of the <source_body> provide a grade based on Paragraph and Sentence Structure
+Evaluate the AI model's summary based on the provided <evaluation_criteria>
+Only perform your evaluation based of the model's summary using the provided <evaluation_criteria>; other criteria (Completeness, Accuracy, Logical Flow, Conciseness, Clarity, Objectivity, and Tone) will be evaluated in a different method.
+Respond with a score of 0-5 using the details in <evaluation_grading> as a guide
+
+
+
+<evaluation_criteria>{STRUCTURE_EVALUATION_CRITERIA}</evaluation_criteria>
+
+<evaluation_grading>{STRUCTURE_EVALUATION_GRADING}</evaluation_grading>
 
 The source body of text that the summaries are based off of:
 <source_body>
@@ -442,34 +649,16 @@ model's summary to be evaluated:
 </summary>
 
 """
-    # Acquiring an asynchronous client for invoking the evaluation model
-    async with await get_bedrock_client() as client:
-        # Executing the model asynchronously with the constructed prompts
-        result = await model_execution(client, user_prompt, system_prompt)
+    # Acquiring the shared asynchronous client for invoking the evaluation model
+    client = await get_bedrock_client()
+    # Executing the model asynchronously with the constructed prompts
+    result = await model_execution(client, user_prompt, system_prompt, "structure")
     # Returning the result of model execution
     return result
 
 
-async def eval_model_conciseness(model, summary, source_text):
-    """
-    Evaluates the conciseness of a model's summary based on a source text.
-
-    :param model: The model being evaluated, specifically the model that generated the specific summary.
-    :param summary: The summary generated by the model, that is being evaluated.
-    :param source_text: The original source text extracted from the pdfs.
-    :return: A tuple containing the score and evaluation summary.
-    """
-    # Constructing the system prompt providing instructions, the source text, and evaluation criteria to evaluate model conciseness
-    system_prompt = f"""
-As an AI evaluator, you will be given a source body of text and an AI model's attempt to summarize that text.
-Evaluate the AI's summarization of the <source_body> provide a grade based on Conciseness
-Evaluate the AI model's summary based on the provided <evaluation_criteria>
-Only perform your evaluation based on the provided <evaluation_criteria>; other criteria (Completeness, Accuracy, Logical Flow, Paragraph and Sentence Structure, Clarity, Objectivity, and Tone) will be evaluated in a different method.
-Respond with a score of 0-5 using the details in <evaluation_grading> as a guide
-
-
-
-<evaluation_criteria>
+# Criteria and grading scale the judge uses to score conciseness
+CONCISENESS_EVALUATION_CRITERIA = """
 
 1. Conciseness:
    - How effectively does the summary capture the main ideas and key information from the source text in a concise manner?
@@ -478,9 +667,9 @@ Respond with a score of 0-5 using the details in <evaluation_grading> as a guide
    - Is the length of the summary appropriate for the content, neither too long nor too short?
    - Does the summary strike a balance between being concise and retaining the necessary context and nuance?
 
-</evaluation_criteria>
+"""
 
-<evaluation_grading>
+CONCISENESS_EVALUATION_GRADING = """
 5 - Excellent:
 Conciseness: The summary demonstrates exceptional conciseness in capturing the core ideas and essential information from the source text. It is highly effective in eliminating unnecessary details, repetition, and irrelevant information. The writing is succinct and avoids wordiness, conveying the key points clearly and concisely. The length of the summary is appropriate for the content, neither too long nor too short. The summary strikes an excellent balance between being concise and retaining the necessary context and nuance.
 
@@ -499,7 +688,31 @@ Conciseness: The summary displays poor conciseness in capturing the core ideas a
 0 - Unacceptable:
 Conciseness: The summary lacks any semblance of conciseness in capturing the main ideas and important information from the source text. It is overwhelmed by unnecessary details, excessive repetition, and irrelevant information, rendering the summary meaningless. The writing is excessively wordy and incomprehensible, making it impossible to discern the key points. The length of the summary is completely inappropriate for the content. The summary fails to retain any context or nuance, rendering it useless.
 
-</evaluation_grading>
+"""
+
+
+async def eval_model_conciseness(model, summary, source_text):
+    """
+    Evaluates the conciseness of a model's summary based on a source text.
+
+    :param model: The model being evaluated, specifically the model that generated the specific summary.
+    :param summary: The summary generated by the model, that is being evaluated.
+    :param source_text: The original source text extracted from the pdfs.
+    :return: A tuple containing the score and evaluation summary.
+    """
+    # Constructing the system prompt providing instructions, the source text, and evaluation criteria to evaluate model conciseness
+    system_prompt = f"""
+As an AI evaluator, you will be given a source body of text and an AI model's attempt to summarize that text.
+Evaluate the AI's summarization of the <source_body> provide a grade based on Conciseness
+Evaluate the AI model's summary based on the provided <evaluation_criteria>
+Only perform your evaluation based on the provided <evaluation_criteria>; other criteria (Completeness, Accuracy, Logical Flow, Paragraph and Sentence Structure, Clarity, Objectivity, and Tone) will be evaluated in a different method.
+Respond with a score of 0-5 using the details in <evaluation_grading> as a guide
+
+
+
+<evaluation_criteria>{CONCISENESS_EVALUATION_CRITERIA}</evaluation_criteria>
+
+<evaluation_grading>{CONCISENESS_EVALUATION_GRADING}</evaluation_grading>
 
 The source body of text that the summaries are based off of:
 <source_body>
@@ -525,34 +738,16 @@ model's summary to be evaluated:
 </summary>
 
 """
-    # Acquiring an asynchronous client for invoking the evaluation model
-    async with await get_bedrock_client() as client:
-        # Executing the model asynchronously with the constructed prompts
-        result = await model_execution(client, user_prompt, system_prompt)
+    # Acquiring the shared asynchronous client for invoking the evaluation model
+    client = await get_bedrock_client()
+    # Executing the model asynchronously with the constructed prompts
+    result = await model_execution(client, user_prompt, system_prompt, "conciseness")
     # Returning the result of model execution
     return result
 
 
-async def eval_model_clarity(model, summary, source_text):
-    """
-    Evaluates the clarity of a model's summary based on a source text.
-
-    :param model: The model being evaluated, specifically the model that generated the specific summary.
-    :param summary: The summary generated by the model, that is being evaluated.
-    :param source_text: The original source text extracted from the pdfs.
-    :return: A tuple containing the score and evaluation summary.
-    """
-    # Constructing the system prompt providing instructions, the source text, and evaluation criteria to evaluate model clarity
-    system_prompt = f"""
-As an AI evaluator, you will be given a source body of text and an AI model's attempt to summarize that text.
-Evaluate the AI's summarization of the <source_body> provide a grade based on Clarity
-Evaluate the AI model's summary based on the provided <evaluation_criteria>
-Only perform your evaluation based on the provided <evaluation_criteria>; other criteria (Completeness, Accuracy, Logical Flow, Paragraph and Sentence Structure, Conciseness, Objectivity, and Tone) will be evaluated in a different method.
-Respond with a score of 0-5 using the details in <evaluation_grading> as a guide
-
-
-
-<evaluation_criteria>
+# Criteria and grading scale the judge uses to score clarity
+CLARITY_EVALUATION_CRITERIA = """
 1. Clarity and Comprehensibility:
    - How easy is it to understand the key ideas and information presented in the summary?
    - Is the language used clear, concise, and free from ambiguity or confusing phrasing?
@@ -560,9 +755,9 @@ Respond with a score of 0-5 using the details in <evaluation_grading> as a guide
    - Are complex concepts or technical terms explained in a way that is easy for the target audience to comprehend?
    - Is the summary free from unnecessary jargon or overly complex language that could hinder understanding?
    - Is the summary clear, easy to understand, and human readable?
-</evaluation_criteria>
+"""
 
-<evaluation_grading>
+CLARITY_EVALUATION_GRADING = """
 5 - Excellent Clarity:
 The summary is exceptionally clear and easy to understand. The language used is precise, concise, and free from ambiguity or confusing phrasing. The main ideas and key details from the source text are accurately and clearly conveyed without any misinterpretation or confusion. Complex concepts or technical terms are explained in a way that is accessible and comprehensible to the target audience. The summary avoids unnecessary jargon or overly complex language, ensuring optimal clarity.
 
@@ -580,7 +775,31 @@ The summary exhibits poor clarity and comprehensibility. The language used is fr
 
 0 - Unacceptable Clarity:
 The summary lacks any discernible clarity or comprehensibility. The language used is incomprehensible, with severe ambiguity and confusing phrasing throughout. The summary fails to convey the main ideas and key details from the source text accurately, rendering it meaningless or entirely unrelated to the original content. Complex concepts or technical terms are either absent or explained in an utterly confusing manner. The summary is filled with excessive jargon and overly complex language, making it impossible for the target audience to understand.
-</evaluation_grading>
+"""
+
+
+async def eval_model_clarity(model, summary, source_text):
+    """
+    Evaluates the clarity of a model's summary based on a source text.
+
+    :param model: The model being evaluated, specifically the model that generated the specific summary.
+    :param summary: The summary generated by the model, that is being evaluated.
+    :param source_text: The original source text extracted from the pdfs.
+    :return: A tuple containing the score and evaluation summary.
+    """
+    # Constructing the system prompt providing instructions, the source text, and evaluation criteria to evaluate model clarity
+    system_prompt = f"""
+As an AI evaluator, you will be given a source body of text and an AI model's attempt to summarize that text.
+Evaluate the AI's summarization of the <source_body> provide a grade based on Clarity
+Evaluate the AI model's summary based on the provided <evaluation_criteria>
+Only perform your evaluation based on the provided <evaluation_criteria>; other criteria (Completeness, Accuracy, Logical Flow, Paragraph and Sentence Structure, Conciseness, Objectivity, and Tone) will be evaluated in a different method.
+Respond with a score of 0-5 using the details in <evaluation_grading> as a guide
+
+
+
+<evaluation_criteria>{CLARITY_EVALUATION_CRITERIA}</evaluation_criteria>
+
+<evaluation_grading>{CLARITY_EVALUATION_GRADING}</evaluation_grading>
 
 The source body of text that the summaries are based off of:
 <source_body>
@@ -606,43 +825,25 @@ model's summary to be evaluated:
 </summary>
 
 """
-    # Acquiring an asynchronous client for invoking the evaluation model
-    async with await get_bedrock_client() as client:
-        # Executing the model asynchronously with the constructed prompts
-        result = await model_execution(client, user_prompt, system_prompt)
+    # Acquiring the shared asynchronous client for invoking the evaluation model
+    client = await get_bedrock_client()
+    # Executing the model asynchronously with the constructed prompts
+    result = await model_execution(client, user_prompt, system_prompt, "clarity")
     # Returning the result of model execution
     return result
 
 
-async def eval_model_objectivity(model, summary, source_text):
-    """
-    Evaluates the objectivity of a model's summary based on a source text.
-
-    :param model: The model being evaluated, specifically the model that generated the specific summary.
-    :param summary: The summary generated by the model, that is being evaluated.
-    :param source_text: The original source text extracted from the pdfs.
-    :return: A tuple containing the score and evaluation summary.
-    """
-    # Constructing the system prompt providing instructions, the source text, and evaluation criteria to evaluate model objectivity
-    system_prompt = f"""
-As an AI evaluator, you will be given a source body of text and an AI model's attempt to summarize that text.
-Evaluate the AI's summarization of the <source_body> provide a grade based on Objectivity
-Evaluate the AI model's summary based on the provided <evaluation_criteria>
-Only perform your evaluation based on the provided <evaluation_criteria>; other criteria (Completeness, Accuracy, Logical Flow, Paragraph and Sentence Structure, Conciseness, Clarity, and Tone) will be evaluated in a different method.
-Respond with a score of 0-5 using the details in <evaluation_grading> as a guide
-
-
-
-<evaluation_criteria>
+# Criteria and grading scale the judge uses to score objectivity
+OBJECTIVITY_EVALUATION_CRITERIA = """
 Objectivity:
 - Does the summary present information objectively, without introducing personal biases, opinions, or judgments not present in the source text?
 - Are subjective statements or claims in the source text accurately represented in the summary, without exaggeration or diminishment?
 - Is the language used in the summary neutral and impartial, avoiding loaded or emotionally charged words that could influence the reader's perception?
 - If the source text presents multiple perspectives or viewpoints, does the summary represent them fairly and accurately, without favoring or dismissing any particular stance?
 - Are any factual errors or misrepresentations of information from the source text present in the summary?
-</evaluation_criteria>
+"""
 
-<evaluation_grading>
+OBJECTIVITY_EVALUATION_GRADING = """
 5 - Excellent:
 Objectivity: The summary presents information from the source text in an entirely objective and impartial manner. It accurately reflects the content, tone, and multiple perspectives (if present) without introducing personal biases, opinions, or judgments. The language used is neutral and factual, devoid of loaded or emotionally charged words that could sway the reader's perception. There are no factual errors or misrepresentations of information from the source text.
 
@@ -660,7 +861,31 @@ Objectivity: The summary is highly subjective and biased, with a significant por
 
 0 - Unacceptable:
 Objectivity: The summary is entirely subjective and opinionated, bearing little resemblance to the factual content or tone of the source text. Multiple perspectives are disregarded or grossly misrepresented. The summary is riddled with factual errors, misrepresentations, and biased language, rendering it an unreliable representation of the source material.
-</evaluation_grading>
+"""
+
+
+async def eval_model_objectivity(model, summary, source_text):
+    """
+    Evaluates the objectivity of a model's summary based on a source text.
+
+    :param model: The model being evaluated, specifically the model that generated the specific summary.
+    :param summary: The summary generated by the model, that is being evaluated.
+    :param source_text: The original source text extracted from the pdfs.
+    :return: A tuple containing the score and evaluation summary.
+    """
+    # Constructing the system prompt providing instructions, the source text, and evaluation criteria to evaluate model objectivity
+    system_prompt = f"""
+As an AI evaluator, you will be given a source body of text and an AI model's attempt to summarize that text.
+Evaluate the AI's summarization of the <source_body> provide a grade based on Objectivity
+Evaluate the AI model's summary based on the provided <evaluation_criteria>
+Only perform your evaluation based on the provided <evaluation_criteria>; other criteria (Completeness, Accuracy, Logical Flow, Paragraph and Sentence Structure, Conciseness, Clarity, and Tone) will be evaluated in a different method.
+Respond with a score of 0-5 using the details in <evaluation_grading> as a guide
+
+
+
+<evaluation_criteria>{OBJECTIVITY_EVALUATION_CRITERIA}</evaluation_criteria>
+
+<evaluation_grading>{OBJECTIVITY_EVALUATION_GRADING}</evaluation_grading>
 
 The source body of text that the summaries are based off of:
 <source_body>
@@ -686,34 +911,16 @@ model's summary to be evaluated:
 </summary>
 
 """
-    # Acquiring an asynchronous client for invoking the evaluation model
-    async with await get_bedrock_client() as client:
-        # Executing the model asynchronously with the constructed prompts
-        result = await model_execution(client, user_prompt, system_prompt)
+    # Acquiring the shared asynchronous client for invoking the evaluation model
+    client = await get_bedrock_client()
+    # Executing the model asynchronously with the constructed prompts
+    result = await model_execution(client, user_prompt, system_prompt, "objectivity")
     # Returning the result of model execution
     return result
 
 
-async def eval_model_tone(model, summary, source_text):
-    """
-    Evaluates the tone of a model's summary based on a source text.
-
-    :param model: The model being evaluated, specifically the model that generated the specific summary.
-    :param summary: The summary generated by the model, that is being evaluated.
-    :param source_text: The original source text extracted from the pdfs.
-    :return: A tuple containing the score and evaluation summary.
-    """
-    # Constructing the system prompt providing instructions, the source text, and evaluation criteria to evaluate model tone
-    system_prompt = f"""
-As an AI evaluator, you will be given a source body of text and an AI model's attempt to summarize that text.
-Evaluate the AI's summarization of the <source_body> provide a grade based on Tone Consistency 
-Evaluate the AI model's summary based on the provided <evaluation_criteria>
-Only perform your evaluation based on the provided <evaluation_criteria>; other criteria (Completeness, Accuracy, Logical Flow, Paragraph and Sentence Structure, Conciseness, Clarity, and Objectivity) will be evaluated in a different method.
-Respond with a score of 0-5 using the details in <evaluation_grading> as a guide
-
-
-
-<evaluation_criteria>
+# Criteria and grading scale the judge uses to score tone
+TONE_EVALUATION_CRITERIA = """
 
 1. Tone Consistency:
    - Is the overall tone of the summary consistent with the source text?
@@ -723,9 +930,9 @@ Respond with a score of 0-5 using the details in <evaluation_grading> as a guide
    - If the source text has a neutral or objective tone, does the summary maintain that impartial perspective?
    - If the source text has a more subjective or emotional tone, does the summary accurately reflect that tone without being overly exaggerated or understated?
 
-</evaluation_criteria>
+"""
 
-<evaluation_grading>
+TONE_EVALUATION_GRADING = """
 5 - Excellent:
 Tone Consistency: The summary exhibits exceptional consistency in tone with the source text. The overall level of formality, emotion, or attitude is maintained throughout, accurately reflecting the intended tone and mood of the original content. There are no shifts or inconsistencies in tone within the summary. If the source text has a neutral or objective tone, the summary maintains that impartial perspective. If the source text has a more subjective or emotional tone, the summary accurately captures and conveys that tone without being overly exaggerated or understated.
 
@@ -744,7 +951,31 @@ Tone Consistency: The summary displays poor consistency in tone with the source
 0 - Unacceptable:
 Tone Consistency: The summary lacks any discernible consistency in tone with the source text. The overall level of formality, emotion, or attitude bears no resemblance to the intended tone and mood of the original content. The tone within the summary is wildly inconsistent, with constant  shifts that make it impossible to establish a coherent tone. Regardless of whether the source text has a neutral or subjective tone, the summary fails to capture or convey any semblance of the appropriate tone.
 
-</evaluation_grading>
+"""
+
+
+async def eval_model_tone(model, summary, source_text):
+    """
+    Evaluates the tone of a model's summary based on a source text.
+
+    :param model: The model being evaluated, specifically the model that generated the specific summary.
+    :param summary: The summary generated by the model, that is being evaluated.
+    :param source_text: The original source text extracted from the pdfs.
+    :return: A tuple containing the score and evaluation summary.
+    """
+    # Constructing the system prompt providing instructions, the source text, and evaluation criteria to evaluate model tone
+    system_prompt = f"""
+As an AI evaluator, you will be given a source body of text and an AI model's attempt to summarize that text.
+Evaluate the AI's summarization of the <source_body> provide a grade based on Tone Consistency 
+Evaluate the AI model's summary based on the provided <evaluation_criteria>
+Only perform your evaluation based on the provided <evaluation_criteria>; other criteria (Completeness, Accuracy, Logical Flow, Paragraph and Sentence Structure, Conciseness, Clarity, and Objectivity) will be evaluated in a different method.
+Respond with a score of 0-5 using the details in <evaluation_grading> as a guide
+
+
+
+<evaluation_criteria>{TONE_EVALUATION_CRITERIA}</evaluation_criteria>
+
+<evaluation_grading>{TONE_EVALUATION_GRADING}</evaluation_grading>
 
 The source body of text that the summaries are based off of:
 <source_body>
@@ -770,10 +1001,10 @@ model's summary to be evaluated:
 </summary>
 
 """
-    # Acquiring an asynchronous client for invoking the evaluation model
-    async with await get_bedrock_client() as client:
-        # Executing the model asynchronously with the constructed prompts
-        result = await model_execution(client, user_prompt, system_prompt)
+    # Acquiring the shared asynchronous client for invoking the evaluation model
+    client = await get_bedrock_client()
+    # Executing the model asynchronously with the constructed prompts
+    result = await model_execution(client, user_prompt, system_prompt, "tone")
     # Returning the result of model execution
     return result
 
@@ -841,25 +1072,187 @@ The model's output to be evaluated:
 </models_response_to_be_evaluated>
 
 """
-    # Acquiring an asynchronous client for invoking the evaluation model
-    async with await get_bedrock_client() as client:
-        # Executing the model asynchronously with the constructed prompts
-        result = await model_execution(client, user_prompt, system_prompt)
+    # Acquiring the shared asynchronous client for invoking the evaluation model
+    client = await get_bedrock_client()
+    # Executing the model asynchronously with the constructed prompts
+    result = await model_execution(client, user_prompt, system_prompt, "task")
     # Returning the result of model execution
     return result
 
 
+# Display name and static rubric of every fixed criterion, keyed by the xml tag the fused judge answers in
+JUDGE_RUBRICS = {
+    "accuracy": ("Accuracy", ACCURACY_EVALUATION_CRITERIA, ACCURACY_EVALUATION_GRADING),
+    "completeness": ("Completeness", COMPLETENESS_EVALUATION_CRITERIA, COMPLETENESS_EVALUATION_GRADING),
+    "flow": ("Logical Flow", FLOW_EVALUATION_CRITERIA, FLOW_EVALUATION_GRADING),
+    "structure": ("Paragraph and Sentence Structure", STRUCTURE_EVALUATION_CRITERIA, STRUCTURE_EVALUATION_GRADING),
+    "conciseness": ("Conciseness", CONCISENESS_EVALUATION_CRITERIA, CONCISENESS_EVALUATION_GRADING),
+    "clarity": ("Clarity", CLARITY_EVALUATION_CRITERIA, CLARITY_EVALUATION_GRADING),
+    "objectivity": ("Objectivity", OBJECTIVITY_EVALUATION_CRITERIA, OBJECTIVITY_EVALUATION_GRADING),
+    "tone": ("Tone", TONE_EVALUATION_CRITERIA, TONE_EVALUATION_GRADING),
+}
+# Every judged criterion, in the order evaluate_model_output_orchestrator consumes the results
+JUDGE_CRITERIA = ("accuracy", "completeness", "flow", "structure", "conciseness", "clarity", "objectivity", "tone",
+                  "task")
+
+
+async def eval_model_fused(model, summary, source_text, task, evaluation_criteria, evaluation_grading):
+    """
+    Evaluates a model's summary against every criterion with a single judge request.
+
+    The source text is sent once instead of once per criterion, the judge answers with one xml block per
+    criterion which parse_fused_judge_output splits back into per-criterion results.
+
+    :param model: The model being evaluated, specifically the model that generated the specific summary.
+    :param summary: The summary generated by the model, that is being evaluated.
+    :param source_text: The original source text extracted from the pdfs.
+    :param task: The task/prompt that was given to the model.
+    :param evaluation_criteria: The task adherence criteria generated for the task.
+    :param evaluation_grading: The task adherence grading scale generated for the task.
+    :return: A dict of criterion name to a tuple containing the score and evaluation summary.
+    """
+    # Constructing one section per fixed criterion, each holding its own criteria and grading scale
+    rubric_sections = "".join(f"""
+<{tag}>
+Criterion: {name}
+<evaluation_criteria>{criteria}</evaluation_criteria>
+
+<evaluation_grading>{grading}</evaluation_grading>
+</{tag}>
+""" for tag, (name, criteria, grading) in JUDGE_RUBRICS.items())
+    # Constructing the system prompt providing instructions, the source text, and every evaluation criterion
+    system_prompt = f"""
+As an AI evaluator, you will be given a source body of text, the task/instructions that were given to an AI model, and the AI model's attempt to perform that task.
+Evaluate the AI model's output against each of the criteria below. Every criterion is wrapped in its own xml tag, with its own <evaluation_criteria> and <evaluation_grading>.
+Score every criterion independently, only using that criterion's <evaluation_criteria>; the other criteria must not influence its score.
+Respond with a score of 0-5 for every criterion using the details in its <evaluation_grading> as a guide
+Be fair but critical in your assessment
+{rubric_sections}
+<task>
+Criterion: Adherence to the Task
+Evaluate how well the AI model's output followed the tasks in the <prompt_instructions>.
+If asked to count the number of sentences or paragraphs, use the following rules:
+- A sentence should end with a period (.), exclamation mark (!), or question mark (?).
+- Decimal points (e.g., 1.5), colons (:), semi-colons (;), and commas (,) should not be considered as sentence terminators.
+
+The task that was provided to the AI model:
+<prompt_instructions>
+{task}
+</prompt_instructions>
+
+<evaluation_criteria>
+{evaluation_criteria}
+</evaluation_criteria>
+
+<evaluation_grading>
+{evaluation_grading}
+</evaluation_grading>
+</task>
+
+The source body of text that the AI model operated on:
+<source_body>
+{source_text}
+</source_body>
+
+For every criterion, respond with one block named after its tag, in this order: {", ".join(f"<{tag}>" for tag in JUDGE_CRITERIA)}
+Inside each block, return your thought process for scoring that criterion in <thoughts> xml tags concisely, followed by its score (0-5) in <score> xml tags
+Make sure to only respond with a score of 0 through 5 in each <score>, no other text, only the numerical score
+
+"""
+    # Constructing the user prompt containing the model name and summary generated by the respective model to be evaluated
+    user_prompt = f"""
+<model>
+{model}
+</model>
+
+The model's output to be evaluated:
+<models_response_to_be_evaluated>
+{summary}
+</models_response_to_be_evaluated>
+
+"""
+    # Acquiring the shared asynchronous client for invoking the evaluation model
+    client = await get_bedrock_client()
+    # Executing the judge once for every criterion
+    output_text = await invoke_judge(client, user_prompt, system_prompt)
+    # Splitting the answer back into one result per criterion
+    return parse_fused_judge_output(output_text)
+
+
+def parse_fused_judge_output(output_text):
+    """
+    Splits the answer of the fused judge into per-criterion scores and evaluation summaries.
+
+    :param output_text: The output text of the fused judge request.
+    :return: A dict of criterion name to a tuple containing the score, evaluation summary and parse error (see
+    parse_judge_output), criteria missing from the answer get no score and a parse error.
+    """
+    # Find the block of every criterion in a single pass over the answer
+    blocks = extract_tags(output_text, JUDGE_CRITERIA)
+    results = {}
+    for tag in JUDGE_CRITERIA:
+        if not blocks.results[tag]:
+            logger.warning("The fused judge answer has no <%s> block", tag)
+            results[tag] = (None, "", {"criterion": tag, "error": f"no <{tag}> block",
+                                       "output": (output_text or "")[:200]})
+            continue
+        # Extract score and evaluation summary from the block
+        results[tag] = parse_judge_output(blocks.text(tag), tag)
+    return results
+
+
+def normalize_task(task):
+    """
+    Normalizes a task prompt so prompts only differing in whitespace share their grading criteria.
+
+    :param task: The task/prompt given to the models.
+    :return: The task with surrounding whitespace removed and inner whitespace collapsed to single spaces.
+    """
+    return " ".join(task.split())
+
+
 def dynamic_grading_criteria(task):
     """
     Creates an evaluation framework and grading criteria for the task/prompt that the user inputted in the UI in the "Document Summary Task" TextBox
 
+    Synchronous wrapper of dynamic_grading_criteria_async, for callers outside of an event loop.
+
+    :param task: The task/prompt that the user inputted in the UI in the "Document Summary Task" TextBox
+    :return: A tuple containing the evaluation criteria and the grading scale
+    :raises ValueError: If the judge answer has no criteria or no grading scale, e.g. when it was truncated. Only
+    complete criteria are cached.
+    """
+    async def generate():
+        async with shared_bedrock_client():
+            return await dynamic_grading_criteria_async(task)
+
+    return asyncio.run(generate())
+
+
+async def dynamic_grading_criteria_async(task):
+    """
+    Asynchronously creates an evaluation framework and grading criteria for the task/prompt given to the models.
+
     This method dynamically generates the grading criteria, system prompt, and user
     prompt based on the source text, to allow for evaluation of different aspects
     of a summary beyond just accuracy.
 
+    The criteria are generated once per normalized task (see normalize_task), judge model and
+    GRADING_CRITERIA_VERSION and stored in the response cache, later runs with the same task reuse them.
+
     :param task: The task/prompt that the user inputted in the UI in the "Document Summary Task" TextBox
-    :return: A tuple containing the score and evaluation summary
+    :return: A tuple containing the evaluation criteria and the grading scale
+    :raises ValueError: If the judge answer has no criteria or no grading scale, e.g. when it was truncated. Only
+    complete criteria are cached.
     """
+    task = normalize_task(task)
+    # Reuse the criteria generated for this task by an earlier run
+    cache_key = ResponseCache.make_key("grading_criteria", model_id=JUDGE_MODEL_ID, task=task,
+                                       version=GRADING_CRITERIA_VERSION)
+    cached = response_cache.get("grading_criteria", cache_key)
+    # Empty criteria may have been cached before they were checked, they are generated again
+    if cached is not None and cached["evaluation_criteria"] and cached["evaluation_grading"]:
+        return cached["evaluation_criteria"], cached["evaluation_grading"]
     # Constructing the system prompt providing the task that was given to the models. Using Few shot of the other task types to dynamically create an evaluation criteria
     system_prompt = f"""
 Your goal is to evaluate and compare an AI model's outputs/response
@@ -923,67 +1316,70 @@ This is the prompt/instructions that the models will be provided and that you wi
 </provided_prompt>
 """
 
-    content = [{
-        "type": "text",
-        "text": user_prompt
-    }]
-
-    prompt = {
-        "anthropic_version": "bedrock-2023-05-31",
-        "max_tokens": 10000,
-        "temperature": 0,
-        "system": system_prompt,
-        "messages": [
-            {
-                "role": "user",
-                "content": content
-            }
-        ]
-    }
-    boto3.setup_default_session(profile_name=os.getenv("profile_name"))
-
-    prompt = json.dumps(prompt)
-    # get region name form env (or default to us-east-1 if it cant)
-    try:
-        region = os.getenv("region_name")
-    except:
-        region = "us-east-1"
-
-    # create Bedrock client
-    client = boto3.client('bedrock-runtime', region)
-    # Invoking the Amazon Bedrock and the Claude 3 Sonnet model with the constructed prompt
-    response = client.invoke_model(body=prompt, modelId="anthropic.claude-3-sonnet-20240229-v1:0",
-                                   accept="application/json", contentType="application/json")
-    # Extracting and parsing the response from the AI model
-    response_body = json.loads(response.get('body').read())
-    response = response_body['content'][0]['text']
-
+    # Acquiring the shared asynchronous client and invoking the judge model with the constructed prompts
+    client = await get_bedrock_client()
+    response = await invoke_judge(client, user_prompt, system_prompt)
     eval_criteria = parse_xml(response, "evaluation_criteria").strip()
     eval_grading = parse_xml(response, "evaluation_grading").strip()
+    if not (eval_criteria and eval_grading):
+        # The answer may be a truncated or malformed one served from the judge cache, ask the judge once more
+        logger.warning("The judge answer for the task adherence criteria has no %s, generating them again",
+                       "criteria" if not eval_criteria else "grading scale")
+        response = await invoke_judge(client, user_prompt, system_prompt, use_cache=False)
+        eval_criteria = parse_xml(response, "evaluation_criteria").strip()
+        eval_grading = parse_xml(response, "evaluation_grading").strip()
+    if not (eval_criteria and eval_grading):
+        # Judging against empty criteria would score every model at random, and caching them would do so forever
+        raise ValueError(f"The judge did not return task adherence criteria and a grading scale for the task, its "
+                         f"answer starts with: {response[:200]!r}")
+    # Store the criteria with the version and judge model they were generated with
+    response_cache.put("grading_criteria", cache_key, {
+        "task": task, "model_id": JUDGE_MODEL_ID, "version": GRADING_CRITERIA_VERSION,
+        "evaluation_criteria": eval_criteria, "evaluation_grading": eval_grading})
 
     # return the evaluation_criteria and evaluation_grading strings
     return eval_criteria, eval_grading
 
 
-async def evaluate_model_output_orchestrator(source_text_data, model_name, model_summary, task, dynamic_evaluation_criteria, scale):
+async def evaluate_model_output_orchestrator(source_text_data, model_name, model_summary, task, dynamic_evaluation_criteria, scale,
+                                             judge_mode=None):
     """
     Orchestrates the evaluation of model output across multiple evaluation criteria and calculates the final evaluation score.
 
     :param source_text_data: The original source text data, extracted from the uploaded PDF.
     :param model_name: The name of the model being evaluated.
     :param model_summary: The summary generated by the respective model.
-    :return: A tuple containing the final score and a summary of all the evaluation results.
+    :param judge_mode: Optional. "per_criterion" sends one judge request per criterion, "fused" scores every
+    criterion in a single request. Defaults to DEFAULT_JUDGE_MODE.
+    :return: A tuple containing the final score, a summary of all the evaluation results and the scoring rubric. A
+    criterion whose judge output could not be parsed has no score, is left out of the final score and is listed in
+    the parse_errors of the rubric.
     """
-    # Evaluate the model output asynchronously across multiple evaluation criteria
-    result = await asyncio.gather(eval_model_accuracy(model_name, model_summary, source_text_data),
-                                  eval_model_completeness(model_name, model_summary, source_text_data),
-                                  eval_model_flow(model_name, model_summary, source_text_data),
-                                  eval_model_structure(model_name, model_summary, source_text_data),
-                                  eval_model_conciseness(model_name, model_summary, source_text_data),
-                                  eval_model_clarity(model_name, model_summary, source_text_data),
-                                  eval_model_objectivity(model_name, model_summary, source_text_data),
-                                  eval_model_tone(model_name, model_summary, source_text_data),
-                                  eval_model_task(model_name, model_summary, source_text_data, task, dynamic_evaluation_criteria, scale))
+    judge_mode = judge_mode or DEFAULT_JUDGE_MODE
+    if judge_mode not in JUDGE_MODES:
+        raise ValueError(f"Unknown judge mode {judge_mode}, expected one of {JUDGE_MODES}")
+    if judge_mode == "fused":
+        # Evaluate the model output across every evaluation criterion with a single judge request
+        fused_result = await eval_model_fused(model_name, model_summary, source_text_data, task,
+                                              dynamic_evaluation_criteria, scale)
+        result = [fused_result[criterion] for criterion in JUDGE_CRITERIA]
+    else:
+        # Evaluate the model output asynchronously across multiple evaluation criteria
+        result = await asyncio.gather(eval_model_accuracy(model_name, model_summary, source_text_data),
+                                      eval_model_completeness(model_name, model_summary, source_text_data),
+                                      eval_model_flow(model_name, model_summary, source_text_data),
+                                      eval_model_structure(model_name, model_summary, source_text_data),
+                                      eval_model_conciseness(model_name, model_summary, source_text_data),
+                                      eval_model_clarity(model_name, model_summary, source_text_data),
+                                      eval_model_objectivity(model_name, model_summary, source_text_data),
+                                      eval_model_tone(model_name, model_summary, source_text_data),
+                                      eval_model_task(model_name, model_summary, source_text_data, task, dynamic_evaluation_criteria, scale))
+    # Collect the criteria whose judge output could not be parsed, they are left out of the final score
+    parse_errors = [parse_error for _, _, parse_error in result if parse_error is not None]
+    scores = dict(zip(JUDGE_CRITERIA, (score for score, _, _ in result)))
+    # Show a failed criterion with its error in the summary instead of its missing thoughts
+    result = [(score, summary) if parse_error is None else ("n/a", f"{summary}\n(Not scored: {parse_error['error']})")
+              for score, summary, parse_error in result]
     # Extract individual evaluation scores and summaries from the result
     model_accuracy_score, model_accuracy_summary = result[0]
     model_completeness_score, model_completeness_summary = result[1]
@@ -995,23 +1391,23 @@ async def evaluate_model_output_orchestrator(source_text_data, model_name, model
     model_tone_score, model_tone_summary = result[7]
     model_task_score, model_task_summary = result[8]
     # Construct a dictionary containing individual evaluation scores
+    # A criterion that could not be scored is None, and listed with its error in parse_errors
     final_score_rubric = {
         "model_name": model_name,
-        "model_completeness_score": model_completeness_score,
-        "model_accuracy_score": model_accuracy_score,
-        "model_flow_score": model_flow_score,
-        "model_structure_score": model_structure_score,
-        "model_conciseness_score": model_conciseness_score,
-        "model_clarity_score": model_clarity_score,
-        "model_objectivity_score": model_objectivity_score,
-        "model_tone_score": model_tone_score,
-        "model_task_score": model_task_score
+        "model_completeness_score": scores["completeness"],
+        "model_accuracy_score": scores["accuracy"],
+        "model_flow_score": scores["flow"],
+        "model_structure_score": scores["structure"],
+        "model_conciseness_score": scores["conciseness"],
+        "model_clarity_score": scores["clarity"],
+        "model_objectivity_score": scores["objectivity"],
+        "model_tone_score": scores["tone"],
+        "model_task_score": scores["task"],
+        "parse_errors": parse_errors
     }
-    # Calculate the final score
-    final_score = (int(model_completeness_score) + int(model_accuracy_score) + int(model_flow_score) + int(
-        model_structure_score) +
-                   int(model_conciseness_score) + int(model_clarity_score) + int(model_objectivity_score) + int(
-                model_tone_score) + int(model_task_score)) / 9.0
+    # Calculate the final score over the criteria that were scored, None if none was
+    valid_scores = [score for score in scores.values() if score is not None]
+    final_score = sum(valid_scores) / len(valid_scores) if valid_scores else None
 
     # Construct a summary of the evaluation results
     final_summary = f"""
@@ -0,0 +1,187 @@
+import logging
+import re
+
+# The parser has no configuration, it only logs the answers it could not parse
+logger = logging.getLogger(__name__)
+
+# An opening, closing or self-closing tag, compiled once for every extractor
+TAG_PATTERN = re.compile(r"<(/?)([A-Za-z_][\w.\-]*)[^<>]*>")
+# A "<" not followed by ">" within this many characters is text, not the start of a tag
+MAX_TAG_LENGTH = 256
+# The numbers of a score, e.g. "3" or "4.0"
+NUMBER_PATTERN = re.compile(r"-?\d+(?:\.\d+)?")
+# The range of the judge scores
+MIN_SCORE, MAX_SCORE = 0, 5
+
+
+class TagExtractor:
+    """
+    Single-pass, incremental extractor of the content of xml-like tags in model output.
+
+    The output can be fed in chunks, e.g. as it is streamed, and is scanned once whatever the number of tags
+    extracted. Only the outermost occurrence of a tag is captured, nested occurrences of the same tag and any other
+    markup are kept in its content. Tags are matched case-insensitively and independently of each other, so
+    misordered closing tags do not lose content. Stray closing tags and tags left open at the end are reported in
+    errors instead of raising, an unclosed tag still yields the content received so far.
+    """
+
+    def __init__(self, tags):
+        """
+        Initializes an instance of the TagExtractor class.
+
+        :param tags: The names of the tags to extract.
+        """
+        self.tags = frozenset(tag.lower() for tag in tags)
+        self.results = {tag: [] for tag in self.tags}
+        self.errors = []
+        # Tag name to [nesting depth, content pieces] of the tags currently open
+        self._open = {}
+        # The end of the previous chunk that may be the start of a tag
+        self._pending = ""
+        self._closed = False
+
+    def feed(self, chunk):
+        """
+        Scans the next chunk of the output.
+
+        :param chunk: The text of the chunk.
+        :return: The extractor, so calls can be chained.
+        """
+        text = self._pending + chunk if self._pending else chunk
+        self._pending = ""
+        position = 0
+        length = len(text)
+        while position < length:
+            start = text.find("<", position)
+            if start == -1:
+                self._append(text[position:])
+                break
+            self._append(text[position:start])
+            # Only look for the end of the tag close to its start, so a stray "<" costs a bounded scan
+            end = text.find(">", start + 1, start + MAX_TAG_LENGTH)
+            if end == -1:
+                if length - start < MAX_TAG_LENGTH and "<" not in text[start + 1:]:
+                    # The tag may continue in the next chunk
+                    self._pending = text[start:]
+                    break
+                self._append("<")
+                position = start + 1
+                continue
+            match = TAG_PATTERN.fullmatch(text, start, end + 1)
+            if match is None:
+                # Not a tag, e.g. "a < b" or "<5>"
+                self._append("<")
+                position = start + 1
+                continue
+            self._handle_tag(match.group(1) == "/", match.group(2).lower(), match.group(0))
+            position = end + 1
+        return self
+
+    def close(self):
+        """
+        Ends the output, reporting the tags left open.
+
+        :return: The extractor, so calls can be chained.
+        """
+        if self._closed:
+            return self
+        self._closed = True
+        if self._pending:
+            pending, self._pending = self._pending, ""
+            self._append(pending)
+        for tag, (depth, pieces) in self._open.items():
+            self.errors.append(f"<{tag}> is not closed")
+            self.results[tag].append("".join(pieces))
+        self._open = {}
+        return self
+
+    def text(self, tag):
+        """
+        Returns the content of every occurrence of a tag, joined with spaces.
+
+        :param tag: The tag name.
+        :return: The stripped content, or an empty string if the tag was not found.
+        """
+        return " ".join(self.results[tag.lower()]).strip()
+
+    def _append(self, text):
+        # Add text to the content of every tag currently open
+        if text:
+            for depth, pieces in self._open.values():
+                pieces.append(text)
+
+    def _handle_tag(self, closing, tag, raw):
+        if tag not in self.tags or raw.endswith("/>"):
+            # Markup inside the content of the extracted tags
+            self._append(raw)
+            return
+        state = self._open.get(tag)
+        if not closing:
+            if state is None:
+                # The content of the other open tags includes this tag, its own content starts after it
+                self._append(raw)
+                self._open[tag] = [1, []]
+            else:
+                state[0] += 1
+                self._append(raw)
+        elif state is None:
+            self.errors.append(f"</{tag}> has no opening tag")
+            self._append(raw)
+        elif state[0] > 1:
+            state[0] -= 1
+            self._append(raw)
+        else:
+            del self._open[tag]
+            self.results[tag].append("".join(state[1]))
+            self._append(raw)
+
+
+def extract_tags(text, tags):
+    """
+    Extracts the content of several tags from a complete output in a single pass.
+
+    :param text: The output text.
+    :param tags: The names of the tags to extract.
+    :return: The closed TagExtractor, see TagExtractor.text, results and errors.
+    """
+    return TagExtractor(tags).feed(text or "").close()
+
+
+def parse_score(text):
+    """
+    Parses a judge score.
+
+    :param text: The content of the <score> tag.
+    :return: A tuple containing the score as an int, or None, and the reason it could not be parsed, or None.
+    """
+    # Ignore any markup left in the score, e.g. a nested tag
+    numbers = NUMBER_PATTERN.findall(TAG_PATTERN.sub(" ", text))
+    if not numbers:
+        return None, f"no number in score {text[:50]!r}" if text.strip() else "empty score"
+    score = float(numbers[0])
+    if not score.is_integer() or not MIN_SCORE <= score <= MAX_SCORE:
+        return None, f"score {numbers[0]} is not an integer from {MIN_SCORE} to {MAX_SCORE}"
+    return int(score), None
+
+
+def parse_judge_output(output_text, criterion):
+    """
+    Parses the score and thoughts of one judged criterion, without raising on a malformed answer.
+
+    :param output_text: The judge output, or the block of the criterion in a fused judge output.
+    :param criterion: The criterion the output belongs to, used in the error.
+    :return: A tuple containing the score (an int from 0 to 5, or None if it could not be parsed), the thoughts and
+    a parse error, None or a dict with the criterion, the error message and the start of the output.
+    """
+    extractor = extract_tags(output_text, ("score", "thoughts"))
+    thoughts = extractor.text("thoughts")
+    if not extractor.results["score"]:
+        score, error = None, "no <score> tag"
+    else:
+        score, error = parse_score(extractor.text("score"))
+    if error is None:
+        return score, thoughts, None
+    # Keep the tag errors, they usually explain a missing score
+    message = "; ".join([error] + extractor.errors)
+    logger.warning("Could not parse the %s score: %s", criterion, message)
+    return None, thoughts, {"criterion": criterion, "error": message, "output": (output_text or "")[:200]}
@@ -34,7 +34,7 @@ def fetch_knowledge_bases():
 
         knowledge_base_summaries = response['knowledgeBaseSummaries']
     except ClientError as e:
-        print(f"Couldn't list knowledge bases: {e}")
+        logger.error("Couldn't list knowledge bases: %s", e)
         raise
     else:
         return knowledge_base_summaries
@@ -45,7 +45,7 @@ def get_knowledge_base(knowledgeBaseId):
 
         knowledge_base = response['knowledgeBase']
     except ClientError as e:
-        print(f"Couldn't get knowledge base: {e}")
+        logger.error("Couldn't get knowledge base: %s", e)
         raise
     else:
         return knowledge_base
\ No newline at end of file
@@ -0,0 +1,317 @@
+import functools
+import json
+import logging
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+class ProviderAdapter:
+    """
+    Describes how to talk to one family of Amazon Bedrock text models: how the request body is built, and how the
+    output text and token counts are read back from the response.
+    """
+    # The substring of the model ID identifying the provider, e.g. "anthropic" in anthropic.claude-3-haiku-...
+    provider = None
+    # Whether the request is sent with explicit JSON accept and content type headers
+    send_content_headers = True
+    # Whether the provider's models can be invoked with invoke_model_with_response_stream
+    supports_streaming = True
+    # Context window in tokens assumed for the provider's models missing from MODEL_CONTEXT_WINDOWS
+    default_context_window = 4096
+
+    def format_prompt(self, prompt, prompt_context):
+        """
+        Combines the task prompt with the source text.
+
+        :param prompt: The prompt highlighting the task the model is trying to perform.
+        :param prompt_context: The prompt context, i.e. the extracted text from the PDF file.
+        :return: The prompt sent to the model.
+        """
+        # If prompt_context is provided, append it to the prompt
+        if prompt_context:
+            return f"{prompt} \n\n <context>{prompt_context}</context>"
+        return prompt
+
+    def build_request(self, prompt, max_tokens):
+        """
+        Builds the JSON request body for the provider.
+
+        :param prompt: The formatted prompt.
+        :param max_tokens: The maximum number of tokens to generate.
+        :return: The request body as a dictionary.
+        """
+        raise NotImplementedError
+
+    def parse_response(self, response, response_body):
+        """
+        Extracts the output text and token counts from an invoke_model response.
+
+        :param response: The raw invoke_model response, holding the HTTP headers.
+        :param response_body: The decoded JSON body of the response.
+        :return: A tuple containing the output text, the number of input tokens and the number of output tokens.
+        """
+        raise NotImplementedError
+
+    def parse_stream_chunk(self, chunk):
+        """
+        Extracts the generated text from one chunk of an invoke_model_with_response_stream response.
+
+        :param chunk: The decoded JSON of the chunk.
+        :return: The text generated in the chunk, or an empty string if it carries none.
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def header_token_counts(response):
+        """
+        Reads the token counts Bedrock returns in the response headers, for providers that do not report them in the
+        body.
+
+        :param response: The raw invoke_model response.
+        :return: A tuple containing the number of input tokens and the number of output tokens.
+        """
+        headers = response['ResponseMetadata']['HTTPHeaders']
+        return (int(headers['x-amzn-bedrock-input-token-count']),
+                int(headers['x-amzn-bedrock-output-token-count']))
+
+
+class AnthropicAdapter(ProviderAdapter):
+    """
+    Anthropic models, using the messages API structure.
+    """
+    provider = "anthropic"
+    default_context_window = 100000
+    send_content_headers = False
+
+    def format_prompt(self, prompt, prompt_context):
+        # If prompt_context is provided, wrap the prompt and context in the Human/Assistant turns
+        if prompt_context:
+            return f"Human: \n\n {prompt} \n\n <context>{prompt_context}</context> \n Assistant: \n\n"
+        return prompt
+
+    def build_request(self, prompt, max_tokens):
+        return {
+            "anthropic_version": "bedrock-2023-05-31",
+            "max_tokens": max_tokens,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": prompt,
+                        }
+                    ],
+                }
+            ],
+        }
+
+    def parse_response(self, response, response_body):
+        return (response_body["content"][0]["text"], response_body["usage"]["input_tokens"],
+                response_body["usage"]["output_tokens"])
+
+    def parse_stream_chunk(self, chunk):
+        # Only the content block deltas carry text, the other events describe the message
+        if chunk.get("type") == "content_block_delta":
+            return chunk["delta"].get("text", "")
+        return ""
+
+
+class MistralAdapter(ProviderAdapter):
+    """
+    Mistral models.
+    """
+    provider = "mistral"
+    default_context_window = 32000
+
+    def build_request(self, prompt, max_tokens):
+        return {"prompt": prompt, "max_tokens": max_tokens, "temperature": 0, "top_k": 200, "top_p": 0.5}
+
+    def parse_response(self, response, response_body):
+        return (response_body['outputs'][0]['text'], *self.header_token_counts(response))
+
+    def parse_stream_chunk(self, chunk):
+        return chunk['outputs'][0]['text'] if chunk.get('outputs') else ""
+
+
+class MetaAdapter(ProviderAdapter):
+    """
+    Meta Llama models.
+    """
+    provider = "meta"
+    default_context_window = 4096
+
+    def build_request(self, prompt, max_tokens):
+        return {"prompt": prompt, "max_gen_len": max_tokens, "temperature": 0.5, "top_p": 0.5}
+
+    def parse_response(self, response, response_body):
+        return (response_body['generation'], response_body['prompt_token_count'],
+                response_body['generation_token_count'])
+
+    def parse_stream_chunk(self, chunk):
+        return chunk.get('generation') or ""
+
+
+class CohereAdapter(ProviderAdapter):
+    """
+    Cohere Command models.
+    """
+    provider = "cohere"
+    default_context_window = 4096
+
+    def build_request(self, prompt, max_tokens):
+        return {"prompt": prompt, "max_tokens": max_tokens, "temperature": 0.5}
+
+    def parse_response(self, response, response_body):
+        return (response_body['generations'][0]['text'], *self.header_token_counts(response))
+
+    def parse_stream_chunk(self, chunk):
+        return chunk['generations'][0]['text'] if chunk.get('generations') else chunk.get('text', "")
+
+
+class AmazonAdapter(ProviderAdapter):
+    """
+    Amazon Titan text models.
+    """
+    provider = "amazon"
+    default_context_window = 4096
+
+    def build_request(self, prompt, max_tokens):
+        return {"inputText": prompt,
+                "textGenerationConfig": {
+                    "maxTokenCount": max_tokens,
+                    "stopSequences": [],
+                    "temperature": 0.5,
+                    "topP": 0.5
+                }}
+
+    def parse_response(self, response, response_body):
+        return (response_body['results'][0]['outputText'], response_body['inputTextTokenCount'],
+                response_body['results'][0]['tokenCount'])
+
+    def parse_stream_chunk(self, chunk):
+        return chunk.get('outputText') or ""
+
+
+class AI21Adapter(ProviderAdapter):
+    """
+    AI21 Jurassic models, Bedrock does not stream them so they are always invoked with invoke_model.
+    """
+    provider = "ai21"
+    default_context_window = 8191
+    supports_streaming = False
+
+    def build_request(self, prompt, max_tokens):
+        return {"prompt": prompt, "maxTokens": max_tokens, "temperature": 0.5, "topP": 0.5, "stopSequences": []}
+
+    def parse_response(self, response, response_body):
+        return (response_body['completions'][0]['data']['text'], *self.header_token_counts(response))
+
+
+# Context window in tokens (input and output) of the known text models, other models get their provider's default
+MODEL_CONTEXT_WINDOWS = {
+    'anthropic.claude-instant-v1': 100000,
+    'anthropic.claude-v2': 100000,
+    'anthropic.claude-v2:1': 200000,
+    'anthropic.claude-3-sonnet-20240229-v1:0': 200000,
+    'anthropic.claude-3-haiku-20240307-v1:0': 200000,
+    'anthropic.claude-3-opus-20240229-v1:0': 200000,
+    'anthropic.claude-3-5-sonnet-20240620-v1:0': 200000,
+    'anthropic.claude-3-5-sonnet-20241022-v2:0': 200000,
+    'anthropic.claude-3-5-haiku-20241022-v1:0': 200000,
+    'anthropic.claude-3-7-sonnet-20250219-v1:0': 200000,
+    'anthropic.claude-sonnet-4-20250514-v1:0': 200000,
+    'anthropic.claude-opus-4-20250514-v1:0': 200000,
+    'mistral.mistral-7b-instruct-v0:2': 32000,
+    'mistral.mixtral-8x7b-instruct-v0:1': 32000,
+    'mistral.mistral-large-2402-v1:0': 32000,
+    'mistral.mistral-large-2407-v1:0': 128000,
+    'mistral.mistral-small-2402-v1:0': 32000,
+    'meta.llama2-13b-chat-v1': 4096,
+    'meta.llama2-70b-chat-v1': 4096,
+    'meta.llama3-8b-instruct-v1:0': 8192,
+    'meta.llama3-70b-instruct-v1:0': 8192,
+    'meta.llama3-1-8b-instruct-v1:0': 128000,
+    'meta.llama3-1-70b-instruct-v1:0': 128000,
+    'meta.llama3-1-405b-instruct-v1:0': 128000,
+    'meta.llama3-2-1b-instruct-v1:0': 128000,
+    'meta.llama3-2-3b-instruct-v1:0': 128000,
+    'meta.llama3-2-11b-instruct-v1:0': 128000,
+    'meta.llama3-2-90b-instruct-v1:0': 128000,
+    'cohere.command-text-v14': 4096,
+    'cohere.command-light-text-v14': 4096,
+    'cohere.command-r-v1:0': 128000,
+    'cohere.command-r-plus-v1:0': 128000,
+    'amazon.titan-text-lite-v1': 4096,
+    'amazon.titan-text-express-v1': 8192,
+    'amazon.titan-text-premier-v1:0': 32000,
+    'ai21.j2-mid-v1': 8191,
+    'ai21.j2-ultra-v1': 8191,
+}
+
+# Registry of the supported providers, in the order model IDs are matched against them
+PROVIDER_ADAPTERS = {
+    adapter.provider: adapter
+    for adapter in (AnthropicAdapter(), MistralAdapter(), MetaAdapter(), CohereAdapter(), AmazonAdapter(),
+                    AI21Adapter())
+}
+
+
+def get_adapter(model_id):
+    """
+    Returns the adapter able to invoke a text model.
+
+    :param model_id: The ID of the model.
+    :return: The matching ProviderAdapter, or None for unsupported providers and image or embedding models.
+    """
+    # Image and embedding models do not produce text to evaluate
+    if "stability" in model_id or "embed" in model_id:
+        return None
+    for provider, adapter in PROVIDER_ADAPTERS.items():
+        if provider in model_id:
+            return adapter
+    return None
+
+
+def get_context_window(model_id):
+    """
+    Returns the context window of a text model.
+
+    :param model_id: The ID of the model.
+    :return: The number of tokens the model accepts, prompt and generated output included.
+    """
+    if model_id in MODEL_CONTEXT_WINDOWS:
+        return MODEL_CONTEXT_WINDOWS[model_id]
+    # Cross-region inference profiles (e.g. "us.anthropic...") have the window of the model they route to
+    if model_id.count(".") > 1 and model_id.split(".", 1)[1] in MODEL_CONTEXT_WINDOWS:
+        return MODEL_CONTEXT_WINDOWS[model_id.split(".", 1)[1]]
+    adapter = get_adapter(model_id)
+    context_window = adapter.default_context_window if adapter else ProviderAdapter.default_context_window
+    _warn_unknown_context_window(model_id, context_window)
+    return context_window
+
+
+@functools.lru_cache(maxsize=None)
+def _warn_unknown_context_window(model_id, context_window):
+    # Warn once per model, a default smaller than the real window splits documents that would fit
+    logger.warning("No context window known for %s, assuming %d tokens, add it to MODEL_CONTEXT_WINDOWS", model_id,
+                   context_window)
+
+
+def build_invoke_arguments(adapter, model_id, prompt, prompt_context, max_tokens):
+    """
+    Builds the keyword arguments of a bedrock-runtime invoke_model call.
+
+    :param adapter: The adapter of the model's provider.
+    :param model_id: The ID of the model to invoke.
+    :param prompt: The prompt highlighting the task the model is trying to perform.
+    :param prompt_context: The prompt context, i.e. the extracted text from the PDF file.
+    :param max_tokens: The maximum number of tokens to generate.
+    :return: A dictionary of invoke_model keyword arguments.
+    """
+    request_body = adapter.build_request(adapter.format_prompt(prompt, prompt_context), max_tokens)
+    invoke_arguments = {"modelId": model_id, "body": json.dumps(request_body)}
+    if adapter.send_content_headers:
+        invoke_arguments.update(accept='application/json', contentType='application/json')
+    return invoke_arguments
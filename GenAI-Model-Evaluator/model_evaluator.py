@@ -0,0 +1,230 @@
+"""
+Headless command line and library entry point of the Model Evaluator.
+
+Runs the same evaluations as the Streamlit app without importing Streamlit. The evaluator modules are only imported
+by the command that needs them, LangChain and RAGAS only by the RAG evaluation, and matplotlib only when png charts
+are drawn, so a batch run starts fast in a small container. Results are written as JSON (to stdout by default) or
+Parquet, logs go to stderr.
+
+Usage:
+    python -m model_evaluator run --pdf document.pdf \
+        --models anthropic.claude-3-haiku-20240307-v1:0 meta.llama3-8b-instruct-v1:0 --output results.json
+    python -m model_evaluator rag --questions questions.csv --ground-truths answers.csv \
+        --knowledge-bases KBID1 KBID2 --output rag_results.parquet --charts none
+    python -m model_evaluator corpus --corpus documents/ --models anthropic.claude-3-haiku-20240307-v1:0
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import sys
+from dotenv import load_dotenv
+
+# Setting up a logger with default settings
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+# Loading environment variables from a .env file
+load_dotenv()
+
+# The chart formats of the reports, see plotting_and_reporting.CHART_FORMAT
+CHART_FORMATS = ("png", "html", "none")
+# The judge modes, see evaluation_steps.JUDGE_MODES (not imported, so --help stays fast)
+JUDGE_MODES = ("per_criterion", "fused")
+
+
+def records(df):
+    """
+    Converts a DataFrame to JSON-serializable records, NaN and numpy values included.
+
+    :param df: The DataFrame.
+    :return: A list with a dict per row.
+    """
+    return json.loads(df.to_json(orient="records", default_handler=str))
+
+
+def write_json(output, document, stdout=None):
+    """
+    Writes a JSON document to a file, or to stdout.
+
+    :param output: The output path, or "-" for stdout.
+    :param document: The JSON-serializable document.
+    :param stdout: Optional. The stream of "-", defaults to sys.stdout.
+    :return: The paths written, empty when the JSON went to stdout.
+    """
+    if output == "-":
+        stdout = stdout or sys.stdout
+        json.dump(document, stdout, indent=2)
+        stdout.write("\n")
+        stdout.flush()
+        return []
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(document, file, indent=2)
+    return [output]
+
+
+def write_results(output, results_df, score_rubric_df, evaluation_results, cost_evaluation, report_dir, stdout=None):
+    """
+    Writes the results of an evaluation as JSON or Parquet.
+
+    :param output: The output path. A .parquet path writes the results to it and the scoring rubric next to it, to
+    <name>.rubric.parquet. Any other path, or "-" for stdout, gets a single JSON document.
+    :param results_df: The performance and cost results, one row per model or knowledge base.
+    :param score_rubric_df: The scoring rubric, one row per model or knowledge base.
+    :param evaluation_results: The written summary of the evaluation.
+    :param cost_evaluation: The evaluation of the costs for model selection.
+    :param report_dir: The directory the reports and charts of the run were written to.
+    :param stdout: Optional. The stream of "-", defaults to sys.stdout.
+    :return: The paths written, empty when the JSON went to stdout.
+    """
+    if output.endswith(".parquet"):
+        rubric_output = output[:-len(".parquet")] + ".rubric.parquet"
+        results_df.to_parquet(output, index=False)
+        score_rubric_df.to_parquet(rubric_output, index=False)
+        return [output, rubric_output]
+    return write_json(output, {
+        "report_dir": report_dir,
+        "results": records(results_df),
+        "scores": records(score_rubric_df),
+        "summary": evaluation_results,
+        "cost_evaluation": cost_evaluation,
+    }, stdout)
+
+
+def run_command(args):
+    """
+    Evaluates the candidate models on one PDF, see orchestrator.final_evaluator.
+    """
+    from orchestrator import final_evaluator
+    from plotting_and_reporting import create_run_directory
+
+    report_dir = args.report_dir or create_run_directory()
+    results_df, evaluation_results, cost_evaluation, score_rubric_df = final_evaluator(
+        args.pdf, args.models, task_prompt=args.task, max_tokens=str(args.max_tokens), concurrent=args.concurrent,
+        judge_mode=args.judge_mode, use_cache=False if args.no_cache else None, trials=args.trials,
+        warmup=args.warmup, report_dir=report_dir, chart_format=args.charts)
+    return write_results(args.output, results_df, score_rubric_df, evaluation_results, cost_evaluation, report_dir,
+                         args.stdout)
+
+
+def knowledge_base_config(knowledge_base_id):
+    """
+    Describes a knowledge base the way final_rag_evaluator expects it.
+
+    :param knowledge_base_id: The ID of the knowledge base.
+    :return: A dict with the id, name and embedding_model_arn of the knowledge base.
+    """
+    from knowledge_base_fetcher import get_knowledge_base
+
+    knowledge_base = get_knowledge_base(knowledge_base_id)
+    vector_configuration = knowledge_base["knowledgeBaseConfiguration"]["vectorKnowledgeBaseConfiguration"]
+    return {"id": knowledge_base["knowledgeBaseId"], "name": knowledge_base["name"],
+            "embedding_model_arn": vector_configuration["embeddingModelArn"]}
+
+
+def rag_command(args):
+    """
+    Evaluates knowledge bases on a question set, see orchestrator.final_rag_evaluator.
+    """
+    from orchestrator import final_rag_evaluator
+    from plotting_and_reporting import create_run_directory
+
+    knowledge_bases = [knowledge_base_config(knowledge_base_id) for knowledge_base_id in args.knowledge_bases]
+    report_dir = args.report_dir or create_run_directory()
+    results_df, evaluation_results, cost_evaluation, score_rubric_df = final_rag_evaluator(
+        args.questions, args.ground_truths, knowledge_bases, question_concurrency=args.question_concurrency,
+        replay=True if args.replay else None, report_dir=report_dir, chart_format=args.charts)
+    return write_results(args.output, results_df, score_rubric_df, evaluation_results, cost_evaluation, report_dir,
+                         args.stdout)
+
+
+def corpus_command(args):
+    """
+    Evaluates the candidate models over a corpus, see corpus_evaluator.final_corpus_evaluator.
+    """
+    from corpus_evaluator import DEFAULT_CORPUS_OUTPUT, final_corpus_evaluator
+
+    corpus_output = args.corpus_output or DEFAULT_CORPUS_OUTPUT
+    _, summary_df = final_corpus_evaluator(
+        args.corpus, args.models, task_prompt=args.task, max_tokens=str(args.max_tokens),
+        output_path=corpus_output, requests_per_second=args.requests_per_second, judge_mode=args.judge_mode,
+        documents_per_day=args.documents_per_day)
+    # The per-document results are already in corpus_output, only the aggregate statistics are emitted
+    if args.output.endswith(".parquet"):
+        summary_df.to_parquet(args.output, index=False)
+        return [args.output]
+    return write_json(args.output, {"corpus_output": corpus_output, "summary": records(summary_df)}, args.stdout)
+
+
+def build_parser():
+    """
+    Builds the command line parser.
+
+    :return: The argparse parser, with a run, rag and corpus command.
+    """
+    parser = argparse.ArgumentParser(prog="model_evaluator", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    # Options shared by the commands that evaluate candidate models
+    candidates = argparse.ArgumentParser(add_help=False)
+    candidates.add_argument("--models", nargs="+", required=True, help="Candidate model IDs")
+    candidates.add_argument("--task", default="Summarize this document in 2 sentences.", help="Task prompt")
+    candidates.add_argument("--max-tokens", default=4096, type=int, help="Maximum tokens of the candidate outputs")
+    candidates.add_argument("--judge-mode", choices=JUDGE_MODES, help="Judge mode, defaults to judge_mode")
+    # Options shared by every command
+    outputs = argparse.ArgumentParser(add_help=False)
+    outputs.add_argument("--output", default="-",
+                         help="Results file, .json or .parquet, defaults to JSON on stdout")
+
+    run = commands.add_parser("run", parents=[candidates, outputs], help="Evaluate models on one PDF")
+    run.add_argument("--pdf", required=True, help="PDF document to evaluate the models on")
+    run.add_argument("--concurrent", action="store_true", help="Invoke and judge every model at the same time")
+    run.add_argument("--trials", default=1, type=int, help="Invocations per model in benchmark mode")
+    run.add_argument("--warmup", default=0, type=int, help="Discarded warm-up invocations per model")
+    run.add_argument("--no-cache", action="store_true", help="Bypass the response cache")
+    run.add_argument("--report-dir", help="Directory of the reports and charts, defaults to a new run directory")
+    run.add_argument("--charts", choices=CHART_FORMATS, help="Chart format, defaults to report_chart_format")
+    run.set_defaults(handler=run_command)
+
+    rag = commands.add_parser("rag", parents=[outputs], help="Evaluate knowledge bases on a question set")
+    rag.add_argument("--questions", required=True, help="CSV file of the questions")
+    rag.add_argument("--ground-truths", required=True, help="CSV file of the expected answers")
+    rag.add_argument("--knowledge-bases", nargs="+", required=True, help="Knowledge base IDs")
+    rag.add_argument("--question-concurrency", type=int, help="Questions answered at the same time")
+    rag.add_argument("--replay", action="store_true", help="Only re-run the scoring from the recorded answers")
+    rag.add_argument("--report-dir", help="Directory of the reports and charts, defaults to a new run directory")
+    rag.add_argument("--charts", choices=CHART_FORMATS, help="Chart format, defaults to report_chart_format")
+    rag.set_defaults(handler=rag_command)
+
+    corpus = commands.add_parser("corpus", parents=[candidates, outputs], help="Evaluate models over many PDFs")
+    corpus.add_argument("--corpus", required=True, help="Directory of PDFs, or a .txt or .csv manifest")
+    corpus.add_argument("--corpus-output", help="Per-document results, a .csv file or a Parquet directory")
+    corpus.add_argument("--requests-per-second", type=float, help="Global cap on the Bedrock calls per second")
+    corpus.add_argument("--documents-per-day", type=int, help="Project the daily and monthly costs at this volume")
+    corpus.set_defaults(handler=corpus_command)
+    return parser
+
+
+def main(argv=None):
+    """
+    Runs the command line.
+
+    :param argv: Optional. The arguments, defaults to sys.argv.
+    :return: None
+    """
+    args = build_parser().parse_args(argv)
+    # Logs go to stderr. The evaluator modules log instead of printing, and anything a dependency still prints is
+    # redirected to stderr too, so stdout only carries the JSON results and can be piped to jq
+    logging.basicConfig(stream=sys.stderr, format="%(asctime)s %(levelname)s %(message)s")
+    if args.output != "-" and os.path.dirname(args.output):
+        os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    args.stdout = sys.stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        paths = args.handler(args)
+    for path in paths:
+        logger.info("Results written to %s", path)
+
+
+if __name__ == "__main__":
+    main()
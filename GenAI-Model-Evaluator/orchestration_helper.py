@@ -4,7 +4,8 @@ class OrchestrationHelper:
     """
 
     def __init__(self, model, time_length, character_count, char_process_time, input_cost, output_cost, total_cost, total_cost_1000,
-                 final_score, summary_invoke_response, final_summary):
+                 final_score, summary_invoke_response, final_summary, stream_metrics=None, latency_stats=None,
+                 map_reduce_stats=None, input_tokens=None, output_tokens=None):
         """
         Initializes an instance of the OrchestrationHelper class.
         :param model: The model being evaluated.
@@ -18,6 +19,14 @@ class OrchestrationHelper:
         :param final_score: The final score of the models summary performance.
         :param summary_invoke_response: The summary provided from the model being tested.
         :param final_summary: The final summary of the models overall performance.
+        :param stream_metrics: Optional. The time to first token, inter-token latency percentiles and tokens per second
+        measured while streaming the summary, None if the model was not streamed.
+        :param latency_stats: Optional. The number of trials, p50/p90/p99 latency and its standard deviation when the
+        model was benchmarked over repeated trials.
+        :param map_reduce_stats: Optional. The number of chunks, and the cost and time of the map and reduce steps when
+        the text was summarized with map-reduce.
+        :param input_tokens: Optional. The number of input tokens of one invocation, averaged over the trials.
+        :param output_tokens: Optional. The number of output tokens of one invocation, averaged over the trials.
         """
         self.model = model
         self.time_length = time_length
@@ -30,6 +39,11 @@ class OrchestrationHelper:
         self.final_score = final_score
         self.summary_invoke_response = summary_invoke_response
         self.final_summary = final_summary
+        self.stream_metrics = stream_metrics or {}
+        self.latency_stats = latency_stats or {}
+        self.map_reduce_stats = map_reduce_stats or {}
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
 
     def format(self):
         """
@@ -43,11 +57,28 @@ class OrchestrationHelper:
                 'Time Length': self.time_length,
                 'Character Count': self.character_count,
                 'Char Process Time': self.char_process_time,
+                'Input Tokens': self.input_tokens,
+                'Output Tokens': self.output_tokens,
                 'Input Cost': self.input_cost,
                 'Output Cost': self.output_cost,
                 'Total Cost': self.total_cost,
                 'Total Cost(1000)': self.total_cost_1000,
                 'Summary Score': self.final_score,
+                'Time To First Token': self.stream_metrics.get('time_to_first_token'),
+                'Inter Token Latency P50': self.stream_metrics.get('inter_token_latency_p50'),
+                'Inter Token Latency P90': self.stream_metrics.get('inter_token_latency_p90'),
+                'Inter Token Latency P99': self.stream_metrics.get('inter_token_latency_p99'),
+                'Tokens Per Second': self.stream_metrics.get('tokens_per_second'),
+                'Trials': self.latency_stats.get('trials', 1),
+                'Latency P50': self.latency_stats.get('latency_p50'),
+                'Latency P90': self.latency_stats.get('latency_p90'),
+                'Latency P99': self.latency_stats.get('latency_p99'),
+                'Latency Std': self.latency_stats.get('latency_std'),
+                'Chunks': self.map_reduce_stats.get('chunks', 1),
+                'Map Cost': self.map_reduce_stats.get('map_cost'),
+                'Reduce Cost': self.map_reduce_stats.get('reduce_cost'),
+                'Map Time': self.map_reduce_stats.get('map_time'),
+                'Reduce Time': self.map_reduce_stats.get('reduce_time'),
                 'Invoke Response': self.summary_invoke_response
             }
         # returning the final dictionary
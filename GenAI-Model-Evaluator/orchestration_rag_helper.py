@@ -6,7 +6,7 @@ class OrchestrationRAGHelper:
     def __init__(self, model, time_length, embedding_character_count, llm_character_count, char_process_time, input_embedding_cost,
                  output_embedding_cost, total_embedding_cost, total_embedding_cost_1000, input_llm_cost,
                  output_llm_cost, total_llm_cost, total_llm_cost_1000,
-                 final_score, answers_response, final_summary):
+                 final_score, answers_response, final_summary, wall_time_length=None, latency_stats=None):
         """
         Initializes an instance of the OrchestrationHelper class.
         :param model: The model being evaluated.
@@ -25,6 +25,10 @@ class OrchestrationRAGHelper:
         :param final_score: The final score of the models performance.
         :param answers_response: The answers provided from the model being tested.
         :param final_summary: The final summary of the models overall performance.
+        :param wall_time_length: Optional. The wall time taken to answer every question, they are answered
+        concurrently.
+        :param latency_stats: Optional. The number of questions and the p50/p90/p99 latencies and standard deviation
+        of a single question, see orchestrator.latency_statistics.
         """
         self.model = model
         self.time_length = time_length
@@ -42,6 +46,8 @@ class OrchestrationRAGHelper:
         self.final_score = final_score
         self.summary_invoke_response = answers_response
         self.final_summary = final_summary
+        self.wall_time_length = wall_time_length
+        self.latency_stats = latency_stats
 
     def format(self):
         """
@@ -67,6 +73,17 @@ class OrchestrationRAGHelper:
                 'Score': self.final_score,
                 'Invoke Response': self.summary_invoke_response
             }
+        # adding the wall time and the per-question latency distribution when available
+        if self.wall_time_length is not None:
+            result['Wall Time Length'] = self.wall_time_length
+        if self.latency_stats:
+            result.update({
+                'Questions': self.latency_stats.get('trials'),
+                'Question Latency P50': self.latency_stats.get('latency_p50'),
+                'Question Latency P90': self.latency_stats.get('latency_p90'),
+                'Question Latency P99': self.latency_stats.get('latency_p99'),
+                'Question Latency Std': self.latency_stats.get('latency_std'),
+            })
         # returning the final dictionary
         return result
 
@@ -1,42 +1,30 @@
 import os
 import boto3
-from text_extractor_and_summarizer import (text_extraction, csv_extraction, text_formatter, invoke_anthropic, invoke_mistral, invoke_meta,
-                                           invoke_cohere,
-                                           invoke_amazon, invoke_AI21)
+from text_extractor_and_summarizer import text_extraction, csv_extraction, text_formatter, summarize_document
+from model_adapters import PROVIDER_ADAPTERS, get_adapter
 from orchestration_helper import OrchestrationHelper
 from orchestration_rag_helper import OrchestrationRAGHelper
-from pricing_calculator import calculate_total_price
-from evaluation_steps import evaluate_model_output_orchestrator, evaluate_model_performance, dynamic_grading_criteria, evaluate_rag_output, evaluate_rag_performance
-from plotting_and_reporting import write_evaluation_results, plot_model_comparisons, plot_model_performance_comparisons, plot_rag_comparisons, plot_rag_performance_comparisons
+from pricing_calculator import calculate_total_price, calculate_map_reduce_price
+from response_cache import ResponseCache, response_cache, use_response_cache
+from usage_tracker import UsageTracker, count_tokens, record_usage, track_usage
+from rate_limiter import bedrock_limiter_metrics, wait_for_rate_limit
+from evaluation_steps import (evaluate_model_output_orchestrator, evaluate_model_performance, dynamic_grading_criteria_async,
+                              evaluate_rag_output, evaluate_rag_performance, shared_bedrock_client)
+from plotting_and_reporting import (write_evaluation_results, plot_model_comparisons, plot_model_performance_comparisons,
+                                    plot_rag_comparisons, plot_rag_performance_comparisons, create_run_directory,
+                                    ReportRenderer)
 import logging
 from timeit import default_timer as timer
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
 from io import StringIO
 from dotenv import load_dotenv
 import asyncio
-from AnthropicTokenCounter import AnthropicTokenCounter
-from langchain_aws import ChatBedrock
-from langchain_aws.embeddings import BedrockEmbeddings
-from langchain_aws.retrievers.bedrock import AmazonKnowledgeBasesRetriever
-from langchain.chains import RetrievalQA
-from datasets import Dataset
-from ragas import evaluate
-from ragas.metrics import (
-    faithfulness, 
-    answer_relevancy, 
-    context_recall, 
-    context_precision, 
-    context_entity_recall, 
-    answer_similarity, 
-    answer_correctness
-    )
-from ragas.metrics.critique import (
-    harmfulness, 
-    maliciousness, 
-    coherence, 
-    correctness, 
-    conciseness
-    )
+import contextvars
+import functools
+from functools import lru_cache
+from types import SimpleNamespace
 
 
 
@@ -57,31 +45,403 @@ bedrock_runtime = boto3.client(
 )
 
 
-llm_for_text_generation = ChatBedrock(model_id="anthropic.claude-3-sonnet-20240229-v1:0", client=bedrock_runtime) ##TODO update to allow user to select the model they want to use
-llm_for_evaluation = ChatBedrock(model_id="anthropic.claude-3-sonnet-20240229-v1:0", client=bedrock_runtime)
+# Default number of in-flight candidate invocations allowed per provider in the concurrent execution mode
+DEFAULT_PROVIDER_CONCURRENCY = int(os.getenv("provider_concurrency", "2"))
+# Default number of models that may be judged at the same time (each judge round is nine Bedrock calls)
+DEFAULT_JUDGE_CONCURRENCY = int(os.getenv("judge_concurrency", "4"))
+# Default number of in-flight trials per model in the latency benchmark mode
+DEFAULT_TRIAL_CONCURRENCY = int(os.getenv("trial_concurrency", "4"))
+# Default number of questions answered at the same time by a knowledge base in the RAG evaluation
+DEFAULT_QUESTION_CONCURRENCY = int(os.getenv("question_concurrency", "4"))
+
+# The model answering the RAG questions and the model RAGAS evaluates the answers with
+RAG_TEXT_GENERATION_MODEL_ID = "anthropic.claude-3-sonnet-20240229-v1:0" ##TODO update to allow user to select the model they want to use
+RAG_EVALUATION_MODEL_ID = "anthropic.claude-3-sonnet-20240229-v1:0"
+
 
-metrics = [
+@lru_cache(maxsize=None)
+def rag_components():
+    """
+    Imports LangChain, datasets and RAGAS and builds the RAG evaluation LLMs and metrics, once, on first use.
+
+    The summarization evaluation does not need them, so importing the orchestrator stays fast and light, e.g. for the
+    command line in a container.
+
+    :return: A SimpleNamespace with the answering and evaluation LLMs, the RAGAS metrics and the LangChain, datasets
+    and retrieval cache classes the RAG evaluation uses.
+    """
+    from AnthropicTokenCounter import AnthropicTokenCounter
+    from langchain_aws import ChatBedrock
+    from langchain_aws.embeddings import BedrockEmbeddings
+    from langchain_aws.retrievers.bedrock import AmazonKnowledgeBasesRetriever
+    from langchain.chains import RetrievalQA
+    from datasets import Dataset
+    from ragas import evaluate
+    from ragas.metrics import (
         faithfulness,
         answer_relevancy,
-        context_precision,
         context_recall,
+        context_precision,
         context_entity_recall,
         answer_similarity,
-        answer_correctness,
-        harmfulness, 
-        maliciousness, 
-        coherence, 
-        correctness, 
+        answer_correctness
+        )
+    from ragas.metrics.critique import (
+        harmfulness,
+        maliciousness,
+        coherence,
+        correctness,
         conciseness
-    ]
+        )
+    from retrieval_cache import CachedKnowledgeBaseRetriever, ReplayMissError
+
+    return SimpleNamespace(
+        llm_for_text_generation=ChatBedrock(model_id=RAG_TEXT_GENERATION_MODEL_ID, client=bedrock_runtime),
+        llm_for_evaluation=ChatBedrock(model_id=RAG_EVALUATION_MODEL_ID, client=bedrock_runtime),
+        metrics=[
+            faithfulness,
+            answer_relevancy,
+            context_precision,
+            context_recall,
+            context_entity_recall,
+            answer_similarity,
+            answer_correctness,
+            harmfulness,
+            maliciousness,
+            coherence,
+            correctness,
+            conciseness
+        ],
+        evaluate=evaluate,
+        AnthropicTokenCounter=AnthropicTokenCounter,
+        BedrockEmbeddings=BedrockEmbeddings,
+        AmazonKnowledgeBasesRetriever=AmazonKnowledgeBasesRetriever,
+        RetrievalQA=RetrievalQA,
+        Dataset=Dataset,
+        CachedKnowledgeBaseRetriever=CachedKnowledgeBaseRetriever,
+        ReplayMissError=ReplayMissError,
+    )
+
+
+def timed_invoke(model, prompt, input_text_data, max_tokens, use_cache=True, map_reduce=None):
+    """
+    Invokes a candidate model and measures the latency of that single request, without the time queued for the
+    limiters or waited between retries, or reuses the latency recorded with a cached response. A map-reduce
+    summarization is timed from its start to its end.
+
+    :param model: The ID of the model to invoke.
+    :param prompt: The task prompt.
+    :param input_text_data: The text extracted from the PDF.
+    :param max_tokens: The maximum number of tokens to generate.
+    :param use_cache: Optional. Set to False to always call the model. Defaults to True.
+    :param map_reduce: Optional. Whether to use map-reduce summarization, see summarize_document. Defaults to None,
+    only for texts that do not fit in the model's context window.
+    :return: A tuple containing the generated summary, input tokens, output tokens, the time taken in seconds,
+    the streaming metrics of the call (None if the model was not streamed) and the map-reduce usage (None if the
+    text was summarized in a single request).
+    """
+    # Start timer
+    start = timer()
+    # Invoke the model, and get the generated summary, input tokens and output tokens
+    invoke_response = summarize_document(model, prompt, input_text_data, max_tokens, map_reduce=map_reduce,
+                                         use_cache=use_cache)
+    # end timer
+    end = timer()
+    # A response served from the cache reports the latency of the call that generated it, a call sent to Bedrock the
+    # latency of its successful request
+    time_length = getattr(invoke_response, "cached_latency", None)
+    if time_length is None:
+        time_length = getattr(invoke_response, "latency", None)
+    if time_length is None:
+        time_length = end - start
+    summary_invoke_response, input_token_count, output_token_count = invoke_response
+    # Record the usage in the active trackers, a cached response was not paid for again. A map-reduce summarization
+    # is cached when all its chunk calls were
+    cached = getattr(invoke_response, "cached", hasattr(invoke_response, "cached_latency"))
+    record_usage(model, input_token_count, output_token_count, cached=cached)
+    # return the response together with the total time taken, the streaming metrics and the map-reduce usage
+    return (summary_invoke_response, input_token_count, output_token_count, round(time_length, 2),
+            getattr(invoke_response, "stream_metrics", None), getattr(invoke_response, "map_reduce_usage", None))
+
+
+async def timed_invoke_async(model, prompt, input_text_data, max_tokens, use_cache=True, map_reduce=None,
+                             executor=None):
+    """
+    Runs timed_invoke in a worker thread. Its Bedrock calls wait on the active rate limiter, if any.
+
+    :param executor: Optional. The thread pool running the call, defaults to the event loop's default executor.
+    :return: The timed_invoke result.
+    """
+    # Run in the context of the caller, like asyncio.to_thread, so the usage trackers and the rate limiter see the call
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, functools.partial(context.run, timed_invoke, model, prompt, input_text_data, max_tokens, use_cache,
+                                    map_reduce))
+
+
+async def benchmark_invocations(model, prompt, input_text_data, max_tokens, trials, warmup=0,
+                                trial_concurrency=None, map_reduce=None, executor=None):
+    """
+    Invokes a candidate model repeatedly to measure a stable latency, bypassing the response cache.
+
+    :param model: The ID of the model to invoke.
+    :param prompt: The task prompt.
+    :param input_text_data: The text extracted from the PDF.
+    :param max_tokens: The maximum number of tokens to generate.
+    :param trials: The number of measured invocations.
+    :param warmup: Optional. The number of invocations sent, one after another, before the trials and discarded.
+    :param trial_concurrency: Optional. The number of trials in flight at the same time. Defaults to
+    DEFAULT_TRIAL_CONCURRENCY.
+    :param map_reduce: Optional. Whether to use map-reduce summarization, see summarize_document.
+    :param executor: Optional. The thread pool running the invocations, see timed_invoke_async.
+    :return: A list of timed_invoke results, one per trial.
+    """
+    # Warm up the connection and the model, these calls are not measured
+    for _ in range(warmup):
+        await timed_invoke_async(model, prompt, input_text_data, max_tokens, use_cache=False,
+                                 map_reduce=map_reduce, executor=executor)
+    trial_semaphore = asyncio.Semaphore(trial_concurrency or DEFAULT_TRIAL_CONCURRENCY)
+
+    async def run_trial():
+        # Each trial is timed from the moment it gets a free slot
+        async with trial_semaphore:
+            return await timed_invoke_async(model, prompt, input_text_data, max_tokens, use_cache=False,
+                                            map_reduce=map_reduce, executor=executor)
+
+    return await asyncio.gather(*[run_trial() for _ in range(trials)])
+
+
+def latency_statistics(time_lengths):
+    """
+    Summarizes the latencies of repeated trials.
+
+    :param time_lengths: The time taken by every trial, in seconds.
+    :return: A dictionary with the number of trials, the p50/p90/p99 latencies and their standard deviation.
+    """
+    p50, p90, p99 = np.percentile(time_lengths, [50, 90, 99])
+    return {
+        "trials": len(time_lengths),
+        "latency_p50": round(float(p50), 2),
+        "latency_p90": round(float(p90), 2),
+        "latency_p99": round(float(p99), 2),
+        "latency_std": round(float(np.std(time_lengths, ddof=1)), 3) if len(time_lengths) > 1 else 0.0,
+    }
 
 
-def final_evaluator(pdf_path, models, task_prompt="Summarize this document in 2 sentences.", max_tokens='4096'):
+def median_stream_metrics(stream_metrics_list):
+    """
+    Combines the streaming metrics of repeated trials by taking the median of every metric.
+
+    :param stream_metrics_list: The stream_metrics of every trial, None for the trials that were not streamed.
+    :return: A dictionary with the median of every metric, or None if no trial was streamed.
+    """
+    streamed = [stream_metrics for stream_metrics in stream_metrics_list if stream_metrics]
+    if not streamed:
+        return None
+    median_metrics = {}
+    for metric in streamed[0]:
+        # Metrics missing from a trial (e.g. a single chunk has no inter-token latency) are left out of the median
+        values = [stream_metrics[metric] for stream_metrics in streamed if stream_metrics[metric] is not None]
+        median_metrics[metric] = round(float(np.median(values)), 4) if values else None
+    return median_metrics
+
+
+async def evaluate_candidate_async(model, prompt, input_text_data, max_tokens, provider_semaphore, judge_semaphore,
+                                   dynamic_evaluation_criteria, dynamic_grading_scale, judge_mode=None, trials=1,
+                                   warmup=0, trial_concurrency=None, map_reduce=None, grading_criteria=None,
+                                   executor=None, use_cache=True):
+    """
+    Generates the candidate summary for one model, prices it and judges it, without blocking the other models.
+
+    The candidate call runs in a worker thread once the provider semaphore is acquired, so the measured
+    time length only covers the model's own call and not the time spent waiting for a free slot.
+
+    With more than one trial, the model is benchmarked with benchmark_invocations: the time length is the median
+    latency, the costs are averaged over the trials and only the summary of the first trial is judged.
+
+    :param model: The ID of the model to evaluate.
+    :param prompt: The task prompt.
+    :param input_text_data: The text extracted from the PDF.
+    :param max_tokens: The maximum number of tokens to generate.
+    :param provider_semaphore: Semaphore capping the in-flight calls to this model's provider.
+    :param judge_semaphore: Semaphore capping the number of models being judged at the same time.
+    :param dynamic_evaluation_criteria: The task adherence criteria generated for the prompt.
+    :param dynamic_grading_scale: The task adherence grading scale generated for the prompt.
+    :param judge_mode: Optional. The judge mode passed to evaluate_model_output_orchestrator.
+    :param trials: Optional. The number of times the model is invoked to measure its latency. Defaults to 1.
+    :param warmup: Optional. The number of discarded invocations sent before the trials. Defaults to 0.
+    :param trial_concurrency: Optional. The number of trials in flight at the same time.
+    :param map_reduce: Optional. Whether to use map-reduce summarization, see summarize_document.
+    :param grading_criteria: Optional. A future of the (criteria, grading scale) tuple, awaited before judging when
+    dynamic_evaluation_criteria is None, so the criteria can be generated while the candidate is invoked.
+    :param executor: Optional. The thread pool running the candidate calls, see timed_invoke_async.
+    :param use_cache: Optional. Set to False to always call the model, trials always do. Defaults to True.
+    :return: A tuple containing the OrchestrationHelper result and the scoring rubric for the model.
+    """
+    # Calculate the character count of the input text
+    character_count = len(input_text_data)
+    # Invoke the model in a worker thread once its provider has a free slot
+    async with provider_semaphore:
+        if trials > 1 or warmup:
+            invocations = await benchmark_invocations(model, prompt, input_text_data, max_tokens, trials, warmup,
+                                                      trial_concurrency, map_reduce, executor)
+        else:
+            invocations = [await timed_invoke_async(model, prompt, input_text_data, max_tokens, use_cache=use_cache,
+                                                    map_reduce=map_reduce, executor=executor)]
+    # The first invocation provides the summary to judge
+    summary_invoke_response = invocations[0][0]
+    if len(invocations) > 1:
+        # Summarize the latency of the trials, the median is reported as the time length
+        latency_stats = latency_statistics([invocation[3] for invocation in invocations])
+        time_length = latency_stats["latency_p50"]
+        stream_metrics = median_stream_metrics([invocation[4] for invocation in invocations])
+    else:
+        latency_stats = None
+        time_length, stream_metrics = invocations[0][3], invocations[0][4]
+    # calculate time taken per character
+    char_process_time = character_count / time_length
+    # calculate costs for the model and the specific inference, averaged over the trials
+    input_token_count, output_token_count = (
+        float(count) for count in np.mean([invocation[1:3] for invocation in invocations], axis=0))
+    input_cost, output_cost, total_cost, total_cost_1000 = calculate_total_price(input_token_count,
+                                                                                 output_token_count, model)
+    # Account the map and reduce steps separately when the text was summarized in chunks
+    map_reduce_stats = invocations[0][5]
+    if map_reduce_stats:
+        map_cost, reduce_cost = calculate_map_reduce_price(map_reduce_stats, model)
+        map_reduce_stats = {**map_reduce_stats, "map_cost": map_cost, "reduce_cost": reduce_cost}
+    # Wait for the task adherence criteria still being generated
+    if dynamic_evaluation_criteria is None:
+        dynamic_evaluation_criteria, dynamic_grading_scale = await asyncio.shield(grading_criteria)
+    # evaluate the models performance against the grading rubric once a judge slot is free
+    async with judge_semaphore:
+        final_score, final_summary, final_score_rubric = await evaluate_model_output_orchestrator(
+            input_text_data, model, summary_invoke_response, prompt, dynamic_evaluation_criteria,
+            dynamic_grading_scale, judge_mode)
+    #  create a OrchestrationHelper object to store the results of the evaluation
+    result = OrchestrationHelper(model, time_length, character_count, char_process_time, input_cost, output_cost,
+                                 total_cost, total_cost_1000, final_score, summary_invoke_response, final_summary,
+                                 stream_metrics, latency_stats, map_reduce_stats, input_token_count,
+                                 output_token_count)
+    return result, final_score_rubric
+
+
+async def evaluate_models(models, prompt, input_text_data, max_tokens, dynamic_evaluation_criteria=None,
+                          dynamic_grading_scale=None, concurrent=False, provider_concurrency=None, judge_concurrency=None,
+                          judge_mode=None, trials=1, warmup=0, trial_concurrency=None, map_reduce=None,
+                          on_result=None, use_cache=True):
+    """
+    Runs candidate generation and judging for every supported model, one model after another or all at once.
+
+    :param models: List of model IDs to evaluate, unsupported, image and embedding models are skipped.
+    :param prompt: The task prompt.
+    :param input_text_data: The text extracted from the PDF.
+    :param max_tokens: The maximum number of tokens to generate.
+    :param dynamic_evaluation_criteria: Optional. The task adherence criteria generated for the prompt. When None,
+    they are generated with dynamic_grading_criteria_async alongside the first candidate invocations.
+    :param dynamic_grading_scale: Optional. The task adherence grading scale generated for the prompt.
+    :param concurrent: Optional. When True every model is evaluated at the same time, capped per provider.
+    :param provider_concurrency: Optional. Either an int applied to every provider, or a dict of provider name to
+    its cap. Providers missing from the dict use DEFAULT_PROVIDER_CONCURRENCY.
+    :param judge_concurrency: Optional. The number of models judged at the same time. Defaults to
+    DEFAULT_JUDGE_CONCURRENCY.
+    :param judge_mode: Optional. The judge mode passed to evaluate_model_output_orchestrator.
+    :param trials: Optional. The number of latency trials per model. Defaults to 1.
+    :param warmup: Optional. The number of discarded warm-up invocations per model. Defaults to 0.
+    :param trial_concurrency: Optional. The number of trials of a model in flight at the same time.
+    :param map_reduce: Optional. Whether to use map-reduce summarization, see summarize_document.
+    :param on_result: Optional. Called with the OrchestrationHelper result and the scoring rubric of every model as
+    soon as it is evaluated, e.g. to update the report while the other models are still running.
+    :param use_cache: Optional. Set to False to always call the candidate models. Defaults to True.
+    :return: A list of (OrchestrationHelper, scoring rubric) tuples, in the same order as the models.
+    """
+    # Resolve the concurrency cap of every provider
+    if provider_concurrency is None:
+        provider_concurrency = DEFAULT_PROVIDER_CONCURRENCY
+    if isinstance(provider_concurrency, int):
+        provider_concurrency = {provider: provider_concurrency for provider in PROVIDER_ADAPTERS}
+    provider_semaphores = {
+        provider: asyncio.Semaphore(provider_concurrency.get(provider, DEFAULT_PROVIDER_CONCURRENCY))
+        for provider in PROVIDER_ADAPTERS
+    }
+    judge_semaphore = asyncio.Semaphore(judge_concurrency or DEFAULT_JUDGE_CONCURRENCY)
+    # Candidate calls block a worker thread each, with trials the run gets its own pool sized so concurrent trials
+    # are not queued behind each other, shut down with the run
+    executor = None
+    if trials > 1:
+        worker_count = max(32, sum(provider_concurrency.values()) * (trial_concurrency or DEFAULT_TRIAL_CONCURRENCY))
+        executor = ThreadPoolExecutor(max_workers=worker_count, thread_name_prefix="candidate-trials")
+
+    async def evaluate_and_report(model, grading_criteria):
+        # Hand every result over as soon as it is ready, all models go through the same instrumented path
+        model_result = await evaluate_candidate_async(
+            model, prompt, input_text_data, max_tokens, provider_semaphores[get_adapter(model).provider],
+            judge_semaphore, dynamic_evaluation_criteria, dynamic_grading_scale, judge_mode, trials, warmup,
+            trial_concurrency, map_reduce, grading_criteria, executor, use_cache)
+        if on_result is not None:
+            on_result(*model_result)
+        return model_result
+
+    supported_models = [model for model in models if get_adapter(model) is not None]
+    # Every judge call of the run shares one pooled Bedrock client
+    try:
+        async with shared_bedrock_client():
+            # Generate the task adherence criteria in the background, only the judging waits for them
+            grading_criteria = None
+            if dynamic_evaluation_criteria is None:
+                grading_criteria = asyncio.ensure_future(dynamic_grading_criteria_async(prompt))
+            try:
+                if concurrent:
+                    # Evaluate every model at once, gather keeps the results in the order of the models
+                    return await asyncio.gather(*(evaluate_and_report(model, grading_criteria)
+                                                  for model in supported_models))
+                # Evaluate the models one after another, each evaluation is only created when its turn comes, so a
+                # failing model leaves no evaluation unawaited. The results so far were handed to on_result
+                results = []
+                for model in supported_models:
+                    results.append(await evaluate_and_report(model, grading_criteria))
+                return results
+            finally:
+                # Do not leave the criteria running when no model was judged
+                if grading_criteria is not None and not grading_criteria.done():
+                    grading_criteria.cancel()
+    finally:
+        # Joining the pool threads would block the event loop, the calls of a finished run are all done and those
+        # of a failed run end on their own
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+def final_evaluator(pdf_path, models, task_prompt="Summarize this document in 2 sentences.", max_tokens='4096',
+                    concurrent=False, provider_concurrency=None, judge_concurrency=None, judge_mode=None,
+                    use_cache=None, trials=1, warmup=0, trial_concurrency=None, map_reduce=None, report_dir=None,
+                    chart_format=None):
     """
     Evaluate multiple models for summarization and other evaluation metrics.
 
     :param pdf_path: Path to the PDF file.
     :param models: List of models to evaluate.
+    :param concurrent: Optional. When True, every model is invoked and judged at the same time instead of one after
+    another. Defaults to False.
+    :param provider_concurrency: Optional. Cap on in-flight candidate calls per provider in concurrent mode, either an
+    int or a dict of provider name to cap.
+    :param judge_concurrency: Optional. Number of models judged at the same time in concurrent mode.
+    :param judge_mode: Optional. "per_criterion" (one judge request per criterion) or "fused" (one request scoring
+    every criterion). Defaults to the judge_mode environment variable, or "per_criterion".
+    :param use_cache: Optional. Set to False to bypass the response cache for this run, True to force it on.
+    Defaults to the cache's own setting (enabled unless no_cache=true).
+    :param trials: Optional. Benchmark mode, the number of times every model is invoked to report p50/p90/p99
+    latency and its standard deviation. Trials always call Bedrock. Defaults to 1.
+    :param warmup: Optional. The number of discarded warm-up invocations per model in benchmark mode. Defaults to 0.
+    :param trial_concurrency: Optional. The number of trials of a model in flight at the same time. Defaults to the
+    trial_concurrency environment variable, or 4.
+    :param map_reduce: Optional. True to summarize in chunks (map) merged into the final summary (reduce), False to
+    always send the whole text. Defaults to None, map-reduce is used for the models whose context window is too
+    small for the text.
+    :param report_dir: Optional. The directory the reports and charts of this run are written to. Defaults to a new
+    directory under reports/ (see create_run_directory), so concurrent runs do not overwrite each other.
+    :param chart_format: Optional. "png" for matplotlib charts, "html" for interactive Plotly charts, "none" for no
+    charts. Defaults to the report_chart_format environment variable, or "png".
 
     :return: A tuple containing:
         - DataFrame: Evaluation results including model performance metrics and costs.
@@ -91,8 +451,6 @@ def final_evaluator(pdf_path, models, task_prompt="Summarize this document in 2
     """
     # Extract the text out of the given PDF
     input_text_data = text_extraction(pdf_path)
-    # Calculate the character count of the input text
-    character_count = len(input_text_data)
     # Create the prompt for the models to evaluate
     prompt = task_prompt
     # Initialize an empty list to store results for each model
@@ -101,256 +459,162 @@ def final_evaluator(pdf_path, models, task_prompt="Summarize this document in 2
     score_rubric_list = []
     # Initialize an empty string to store the aggregated evaluation results
     evaluation_results = ""
-    #create dynamic grading critera for the prompt
-    dynamic_evaluation_criteria, dynamic_grading_scale = dynamic_grading_criteria(prompt)
-    # for each mode evaluate 
-    for model in models:
-        if "stability" in model or "embed" in model:
-            continue  # skips the current iteration and goes to the next model
-
-        if "anthropic" in model:
-            # Start timer
-            start = timer()
-            # Invoke the specific Anthropic model, and get the generated summary, input tokens and output tokens
-            summary_invoke_response, input_token_count, output_token_count = invoke_anthropic(model, prompt,
-                                                                                              input_text_data, max_tokens)
-            # end timer
-            end = timer()
-            # calculate total time taken
-            time_length = round(end - start, 2)
-            # calculate time taken per character
-            char_process_time = character_count / time_length
-            # calculate costs for the model and the specific inference, specifically the input costs, output cost,
-            # total costs and total costs per 1000 invocations
-            input_cost, output_cost, total_cost, total_cost_1000 = calculate_total_price(input_token_count,
-                                                                                         output_token_count, model)
-            # evaluate the models performance against the grading rubric and return the final score, final summary
-            # and the scoring rubric
-            final_score, final_summary, final_score_rubric = asyncio.run(
-                evaluate_model_output_orchestrator(input_text_data, model, summary_invoke_response, prompt,
-                                                   dynamic_evaluation_criteria, dynamic_grading_scale))
-            #  create a OrchestrationHelper object to store the results of the evaluation
-            result = OrchestrationHelper(model, time_length, character_count, char_process_time, input_cost,
-                                         output_cost,
-                                         total_cost, total_cost_1000, final_score, summary_invoke_response,
-                                         final_summary)
-            # add the results of the evaluation to the results list
+    # Track the token usage of every call of this run, per model
+    run_usage = UsageTracker()
+    # Every run writes its reports to its own directory, the charts are rendered in the background
+    report_dir = report_dir or create_run_directory()
+    os.makedirs(report_dir, exist_ok=True)
+    logger.info("Writing the reports to %s", report_dir)
+    # The cache setting only applies to the calls of this run, other runs keep theirs. The charts still being
+    # rendered are waited for when the run ends, even if it fails
+    with use_response_cache(use_cache), ReportRenderer(report_dir, chart_format) as renderer:
+
+        def render_result(result, final_score_rubric):
+            # Redraw the charts with every model evaluated so far
             results_list.append(result.format())
-            # add the evaluation results written summary to the evaluation results string
-            evaluation_results += result.evaluation_results()
-            # add the scoring rubric for the model into the scoring rubric list
             score_rubric_list.append(final_score_rubric)
-
-        if "mistral" in model:
-            # Start timer
-            start = timer()
-            # Invoke the specific Mistral model, and get the generated summary, input tokens and output tokens
-            summary_invoke_response, input_token_count, output_token_count = invoke_mistral(model, prompt,
-                                                                                              input_text_data, max_tokens)
-            # end timer
-            end = timer()
-            # calculate total time taken
-            time_length = round(end - start, 2)
-            # calculate time taken per character
-            char_process_time = character_count / time_length
-            # calculate costs for the model and the specific inference, specifically the input costs, output cost,
-            # total costs and total costs per 1000 invocations
-            input_cost, output_cost, total_cost, total_cost_1000 = calculate_total_price(input_token_count,
-                                                                                         output_token_count, model)
-            # evaluate the models performance against the grading rubric and return the final score, final summary
-            # and the scoring rubric
-            final_score, final_summary, final_score_rubric = asyncio.run(
-                evaluate_model_output_orchestrator(input_text_data, model, summary_invoke_response, prompt,
-                                                   dynamic_evaluation_criteria, dynamic_grading_scale))
-            #  create a OrchestrationHelper object to store the results of the evaluation
-            result = OrchestrationHelper(model, time_length, character_count, char_process_time, input_cost,
-                                         output_cost,
-                                         total_cost, total_cost_1000, final_score, summary_invoke_response,
-                                         final_summary)
-            # add the results of the evaluation to the results list
-            results_list.append(result.format())
+            renderer.submit(plot_model_comparisons, pd.DataFrame(results_list))
+            renderer.submit(plot_model_performance_comparisons, pd.DataFrame(score_rubric_list))
+
+        # Invoke, price and judge every supported model, the grading criteria for the prompt are created alongside
+        with track_usage(run_usage):
+            model_results = asyncio.run(
+                evaluate_models(models, prompt, input_text_data, max_tokens, None, None, concurrent, provider_concurrency, judge_concurrency, judge_mode,
+                                trials, warmup, trial_concurrency, map_reduce, on_result=render_result,
+                                use_cache=use_cache is not False))
+        # Keep the results in the order of the models
+        results_list = [result.format() for result, _ in model_results]
+        score_rubric_list = [final_score_rubric for _, final_score_rubric in model_results]
+        for result, _ in model_results:
             # add the evaluation results written summary to the evaluation results string
             evaluation_results += result.evaluation_results()
-            # add the scoring rubric for the model into the scoring rubric list
-            score_rubric_list.append(final_score_rubric)
+        # Setting the display to max column width
+        pd.set_option('display.max_colwidth', None)
+        # Convert scoring rubric list into a DataFrame
+        score_rubric_df = pd.DataFrame(score_rubric_list)
+        # Log the scoring rubric, stdout is left to the results of the command line
+        logger.info("Scoring rubric:\n%s", score_rubric_df)
+        # Convert performance and cost results list into a DataFrame
+        results_df = pd.DataFrame(results_list)
+        # Log the results
+        logger.info("Results:\n%s",
+                    results_df[['Model', 'Time Length', 'Time To First Token', 'Tokens Per Second', 'Total Cost',
+                                'Summary Score']])
+        # Multiply Total Cost values by 1000 invocations
+        results_df['Total Cost'] *= 1000
+        # Save this dataframe as a CSV file      
+        file_path = os.path.join(report_dir, 'model_performance_comparison.csv')
+        # Save DataFrame to CSV file
+        results_df.to_csv(file_path, index=False)
+        # Convert DataFrame to CSV format string to send to Bedrock for eval
+        csv_data = StringIO()
+        # Save DataFrame to CSV file
+        results_df.to_csv(csv_data, index=False)
+        # Move to start of StringIO object to read its content
+        csv_data.seek(0)
+        # Read CSV data from StringIO object (as a string)
+        csv_string = csv_data.getvalue()
+        # ask the model which is the best model to use for cost and performance
+        invoke_costs_eval_response = evaluate_model_performance(csv_string, "anthropic.claude-3-sonnet-20240229-v1:0")
+        # Save the reports to a file
+        write_evaluation_results(evaluation_results, eval_name="summary", output_dir=report_dir)
+        write_evaluation_results(invoke_costs_eval_response, eval_name="cost", output_dir=report_dir)
+        logger.info("Token usage: %s", run_usage.summary())
+        # Report how much of the judge input was read from the Bedrock prompt cache, and what it saved
+        logger.info("Judge prompt cache: %s", run_usage.prompt_cache_summary("judge"))
+        # Report the concurrency each model settled on, and how often Bedrock throttled it
+        logger.info("Bedrock limits: %s", bedrock_limiter_metrics())
+        # Report how many invocations were served from the cache
+        if response_cache.is_enabled():
+            logger.info("Response cache: %s", response_cache.stats())
+        #  return the results dataframe, evaluation results, invoke costs eval response and score rubric dataframe
+        return results_df, evaluation_results, invoke_costs_eval_response, score_rubric_df
+
+
+
+
+async def answer_question_async(qa_chain, retriever, question, replay=False):
+    """
+    Answers one question, retrieving its documents once and reusing them for both the answer and the contexts.
 
-        if "meta" in model:
-            # Start timer
-            start = timer()
-            # Invoke the specific Meta model, and get the generated summary, input tokens and output tokens
-            summary_invoke_response, input_token_count, output_token_count = invoke_meta(model, prompt,
-                                                                                              input_text_data, max_tokens)
-            # end timer
-            end = timer()
-            # calculate total time taken
-            time_length = round(end - start, 2)
-            # calculate time taken per character
-            char_process_time = character_count / time_length
-            # calculate costs for the model and the specific inference, specifically the input costs, output cost,
-            # total costs and total costs per 1000 invocations
-            input_cost, output_cost, total_cost, total_cost_1000 = calculate_total_price(input_token_count,
-                                                                                         output_token_count, model)
-            # evaluate the models performance against the grading rubric and return the final score, final summary
-            # and the scoring rubric
-            final_score, final_summary, final_score_rubric = asyncio.run(
-                evaluate_model_output_orchestrator(input_text_data, model, summary_invoke_response, prompt,
-                                                   dynamic_evaluation_criteria, dynamic_grading_scale))
-            #  create a OrchestrationHelper object to store the results of the evaluation
-            result = OrchestrationHelper(model, time_length, character_count, char_process_time, input_cost,
-                                         output_cost,
-                                         total_cost, total_cost_1000, final_score, summary_invoke_response,
-                                         final_summary)
-            # add the results of the evaluation to the results list
-            results_list.append(result.format())
-            # add the evaluation results written summary to the evaluation results string
-            evaluation_results += result.evaluation_results()
-            # add the scoring rubric for the model into the scoring rubric list
-            score_rubric_list.append(final_score_rubric)
+    Answers are recorded in the response cache next to the retrievals, so a replayed run only re-runs the scoring.
 
-        if "cohere" in model:
-            # Start timer
-            start = timer()
-            # Invoke the specific Cohere model, and get the generated summary, input tokens and output tokens
-            summary_invoke_response, input_token_count, output_token_count = invoke_cohere(model, prompt,
-                                                                                              input_text_data,max_tokens)
-            # end timer
-            end = timer()
-            # calculate total time taken
-            time_length = round(end - start, 2)
-            # calculate time taken per character
-            char_process_time = character_count / time_length
-            # calculate costs for the model and the specific inference, specifically the input costs, output cost,
-            # total costs and total costs per 1000 invocations
-            input_cost, output_cost, total_cost, total_cost_1000 = calculate_total_price(input_token_count,
-                                                                                         output_token_count, model)
-            # evaluate the models performance against the grading rubric and return the final score, final summary
-            # and the scoring rubric
-            final_score, final_summary, final_score_rubric = asyncio.run(
-                evaluate_model_output_orchestrator(input_text_data, model, summary_invoke_response, prompt,
-                                                   dynamic_evaluation_criteria, dynamic_grading_scale))
-            #  create a OrchestrationHelper object to store the results of the evaluation
-            result = OrchestrationHelper(model, time_length, character_count, char_process_time, input_cost,
-                                         output_cost,
-                                         total_cost, total_cost_1000, final_score, summary_invoke_response,
-                                         final_summary)
-            # add the results of the evaluation to the results list
-            results_list.append(result.format())
-            # add the evaluation results written summary to the evaluation results string
-            evaluation_results += result.evaluation_results()
-            # add the scoring rubric for the model into the scoring rubric list
-            score_rubric_list.append(final_score_rubric)
+    :param qa_chain: The RetrievalQA chain whose combine documents chain writes the answer.
+    :param retriever: The knowledge base retriever.
+    :param question: The question to answer.
+    :param replay: Optional. Set to True to only use recorded answers, a missing answer raises ReplayMissError.
+    :return: A tuple containing the answer, the page contents of the retrieved documents and the time taken to
+    retrieve and answer, in seconds. The token usage of the answer is recorded in the active usage trackers.
+    """
+    rag = rag_components()
+    llm_for_text_generation = rag.llm_for_text_generation
+    # Every question gets its own counter, they are answered concurrently
+    token_counter = rag.AnthropicTokenCounter(llm_for_text_generation)
+    start = timer()
+    await wait_for_rate_limit()
+    documents = await retriever.ainvoke(question)
+    contexts = [document.page_content for document in documents]
+    cache_key = ResponseCache.make_key("rag_answer", model_id=llm_for_text_generation.model_id, question=question,
+                                       contexts=contexts)
+    cached = response_cache.get("rag_answer", cache_key)
+    if cached is not None:
+        # Report the usage and the latency of the recorded answer
+        record_usage(llm_for_text_generation.model_id, cached["input_tokens"], cached["output_tokens"],
+                     kind="rag_answer", cached=True)
+        return cached["answer"], contexts, cached["latency"]
+    if replay:
+        raise rag.ReplayMissError(f"No recorded answer for question {question!r}, run the evaluation once without replay "
+                              f"to record it")
+    await wait_for_rate_limit()
+    # Answer from the retrieved documents, the same prompt RetrievalQA would build from them
+    answer = await qa_chain.combine_documents_chain.ainvoke(
+        {"input_documents": documents, "question": question}, config={"callbacks": [token_counter]})
+    answer = answer[qa_chain.combine_documents_chain.output_key]
+    time_length = timer() - start
+    response_cache.put("rag_answer", cache_key, {"answer": answer, "input_tokens": token_counter.input_tokens,
+                                                 "output_tokens": token_counter.output_tokens,
+                                                 "latency": time_length})
+    return answer, contexts, time_length
+
+
+async def answer_questions_async(qa_chain, retriever, questions, question_concurrency=None, replay=False):
+    """
+    Answers the questions concurrently against one knowledge base.
+
+    :param qa_chain: The RetrievalQA chain whose combine documents chain writes the answers.
+    :param retriever: The knowledge base retriever.
+    :param questions: The questions to answer.
+    :param question_concurrency: Optional. The number of questions answered at the same time. Defaults to
+    DEFAULT_QUESTION_CONCURRENCY.
+    :param replay: Optional. Set to True to only use recorded answers, see answer_question_async.
+    :return: A list with the result of answer_question_async for every question, in the order of the questions.
+    """
+    question_semaphore = asyncio.Semaphore(question_concurrency or DEFAULT_QUESTION_CONCURRENCY)
 
-        if "amazon" in model:
-            # Start timer
-            start = timer()
-            # Invoke the specific Amazon model, and get the generated summary, input tokens and output tokens
-            summary_invoke_response, input_token_count, output_token_count = invoke_amazon(model, prompt,
-                                                                                              input_text_data,max_tokens)
-            # end timer
-            end = timer()
-            # calculate total time taken
-            time_length = round(end - start, 2)
-            # calculate time taken per character
-            char_process_time = character_count / time_length
-            # calculate costs for the model and the specific inference, specifically the input costs, output cost,
-            # total costs and total costs per 1000 invocations
-            input_cost, output_cost, total_cost, total_cost_1000 = calculate_total_price(input_token_count,
-                                                                                         output_token_count, model)
-            # evaluate the models performance against the grading rubric and return the final score, final summary
-            # and the scoring rubric
-            final_score, final_summary, final_score_rubric = asyncio.run(
-                evaluate_model_output_orchestrator(input_text_data, model, summary_invoke_response, prompt,
-                                                   dynamic_evaluation_criteria, dynamic_grading_scale))
-            #  create a OrchestrationHelper object to store the results of the evaluation
-            result = OrchestrationHelper(model, time_length, character_count, char_process_time, input_cost,
-                                         output_cost,
-                                         total_cost, total_cost_1000, final_score, summary_invoke_response,
-                                         final_summary)
-            # add the results of the evaluation to the results list
-            results_list.append(result.format())
-            # add the evaluation results written summary to the evaluation results string
-            evaluation_results += result.evaluation_results()
-            # add the scoring rubric for the model into the scoring rubric list
-            score_rubric_list.append(final_score_rubric)
+    async def answer(question):
+        async with question_semaphore:
+            return await answer_question_async(qa_chain, retriever, question, replay)
 
-        if "ai21" in model:
-            # Start timer
-            start = timer()
-            # Invoke the specific AI21 model, and get the generated summary, input tokens and output tokens
-            summary_invoke_response, input_token_count, output_token_count = invoke_AI21(model, prompt,
-                                                                                              input_text_data, max_tokens)
-            # end timer
-            end = timer()
-            # calculate total time taken
-            time_length = round(end - start, 2)
-            # calculate time taken per character
-            char_process_time = character_count / time_length
-            # calculate costs for the model and the specific inference, specifically the input costs, output cost,
-            # total costs and total costs per 1000 invocations
-            input_cost, output_cost, total_cost, total_cost_1000 = calculate_total_price(input_token_count,
-                                                                                         output_token_count, model)
-            # evaluate the models performance against the grading rubric and return the final score, final summary
-            # and the scoring rubric
-            final_score, final_summary, final_score_rubric = asyncio.run(
-                evaluate_model_output_orchestrator(input_text_data, model, summary_invoke_response, prompt,
-                                                   dynamic_evaluation_criteria, dynamic_grading_scale))
-            #  create a OrchestrationHelper object to store the results of the evaluation
-            result = OrchestrationHelper(model, time_length, character_count, char_process_time, input_cost,
-                                         output_cost,
-                                         total_cost, total_cost_1000, final_score, summary_invoke_response,
-                                         final_summary)
-            # add the results of the evaluation to the results list
-            results_list.append(result.format())
-            # add the evaluation results written summary to the evaluation results string
-            evaluation_results += result.evaluation_results()
-            # add the scoring rubric for the model into the scoring rubric list
-            score_rubric_list.append(final_score_rubric)
-    # Setting the display to max column width
-    pd.set_option('display.max_colwidth', None)
-    # Convert scoring rubric list into a DataFrame
-    score_rubric_df = pd.DataFrame(score_rubric_list)
-    # Display DataFrame  for scoring rubric
-    print(score_rubric_df)
-    # Convert performance and cost results list into a DataFrame
-    results_df = pd.DataFrame(results_list)
-    # Display DataFrame for results
-    print(results_df[['Model', 'Time Length', 'Total Cost', 'Summary Score']])
-    # Multiply Total Cost values by 1000 invocations
-    results_df['Total Cost'] *= 1000
-    # Save this dataframe as a CSV file      
-    file_path = os.path.join('reports', 'model_performance_comparison.csv')
-    # Save DataFrame to CSV file
-    results_df.to_csv(file_path, index=False)
-    # Convert DataFrame to CSV format string to send to Bedrock for eval
-    csv_data = StringIO()
-    # Save DataFrame to CSV file
-    results_df.to_csv(csv_data, index=False)
-    # Move to start of StringIO object to read its content
-    csv_data.seek(0)
-    # Read CSV data from StringIO object (as a string)
-    csv_string = csv_data.getvalue()
-    # ask the model which is the best model to use for cost and performance
-    invoke_costs_eval_response = evaluate_model_performance(csv_string, "anthropic.claude-3-sonnet-20240229-v1:0")
-    # chart out the performance and cost results
-    plot_model_comparisons(results_df)
-    # plot the performance rubric scores 
-    plot_model_performance_comparisons(score_rubric_df)
-    # Save the reports to a file
-    write_evaluation_results(evaluation_results, eval_name="summary")
-    write_evaluation_results(invoke_costs_eval_response, eval_name="cost")
-    #  return the results dataframe, evaluation results, invoke costs eval response and score rubric dataframe
-    return results_df, evaluation_results, invoke_costs_eval_response, score_rubric_df
-
-
-
-
-def final_rag_evaluator(csv_path_1, csv_path_2, knowledge_bases):
+    return await asyncio.gather(*(answer(question) for question in questions))
+
+
+def final_rag_evaluator(csv_path_1, csv_path_2, knowledge_bases, question_concurrency=None, replay=None,
+                        report_dir=None, chart_format=None):
     """
     Evaluate multiple knowledge bases for accuracy and other evaluation metrics.
 
     :param csv_path_1: Path to the question CSV file.
     :param csv_path_2: Path to the answer CSV file.
     :param knowledge_bases: List of knowledge bases to evaluate.
+    :param question_concurrency: Optional. The number of questions answered at the same time by each knowledge
+    base. Defaults to the question_concurrency environment variable, or 4. Time Length stays the sum of the
+    per-question latencies, the wall time and the p50/p90/p99 question latencies are reported next to it.
+    :param replay: Optional. Set to True to re-run the scoring from the retrievals and answers recorded in the
+    response cache by a previous run, without calling the knowledge bases or the answering model. Defaults to the
+    rag_replay environment variable.
+    :param report_dir: Optional. The directory the reports and charts of this run are written to, see
+    final_evaluator.
+    :param chart_format: Optional. "png", "html" or "none", see final_evaluator.
 
     :return: A tuple containing:
         - DataFrame: Evaluation results including knowledge base performance metrics and costs.
@@ -358,6 +622,15 @@ def final_rag_evaluator(csv_path_1, csv_path_2, knowledge_bases):
         - str: Evaluation of the costs for model selection.
         - DataFrame: Scoring rubric for the evaluated models.
     """
+    # The retrieval cache imports LangChain, only the RAG evaluation loads it
+    from retrieval_cache import RAG_REPLAY
+    if replay is None:
+        replay = RAG_REPLAY
+    if replay and not response_cache.is_enabled():
+        raise ValueError("Replay reads the recorded retrievals from the response cache, it cannot be disabled")
+    # Import LangChain and RAGAS, only the RAG evaluation needs them
+    rag = rag_components()
+    llm_for_text_generation = rag.llm_for_text_generation
     # Extract the questions out of the given CSV
     questions = csv_extraction(csv_path_1)
     # Extract the answers out of the given CSV
@@ -372,106 +645,128 @@ def final_rag_evaluator(csv_path_1, csv_path_2, knowledge_bases):
     score_rubric_list = []
     # Initialize an empty string to store the aggregated evaluation results
     evaluation_results = ""
-    # for each mode evaluate 
-    for knowledge_base in knowledge_bases:
-
-        embedding_model_name = knowledge_base['embedding_model_arn'].split('/')[1]
-
-        bedrock_embeddings = BedrockEmbeddings(model_id=embedding_model_name, client=bedrock_runtime)
-        retriever = AmazonKnowledgeBasesRetriever(
-            knowledge_base_id=knowledge_base['id'],
-            retrieval_config={"vectorSearchConfiguration": {"numberOfResults": 4}}
-        )
-
-        input_embedding_token_count = len(text_formatter(questions))/6 ## TODO FIX ME!!!
-
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=llm_for_text_generation, retriever=retriever, return_source_documents=True
-        )
-
-        answers = []
-        contexts = []
-        token_counter = AnthropicTokenCounter(llm_for_text_generation)
-        input_llm_token_count = 0
-        output_llm_token_count = 0
-
-        start = timer()
-        for question in questions:
-            answers.append(qa_chain.invoke(question, config={"callbacks": [token_counter]})["result"])
-            input_llm_token_count += token_counter.input_tokens
-            output_llm_token_count += token_counter.output_tokens
-            contexts.append([docs.page_content for docs in retriever.get_relevant_documents(question)])
-        # end timer
-        end = timer()
-        # calculate total time taken
-        time_length = round(end - start, 2)
-        # calculate time taken per character
-        char_process_time = embedding_character_count / time_length
-        # calculate llm_character_count
-        llm_character_count = embedding_character_count + len(" ".join(item[0] for item in contexts))
-
-        # To dict
-        data = {
-            "question": questions,
-            "answer": answers,
-            "contexts": contexts,
-            "ground_truth": ground_truths
-        }
-        # Convert dict to dataset
-        dataset = Dataset.from_dict(data)
-        # Run RAGAS on dataset
-        result = evaluate(
-            dataset = dataset, 
-            metrics=metrics,
-            llm=llm_for_evaluation,
-            embeddings=bedrock_embeddings,
-        )
-
-        input_embedding_cost, output_embedding_cost, embedding_total_cost, embedding_total_cost_1000 = calculate_total_price(input_embedding_token_count, 0, embedding_model_name)
-        input_llm_cost, output_llm_cost, llm_total_cost, llm_total_cost_1000 = calculate_total_price(input_llm_token_count, output_llm_token_count, llm_for_text_generation.model_id)
+    # Track the token usage of every knowledge base of this run
+    run_usage = UsageTracker()
+    # Every run writes its reports to its own directory, the charts are rendered in the background
+    report_dir = report_dir or create_run_directory()
+    os.makedirs(report_dir, exist_ok=True)
+    logger.info("Writing the reports to %s", report_dir)
+    # The charts still being rendered are waited for when the run ends, even if it fails
+    with ReportRenderer(report_dir, chart_format) as renderer:
+        # for each mode evaluate 
+        for knowledge_base in knowledge_bases:
+
+            embedding_model_name = knowledge_base['embedding_model_arn'].split('/')[1]
+
+            bedrock_embeddings = rag.BedrockEmbeddings(model_id=embedding_model_name, client=bedrock_runtime)
+            retrieval_config = {"vectorSearchConfiguration": {"numberOfResults": 4}}
+            # Retrievals are recorded in the response cache, in replay mode the recording stands in for the knowledge base
+            retriever = rag.CachedKnowledgeBaseRetriever(
+                knowledge_base_id=knowledge_base['id'],
+                retrieval_config=retrieval_config,
+                retriever=None if replay else rag.AmazonKnowledgeBasesRetriever(
+                    knowledge_base_id=knowledge_base['id'],
+                    retrieval_config=retrieval_config
+                ),
+                replay=replay
+            )
+
+            qa_chain = rag.RetrievalQA.from_chain_type(
+                llm=llm_for_text_generation, retriever=retriever, return_source_documents=True
+            )
+
+            # Track the token usage of this knowledge base, within the usage of the whole run
+            with track_usage(run_usage), track_usage() as knowledge_base_usage:
+                # The knowledge base embeds every question once, Bedrock does not report these tokens
+                for question in questions:
+                    record_usage(embedding_model_name, count_tokens(question), 0, kind="embedding", source="tokenizer")
+                start = timer()
+                # Retrieve once per question and answer the questions concurrently
+                question_results = asyncio.run(answer_questions_async(qa_chain, retriever, questions,
+                                                                      question_concurrency, replay))
+                # end timer
+                end = timer()
+            answers, contexts, question_time_lengths = zip(*question_results)
+            answers, contexts = list(answers), list(contexts)
+            embedding_usage = knowledge_base_usage.by_model("embedding").get(embedding_model_name, {})
+            input_embedding_token_count = embedding_usage.get("input_tokens", 0)
+            llm_usage = knowledge_base_usage.by_model("rag_answer").get(llm_for_text_generation.model_id, {})
+            input_llm_token_count = llm_usage.get("input_tokens", 0)
+            output_llm_token_count = llm_usage.get("output_tokens", 0)
+            # calculate total time taken, as if the questions were answered one after the other
+            time_length = round(sum(question_time_lengths), 2)
+            wall_time_length = round(end - start, 2)
+            # the per-question latency distribution
+            question_latency_stats = latency_statistics(question_time_lengths)
+            # calculate time taken per character
+            char_process_time = embedding_character_count / time_length
+            # calculate llm_character_count
+            llm_character_count = embedding_character_count + len(" ".join(item[0] for item in contexts))
+
+            # To dict
+            data = {
+                "question": questions,
+                "answer": answers,
+                "contexts": contexts,
+                "ground_truth": ground_truths
+            }
+            # Convert dict to dataset
+            dataset = rag.Dataset.from_dict(data)
+            # Run RAGAS on dataset
+            result = rag.evaluate(
+                dataset = dataset, 
+                metrics=rag.metrics,
+                llm=rag.llm_for_evaluation,
+                embeddings=bedrock_embeddings,
+            )
+
+            input_embedding_cost, output_embedding_cost, embedding_total_cost, embedding_total_cost_1000 = calculate_total_price(input_embedding_token_count, 0, embedding_model_name)
+            input_llm_cost, output_llm_cost, llm_total_cost, llm_total_cost_1000 = calculate_total_price(input_llm_token_count, output_llm_token_count, llm_for_text_generation.model_id)
 
-        # evaluate the models performance against the grading rubric and return the final score, final summary
-        # and the scoring rubric
-        final_score, final_summary, final_score_rubric = evaluate_rag_output(result, knowledge_base, contexts)
+            # evaluate the models performance against the grading rubric and return the final score, final summary
+            # and the scoring rubric
+            final_score, final_summary, final_score_rubric = evaluate_rag_output(result, knowledge_base, contexts)
     
-        #  create a OrchestrationHelper object to store the results of the evaluation
-        result = OrchestrationRAGHelper(knowledge_base['name'], time_length, embedding_character_count, llm_character_count, char_process_time, input_embedding_cost, 
-                                     output_embedding_cost, embedding_total_cost, embedding_total_cost_1000, input_llm_cost, 
-                                     output_llm_cost, llm_total_cost, llm_total_cost_1000,
-                                     final_score, text_formatter(answers), final_summary)
-        # add the results of the evaluation to the results list
-        results_list.append(result.format())
-        # add the evaluation results written summary to the evaluation results string
-        evaluation_results += result.evaluation_results()            
-        # add the scoring rubric for the model into the scoring rubric list
-        score_rubric_list.append(final_score_rubric)
-
-    # Setting the display to max column width
-    pd.set_option('display.max_colwidth', None)
-    # Convert scoring rubric list into a DataFrame
-    score_rubric_df = pd.DataFrame(score_rubric_list)
-    # Convert performance and cost results list into a DataFrame
-    results_df = pd.DataFrame(results_list)
-    # Save this dataframe as a CSV file      
-    file_path = os.path.join('reports', 'model_performance_comparison.csv')
-    # Save DataFrame to CSV file
-    results_df.to_csv(file_path, index=False)
-    # Convert DataFrame to CSV format string to send to Bedrock for eval
-    csv_data = StringIO()
-    # Save DataFrame to CSV file
-    results_df.to_csv(csv_data, index=False)
-    # Move to start of StringIO object to read its content
-    csv_data.seek(0)
-    # Read CSV data from StringIO object (as a string)
-    csv_string = csv_data.getvalue()
-    # ask the model which is the best model to use for cost and performance
-    invoke_costs_eval_response = evaluate_rag_performance(csv_string, "anthropic.claude-3-sonnet-20240229-v1:0")
-    # chart out the performance and cost results
-    plot_rag_comparisons(results_df)
-    # plot the performance rubric scores 
-    plot_rag_performance_comparisons(score_rubric_df)
-    # Save the reports to a file
-    write_evaluation_results(evaluation_results, eval_name="summary")
-    write_evaluation_results(invoke_costs_eval_response, eval_name="cost")
-    #  return the results dataframe, evaluation results, invoke costs eval response and score rubric dataframe
-    return results_df, evaluation_results, invoke_costs_eval_response, score_rubric_df
+            #  create a OrchestrationHelper object to store the results of the evaluation
+            result = OrchestrationRAGHelper(knowledge_base['name'], time_length, embedding_character_count, llm_character_count, char_process_time, input_embedding_cost, 
+                                         output_embedding_cost, embedding_total_cost, embedding_total_cost_1000, input_llm_cost, 
+                                         output_llm_cost, llm_total_cost, llm_total_cost_1000,
+                                         final_score, text_formatter(answers), final_summary,
+                                         wall_time_length=wall_time_length, latency_stats=question_latency_stats)
+            # add the results of the evaluation to the results list
+            results_list.append(result.format())
+            # add the evaluation results written summary to the evaluation results string
+            evaluation_results += result.evaluation_results()            
+            # add the scoring rubric for the model into the scoring rubric list
+            score_rubric_list.append(final_score_rubric)
+            # Redraw the charts with every knowledge base evaluated so far, while the next one is evaluated
+            renderer.submit(plot_rag_comparisons, pd.DataFrame(results_list))
+            renderer.submit(plot_rag_performance_comparisons, pd.DataFrame(score_rubric_list))
+
+        logger.info("Token usage: %s", run_usage.summary())
+        logger.info("Response cache: %s", response_cache.stats())
+        # Setting the display to max column width
+        pd.set_option('display.max_colwidth', None)
+        # Convert scoring rubric list into a DataFrame
+        score_rubric_df = pd.DataFrame(score_rubric_list)
+        # Convert performance and cost results list into a DataFrame
+        results_df = pd.DataFrame(results_list)
+        # Save this dataframe as a CSV file      
+        file_path = os.path.join(report_dir, 'model_performance_comparison.csv')
+        # Save DataFrame to CSV file
+        results_df.to_csv(file_path, index=False)
+        # Convert DataFrame to CSV format string to send to Bedrock for eval
+        csv_data = StringIO()
+        # Save DataFrame to CSV file
+        results_df.to_csv(csv_data, index=False)
+        # Move to start of StringIO object to read its content
+        csv_data.seek(0)
+        # Read CSV data from StringIO object (as a string)
+        csv_string = csv_data.getvalue()
+        # ask the model which is the best model to use for cost and performance
+        invoke_costs_eval_response = evaluate_rag_performance(csv_string, "anthropic.claude-3-sonnet-20240229-v1:0")
+        # Save the reports to a file
+        write_evaluation_results(evaluation_results, eval_name="summary", output_dir=report_dir)
+        write_evaluation_results(invoke_costs_eval_response, eval_name="cost", output_dir=report_dir)
+        #  return the results dataframe, evaluation results, invoke costs eval response and score rubric dataframe
+        return results_df, evaluation_results, invoke_costs_eval_response, score_rubric_df
@@ -1,17 +1,45 @@
 from datetime import datetime
-import matplotlib.pyplot as plt
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
-from palettable.colorbrewer.qualitative import Set1_9, Pastel2_3
-from matplotlib.colors import ListedColormap
+from dotenv import load_dotenv
 
+# Setting up a logger with default settings
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+# Loading environment variables from a .env file
+load_dotenv()
 
-def write_evaluation_results(evaluation_results, eval_name="summary"):
+# Directory the per-run report directories are created in
+REPORTS_DIR = os.getenv("reports_dir", "reports")
+# "png" renders the charts with matplotlib, "html" writes interactive Plotly charts rendered by the browser, "none"
+# writes the reports without charts, e.g. for batch runs in containers without matplotlib
+CHART_FORMAT = os.getenv("report_chart_format", "png")
+
+
+def create_run_directory(base_dir=REPORTS_DIR):
+    """
+    Creates a report directory for one evaluation run, so concurrent runs never overwrite each other's reports.
+
+    :param base_dir: Optional. The directory the run directory is created in. Defaults to REPORTS_DIR.
+    :return: The path of the new directory, named after the start time of the run and a random suffix.
+    """
+    run_dir = os.path.join(base_dir, f"run-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}")
+    os.makedirs(run_dir)
+    return run_dir
+
+
+def write_evaluation_results(evaluation_results, eval_name="summary", output_dir="reports"):
     """
     Writes evaluation results to a text file.
 
     :param evaluation_results: The evaluation results to write to the file.
     :param eval_name: Optional. The name of the evaluation. Defaults to "summary".
+    :param output_dir: Optional. The directory the file is written to. Defaults to "reports".
     :return: None
     """
     # Get current date and time
@@ -19,18 +47,20 @@ def write_evaluation_results(evaluation_results, eval_name="summary"):
     # Format date and time as a string in the format "ddmmyyyyHHMMSS"
     dt_string = now.strftime("%d%m%Y%H%M%S")
     # Construct output file name using formatted date-time and evaluation name
-    output_file_name = f"reports/{eval_name}-evaluation_results-{dt_string}.txt"
+    output_file_name = os.path.join(output_dir, f"{eval_name}-evaluation_results-{dt_string}.txt")
     # Write evaluation results to the output file
     with open(output_file_name, "w") as f:
         f.write(evaluation_results)
 
 
-def plot_model_comparisons(results_df):
+def plot_model_comparisons(results_df, output_dir="reports", chart_format=None):
     """
     Plots comparisons between different models based on specified metrics.
 
     :param results_df: A pandas DataFrame containing the results of model comparisons.
-    :return: None
+    :param output_dir: Optional. The directory the chart is saved to. Defaults to "reports".
+    :param chart_format: Optional. "png" or "html" (interactive Plotly chart). Defaults to CHART_FORMAT.
+    :return: The path of the saved chart.
     """
     # Check if input is a pandas DataFrame
     if not isinstance(results_df, pd.DataFrame):
@@ -43,53 +73,106 @@ def plot_model_comparisons(results_df):
         missing_cols = required_columns - set(results_df.columns)
         raise ValueError(f"Missing required columns in the DataFrame: {missing_cols}")
 
+    # Interactive charts are drawn by the browser, nothing is rasterized here
+    if (chart_format or CHART_FORMAT) == "html":
+        return _plotly_model_comparisons(results_df, output_dir)
+
+    # Add a second row of streaming latency panels when at least one model was streamed
+    streamed = 'Time To First Token' in results_df.columns and results_df['Time To First Token'].notna().any()
+    rows = 2 if streamed else 1
+    Figure, _ = _import_matplotlib()
     # Set up the figure size and color palette
-    plt.figure(figsize=(15, 8))
-    colors = Set1_9.mpl_colors
+    fig = Figure(figsize=(15, 8 * rows))
+    colors = _set1_palette().mpl_colors
 
     # Plot Total Cost comparison
-    plt.subplot(1, 3, 1)  # Create subplot 1 out of 3
+    ax = fig.add_subplot(rows, 3, 1)  # Create subplot 1 out of 3
     results_df_sort = results_df.sort_values(by='Total Cost(1000)')  # Sort DataFrame by Total Cost
-    plt.bar(results_df_sort['Model'], results_df_sort['Total Cost(1000)'], color=colors[0])  # Plot bar chart
-    plt.xlabel('Model')  # Set x-axis label
-    plt.ylabel('Total Cost per 1000 docs')  # Set y-axis label
-    plt.title('Total Cost Comparison (1000 docs)\n (Lowest is best)')  # Set plot title
-    plt.xticks(rotation=90)  # Rotate x-axis labels for better readability
+    ax.bar(results_df_sort['Model'], results_df_sort['Total Cost(1000)'], color=colors[0])  # Plot bar chart
+    ax.set_xlabel('Model')  # Set x-axis label
+    ax.set_ylabel('Total Cost per 1000 docs')  # Set y-axis label
+    ax.set_title('Total Cost Comparison (1000 docs)\n (Lowest is best)')  # Set plot title
+    ax.tick_params(axis='x', labelrotation=90)  # Rotate x-axis labels for better readability
 
     # Plot Time Length comparison
-    plt.subplot(1, 3, 2)  # Create subplot 2 out of 3
+    ax = fig.add_subplot(rows, 3, 2)  # Create subplot 2 out of 3
     results_df_sort = results_df.sort_values(by='Time Length')  # Sort DataFrame by Time Length
-    plt.bar(results_df_sort['Model'], results_df_sort['Time Length'], color=colors[1])  # Plot bar chart
-    plt.xlabel('Model')  # Set x-axis label
-    plt.ylabel('Time Length (s)')  # Set y-axis label
-    plt.title('Time Length Comparison\n (Lowest is best)')  # Set plot title
-    plt.xticks(rotation=90)  # Rotate x-axis labels for better readability
+    # Draw the standard deviation as error bars when the models were benchmarked over repeated trials
+    if 'Latency Std' in results_df_sort.columns and results_df_sort['Latency Std'].notna().any():
+        ax.bar(results_df_sort['Model'], results_df_sort['Time Length'], yerr=results_df_sort['Latency Std'].fillna(0),
+                capsize=4, color=colors[1])  # Plot bar chart with error bars
+        ax.set_title('Time Length Comparison (p50 ± std)\n (Lowest is best)')  # Set plot title
+    else:
+        ax.bar(results_df_sort['Model'], results_df_sort['Time Length'], color=colors[1])  # Plot bar chart
+        ax.set_title('Time Length Comparison\n (Lowest is best)')  # Set plot title
+    ax.set_xlabel('Model')  # Set x-axis label
+    ax.set_ylabel('Time Length (s)')  # Set y-axis label
+    ax.tick_params(axis='x', labelrotation=90)  # Rotate x-axis labels for better readability
 
     # Plot Summary Score comparison
-    plt.subplot(1, 3, 3) # Create subplot 3 out of 3
+    ax = fig.add_subplot(rows, 3, 3) # Create subplot 3 out of 3
     results_df_sort = results_df.sort_values(by='Summary Score', ascending=False)  # Sort DataFrame by Summary Score
-    plt.bar(results_df_sort['Model'], results_df_sort['Summary Score'], color=colors[2])  # Plot bar chart
-    plt.xlabel('Model')  # Set x-axis label
-    plt.ylabel('Summary Score')  # Set y-axis label
-    plt.title('Summary Score Comparison\n (Highest is best)')  # Set plot title
-    plt.ylim(bottom=0, top=5)  # Set y-axis limits
-    plt.xticks(rotation=90)  # Rotate x-axis labels for better readability
+    ax.bar(results_df_sort['Model'], results_df_sort['Summary Score'], color=colors[2])  # Plot bar chart
+    ax.set_xlabel('Model')  # Set x-axis label
+    ax.set_ylabel('Summary Score')  # Set y-axis label
+    ax.set_title('Summary Score Comparison\n (Highest is best)')  # Set plot title
+    ax.set_ylim(bottom=0, top=5)  # Set y-axis limits
+    ax.tick_params(axis='x', labelrotation=90)  # Rotate x-axis labels for better readability
+
+    if streamed:
+        # Only the streamed models have latency metrics
+        streamed_df = results_df.dropna(subset=['Time To First Token'])
+
+        # Plot Time To First Token comparison
+        ax = fig.add_subplot(rows, 3, 4)  # Create subplot 4 out of 6
+        results_df_sort = streamed_df.sort_values(by='Time To First Token')  # Sort DataFrame by Time To First Token
+        ax.bar(results_df_sort['Model'], results_df_sort['Time To First Token'], color=colors[3])  # Plot bar chart
+        ax.set_xlabel('Model')  # Set x-axis label
+        ax.set_ylabel('Time To First Token (s)')  # Set y-axis label
+        ax.set_title('Time To First Token Comparison\n (Lowest is best)')  # Set plot title
+        ax.tick_params(axis='x', labelrotation=90)  # Rotate x-axis labels for better readability
+
+        # Plot Inter Token Latency comparison, the bar is the p50 and the error bar reaches up to the p99
+        ax = fig.add_subplot(rows, 3, 5)  # Create subplot 5 out of 6
+        results_df_sort = streamed_df.sort_values(by='Inter Token Latency P50')  # Sort DataFrame by the median
+        p50 = results_df_sort['Inter Token Latency P50'] * 1000
+        p99 = results_df_sort['Inter Token Latency P99'] * 1000
+        ax.bar(results_df_sort['Model'], p50, yerr=[np.zeros(len(p50)), p99 - p50], capsize=4,
+                color=colors[4])  # Plot bar chart
+        ax.scatter(results_df_sort['Model'], results_df_sort['Inter Token Latency P90'] * 1000, color='black',
+                    marker='_', s=200, zorder=3, label='p90')  # Mark the p90
+        ax.set_xlabel('Model')  # Set x-axis label
+        ax.set_ylabel('Inter Token Latency (ms)')  # Set y-axis label
+        ax.set_title('Inter Token Latency p50 (bar) to p99 (whisker)\n (Lowest is best)')  # Set plot title
+        ax.legend()
+        ax.tick_params(axis='x', labelrotation=90)  # Rotate x-axis labels for better readability
+
+        # Plot Tokens Per Second comparison
+        ax = fig.add_subplot(rows, 3, 6)  # Create subplot 6 out of 6
+        results_df_sort = streamed_df.sort_values(by='Tokens Per Second', ascending=False)  # Sort by throughput
+        ax.bar(results_df_sort['Model'], results_df_sort['Tokens Per Second'], color=colors[5])  # Plot bar chart
+        ax.set_xlabel('Model')  # Set x-axis label
+        ax.set_ylabel('Output Tokens Per Second')  # Set y-axis label
+        ax.set_title('Output Tokens Per Second Comparison\n (Highest is best)')  # Set plot title
+        ax.tick_params(axis='x', labelrotation=90)  # Rotate x-axis labels for better readability
 
     # Adjust layout for better presentation
-    plt.tight_layout()
-    # Save the plot as an image in the reports directory
-    plt.savefig("reports/graph.png")
-    # Close the plot to free up memory
-    plt.close()
+    fig.tight_layout()
+    # Save the plot as an image in the report directory
+    chart_path = os.path.join(output_dir, "graph.png")
+    fig.savefig(chart_path)
+    return chart_path
 
 
-def plot_model_performance_comparisons(results_df):
+def plot_model_performance_comparisons(results_df, output_dir="reports", chart_format=None):
     """
     Plots comparisons between different models based on specified metrics in a grouped bar chart,
     with each metric performance displayed as a separate series.
     
     :param results_df: A pandas DataFrame containing the results of model comparisons.
-    :return: None
+    :param output_dir: Optional. The directory the chart is saved to. Defaults to "reports".
+    :param chart_format: Optional. "png" or "html" (interactive Plotly chart). Defaults to CHART_FORMAT.
+    :return: The path of the saved chart.
     """
     
     # Check if input is a pandas DataFrame
@@ -112,20 +195,29 @@ def plot_model_performance_comparisons(results_df):
     
     models = results_df['model_name'].tolist()
 
+    # Interactive charts are drawn by the browser, nothing is rasterized here
+    if (chart_format or CHART_FORMAT) == "html":
+        return _plotly_grouped_scores(results_df, metrics, os.path.join(output_dir, "rubric_graph.html"))
+
+    Figure, colormaps = _import_matplotlib()
     # Create color map based on number of metrics 
-    colors_list = plt.get_cmap('Set1', 9).colors
+    colors_list = colormaps['Set1'].colors
     
     n_metrics = len(metrics)
     
-    fig, ax = plt.subplots(figsize=(12 + n_metrics, 8))  # Adjust figure size dynamically based on number of metrics
+    fig = Figure(figsize=(12 + n_metrics, 8))  # Adjust figure size dynamically based on number of metrics
+    ax = fig.subplots()
     bar_width = 0.05  # Adjust bar width for clarity
     
     for i, model in enumerate(models):
         positions = np.arange(len(metrics)) + i * (bar_width + 0.02)  # Positioning each group of bars
         
-        scores = results_df[results_df['model_name'] == model][metrics].values.flatten().astype(int)
-        rects = ax.bar(positions, scores, bar_width, label=model, color=colors_list[i % len(colors_list)])
-        ax.bar_label(rects)
+        # A criterion the judge could not score is None, it gets no bar instead of a bar at 0
+        scores = results_df[results_df['model_name'] == model][metrics].values.flatten().astype(float)
+        scored = ~np.isnan(scores)
+        rects = ax.bar(positions[scored], scores[scored], bar_width, label=model,
+                       color=colors_list[i % len(colors_list)])
+        ax.bar_label(rects, fmt='%g')
         
      # Add some text for labels, title and custom x-axis tick labels, etc.
     ax.set_ylabel('Scores')
@@ -134,7 +226,7 @@ def plot_model_performance_comparisons(results_df):
     ax.set_xticks(np.arange(len(metrics)) + bar_width * (len(models) - 1) / 2)
     ax.set_xticklabels(metrics)
      
-    plt.xticks(rotation=90)  # Rotate metric names for better visibility
+    ax.tick_params(axis='x', labelrotation=90)  # Rotate metric names for better visibility
     
     # Including model names within x-tick labels for clarity 
    # This requires custom formatting to intersperse metric names with model names dynamically.
@@ -146,19 +238,21 @@ def plot_model_performance_comparisons(results_df):
 
     ax.legend(loc='upper left', bbox_to_anchor=(1, 1), title="Models")
      
-    plt.subplots_adjust(right=0.75)  # Adjust right edge to accommodate legend
-    plt.ylim(bottom=0)  # Set y-axis bottom limit
-    plt.tight_layout()
-    plt.savefig("reports/rubric_graph.png")
-     
-    plt.close()
+    fig.subplots_adjust(right=0.75)  # Adjust right edge to accommodate legend
+    ax.set_ylim(bottom=0)  # Set y-axis bottom limit
+    fig.tight_layout()
+    chart_path = os.path.join(output_dir, "rubric_graph.png")
+    fig.savefig(chart_path)
+    return chart_path
 
-def plot_rag_comparisons(results_df):
+def plot_rag_comparisons(results_df, output_dir="reports", chart_format=None):
     """
     Plots comparisons between different models based on specified metrics.
 
     :param results_df: A pandas DataFrame containing the results of model comparisons.
-    :return: None
+    :param output_dir: Optional. The directory the chart is saved to. Defaults to "reports".
+    :param chart_format: Optional. "png" or "html" (interactive Plotly chart). Defaults to CHART_FORMAT.
+    :return: The path of the saved chart.
     """
     # Check if input is a pandas DataFrame
     if not isinstance(results_df, pd.DataFrame):
@@ -171,62 +265,69 @@ def plot_rag_comparisons(results_df):
         missing_cols = required_columns - set(results_df.columns)
         raise ValueError(f"Missing required columns in the DataFrame: {missing_cols}")
 
+    # Interactive charts are drawn by the browser, nothing is rasterized here
+    if (chart_format or CHART_FORMAT) == "html":
+        return _plotly_rag_comparisons(results_df, output_dir)
+
+    Figure, _ = _import_matplotlib()
     # Set up the figure size and color palette
-    plt.figure(figsize=(15, 8))
-    colors = Set1_9.mpl_colors
+    fig = Figure(figsize=(15, 8))
+    colors = _set1_palette().mpl_colors
 
     # Plot Total Cost comparison
-    plt.subplot(1, 4, 1)  # Create subplot 1 out of 4
+    ax = fig.add_subplot(1, 4, 1)  # Create subplot 1 out of 4
     results_df_sort = results_df.sort_values(by='Total Embedding Cost(1000)')  # Sort DataFrame by Total Cost
-    plt.bar(results_df_sort['Model'], results_df_sort['Total Embedding Cost(1000)'], color=colors[0])  # Plot bar chart
-    plt.xlabel('Model')  # Set x-axis label
-    plt.ylabel('Total Cost per 1000 embeddings')  # Set y-axis label
-    plt.title('Total Cost Comparison (1000 embeddings)\n (Lowest is best)')  # Set plot title
-    plt.xticks(rotation=90)  # Rotate x-axis labels for better readability
+    ax.bar(results_df_sort['Model'], results_df_sort['Total Embedding Cost(1000)'], color=colors[0])  # Plot bar chart
+    ax.set_xlabel('Model')  # Set x-axis label
+    ax.set_ylabel('Total Cost per 1000 embeddings')  # Set y-axis label
+    ax.set_title('Total Cost Comparison (1000 embeddings)\n (Lowest is best)')  # Set plot title
+    ax.tick_params(axis='x', labelrotation=90)  # Rotate x-axis labels for better readability
 
     # Plot Total Cost comparison
-    plt.subplot(1, 4, 2)  # Create subplot 2 out of 4
+    ax = fig.add_subplot(1, 4, 2)  # Create subplot 2 out of 4
     results_df_sort = results_df.sort_values(by='Total LLM Cost(1000)')  # Sort DataFrame by Total Cost
-    plt.bar(results_df_sort['Model'], results_df_sort['Total LLM Cost(1000)'], color=colors[0])  # Plot bar chart
-    plt.xlabel('Model')  # Set x-axis label
-    plt.ylabel('Total Cost per 1000 llm invocations')  # Set y-axis label
-    plt.title('Total Cost Comparison (1000 invocations)\n (Lowest is best)')  # Set plot title
-    plt.xticks(rotation=90)  # Rotate x-axis labels for better readability
+    ax.bar(results_df_sort['Model'], results_df_sort['Total LLM Cost(1000)'], color=colors[0])  # Plot bar chart
+    ax.set_xlabel('Model')  # Set x-axis label
+    ax.set_ylabel('Total Cost per 1000 llm invocations')  # Set y-axis label
+    ax.set_title('Total Cost Comparison (1000 invocations)\n (Lowest is best)')  # Set plot title
+    ax.tick_params(axis='x', labelrotation=90)  # Rotate x-axis labels for better readability
 
     # Plot Time Length comparison
-    plt.subplot(1, 4, 3)  # Create subplot 3 out of 4
+    ax = fig.add_subplot(1, 4, 3)  # Create subplot 3 out of 4
     results_df_sort = results_df.sort_values(by='Time Length')  # Sort DataFrame by Time Length
-    plt.bar(results_df_sort['Model'], results_df_sort['Time Length'], color=colors[1])  # Plot bar chart
-    plt.xlabel('Model')  # Set x-axis label
-    plt.ylabel('Time Length (s)')  # Set y-axis label
-    plt.title('Time Length Comparison\n (Lowest is best)')  # Set plot title
-    plt.xticks(rotation=90)  # Rotate x-axis labels for better readability
+    ax.bar(results_df_sort['Model'], results_df_sort['Time Length'], color=colors[1])  # Plot bar chart
+    ax.set_xlabel('Model')  # Set x-axis label
+    ax.set_ylabel('Time Length (s)')  # Set y-axis label
+    ax.set_title('Time Length Comparison\n (Lowest is best)')  # Set plot title
+    ax.tick_params(axis='x', labelrotation=90)  # Rotate x-axis labels for better readability
 
     # Plot Summary Score comparison
-    plt.subplot(1, 4, 4) # Create subplot 4 out of 4
+    ax = fig.add_subplot(1, 4, 4) # Create subplot 4 out of 4
     results_df_sort = results_df.sort_values(by='Score', ascending=False)  # Sort DataFrame by Summary Score
-    plt.bar(results_df_sort['Model'], results_df_sort['Score'], color=colors[2])  # Plot bar chart
-    plt.xlabel('Model')  # Set x-axis label
-    plt.ylabel('Score')  # Set y-axis label
-    plt.title('Score Comparison\n (Highest is best)')  # Set plot title
-    plt.ylim(bottom=0, top=1)  # Set y-axis limits
-    plt.xticks(rotation=90)  # Rotate x-axis labels for better readability
+    ax.bar(results_df_sort['Model'], results_df_sort['Score'], color=colors[2])  # Plot bar chart
+    ax.set_xlabel('Model')  # Set x-axis label
+    ax.set_ylabel('Score')  # Set y-axis label
+    ax.set_title('Score Comparison\n (Highest is best)')  # Set plot title
+    ax.set_ylim(bottom=0, top=1)  # Set y-axis limits
+    ax.tick_params(axis='x', labelrotation=90)  # Rotate x-axis labels for better readability
 
     # Adjust layout for better presentation
-    plt.tight_layout()
-    # Save the plot as an image in the reports directory
-    plt.savefig("reports/graph.png")
-    # Close the plot to free up memory
-    plt.close()
+    fig.tight_layout()
+    # Save the plot as an image in the report directory
+    chart_path = os.path.join(output_dir, "graph.png")
+    fig.savefig(chart_path)
+    return chart_path
 
 
-def plot_rag_performance_comparisons(results_df):
+def plot_rag_performance_comparisons(results_df, output_dir="reports", chart_format=None):
     """
     Plots comparisons between different models based on specified metrics in a grouped bar chart,
     with each metric performance displayed as a separate series.
     
     :param results_df: A pandas DataFrame containing the results of model comparisons.
-    :return: None
+    :param output_dir: Optional. The directory the chart is saved to. Defaults to "reports".
+    :param chart_format: Optional. "png" or "html" (interactive Plotly chart). Defaults to CHART_FORMAT.
+    :return: The path of the saved chart.
     """
     
     # Check if input is a pandas DataFrame
@@ -242,7 +343,7 @@ def plot_rag_performance_comparisons(results_df):
     
     # Check if required columns are present in the DataFrame
     if not required_columns.issubset(results_df.columns):
-        print(results_df)
+        logger.error("RAG results without the required columns:\n%s", results_df)
         missing_cols = required_columns - set(results_df.columns)
         raise ValueError(f"Missing required columns in the DataFrame: {missing_cols}")
     
@@ -251,12 +352,18 @@ def plot_rag_performance_comparisons(results_df):
     
     models = results_df['model_name'].tolist()
 
+    # Interactive charts are drawn by the browser, nothing is rasterized here
+    if (chart_format or CHART_FORMAT) == "html":
+        return _plotly_grouped_scores(results_df, metrics, os.path.join(output_dir, "rubric_graph.html"))
+
+    Figure, colormaps = _import_matplotlib()
     # Create color map based on number of metrics 
-    colors_list = plt.get_cmap('Set1', 9).colors
+    colors_list = colormaps['Set1'].colors
     
     n_metrics = len(metrics)
     
-    fig, ax = plt.subplots(figsize=(12 + n_metrics, 8))  # Adjust figure size dynamically based on number of metrics
+    fig = Figure(figsize=(12 + n_metrics, 8))  # Adjust figure size dynamically based on number of metrics
+    ax = fig.subplots()
     bar_width = 0.05  # Adjust bar width for clarity
     
     for i, model in enumerate(models):
@@ -273,7 +380,7 @@ def plot_rag_performance_comparisons(results_df):
     ax.set_xticks(np.arange(len(metrics)) + bar_width * (len(models) - 1) / 2)
     ax.set_xticklabels(metrics)
      
-    plt.xticks(rotation=90)  # Rotate metric names for better visibility
+    ax.tick_params(axis='x', labelrotation=90)  # Rotate metric names for better visibility
     
     # Including model names within x-tick labels for clarity 
    # This requires custom formatting to intersperse metric names with model names dynamically.
@@ -285,9 +392,176 @@ def plot_rag_performance_comparisons(results_df):
 
     ax.legend(loc='upper left', bbox_to_anchor=(1, 1), title="Models")
      
-    plt.subplots_adjust(right=0.75)  # Adjust right edge to accommodate legend
-    plt.ylim(bottom=0)  # Set y-axis bottom limit
-    plt.tight_layout()
-    plt.savefig("reports/rubric_graph.png")
-     
-    plt.close()
\ No newline at end of file
+    fig.subplots_adjust(right=0.75)  # Adjust right edge to accommodate legend
+    ax.set_ylim(bottom=0)  # Set y-axis bottom limit
+    fig.tight_layout()
+    chart_path = os.path.join(output_dir, "rubric_graph.png")
+    fig.savefig(chart_path)
+    return chart_path
+
+
+def _import_matplotlib():
+    # matplotlib is only imported when a png chart is drawn, the command line may not draw any
+    from matplotlib import colormaps
+    from matplotlib.figure import Figure
+    return Figure, colormaps
+
+
+def _set1_palette():
+    # The ColorBrewer Set1 palette shared by the png and html charts
+    from palettable.colorbrewer.qualitative import Set1_9
+    return Set1_9
+
+
+def _import_plotly():
+    # Plotly is only needed for the interactive chart format
+    try:
+        import plotly.graph_objects as go
+        from plotly.subplots import make_subplots
+    except ImportError as err:
+        raise ImportError("The html chart format needs plotly, install it with 'pip install plotly' or use the png "
+                          "chart format") from err
+    return go, make_subplots
+
+
+def _plotly_bar_panels(panels, chart_path, columns):
+    """
+    Writes bar chart panels to a standalone HTML file, the plotly.js library is loaded from its CDN.
+
+    :param panels: A list of (DataFrame, value column, panel title, error_y) tuples, error_y being a Plotly error bar
+    dict or None. The bars are drawn in the order of the DataFrame.
+    :param chart_path: The path of the HTML file.
+    :param columns: The number of panels per row.
+    :return: The path of the HTML file.
+    """
+    go, make_subplots = _import_plotly()
+    rows = -(-len(panels) // columns)
+    fig = make_subplots(rows=rows, cols=columns, subplot_titles=[panel[2] for panel in panels])
+    colors = _set1_palette().hex_colors
+    for index, (panel_df, column, _, error_y) in enumerate(panels):
+        fig.add_trace(go.Bar(x=panel_df['Model'], y=panel_df[column], name=column, error_y=error_y,
+                             marker_color=colors[index % len(colors)], showlegend=False),
+                      row=index // columns + 1, col=index % columns + 1)
+    fig.update_layout(height=500 * rows)
+    fig.write_html(chart_path, include_plotlyjs="cdn")
+    return chart_path
+
+
+def _plotly_model_comparisons(results_df, output_dir):
+    # Same panels as the matplotlib chart, hovering shows the exact values
+    time_df = results_df.sort_values(by='Time Length')
+    time_error = None
+    if 'Latency Std' in time_df.columns and time_df['Latency Std'].notna().any():
+        time_error = dict(type="data", array=time_df['Latency Std'].fillna(0))
+    panels = [
+        (results_df.sort_values(by='Total Cost(1000)'), 'Total Cost(1000)',
+         'Total Cost per 1000 docs (Lowest is best)', None),
+        (time_df, 'Time Length', 'Time Length (s) (Lowest is best)', time_error),
+        (results_df.sort_values(by='Summary Score', ascending=False), 'Summary Score',
+         'Summary Score (Highest is best)', None),
+    ]
+    if 'Time To First Token' in results_df.columns and results_df['Time To First Token'].notna().any():
+        streamed_df = results_df.dropna(subset=['Time To First Token'])
+        latency_df = streamed_df.sort_values(by='Inter Token Latency P50').assign(
+            **{'Inter Token Latency P50 (ms)': lambda df: df['Inter Token Latency P50'] * 1000})
+        panels += [
+            (streamed_df.sort_values(by='Time To First Token'), 'Time To First Token',
+             'Time To First Token (s) (Lowest is best)', None),
+            (latency_df, 'Inter Token Latency P50 (ms)', 'Inter Token Latency p50 to p99 (ms) (Lowest is best)',
+             dict(type="data", symmetric=False, arrayminus=np.zeros(len(latency_df)),
+                  array=(latency_df['Inter Token Latency P99'] - latency_df['Inter Token Latency P50']) * 1000)),
+            (streamed_df.sort_values(by='Tokens Per Second', ascending=False), 'Tokens Per Second',
+             'Output Tokens Per Second (Highest is best)', None),
+        ]
+    return _plotly_bar_panels(panels, os.path.join(output_dir, "graph.html"), columns=3)
+
+
+def _plotly_rag_comparisons(results_df, output_dir):
+    # Same panels as the matplotlib chart, hovering shows the exact values
+    panels = [
+        (results_df.sort_values(by='Total Embedding Cost(1000)'), 'Total Embedding Cost(1000)',
+         'Total Cost per 1000 embeddings (Lowest is best)', None),
+        (results_df.sort_values(by='Total LLM Cost(1000)'), 'Total LLM Cost(1000)',
+         'Total Cost per 1000 llm invocations (Lowest is best)', None),
+        (results_df.sort_values(by='Time Length'), 'Time Length', 'Time Length (s) (Lowest is best)', None),
+        (results_df.sort_values(by='Score', ascending=False), 'Score', 'Score (Highest is best)', None),
+    ]
+    return _plotly_bar_panels(panels, os.path.join(output_dir, "graph.html"), columns=4)
+
+
+def _plotly_grouped_scores(results_df, metrics, chart_path):
+    # One series per model, grouped by metric, a criterion that was not scored is NaN and gets no bar
+    go, _ = _import_plotly()
+    fig = go.Figure([
+        go.Bar(name=model, x=metrics,
+               y=results_df[results_df['model_name'] == model][metrics].values.flatten().astype(float))
+        for model in results_df['model_name']
+    ])
+    fig.update_layout(barmode="group", title="Model Performance Scores (Highest is best)", yaxis_title="Scores",
+                      legend_title="Models")
+    fig.write_html(chart_path, include_plotlyjs="cdn")
+    return chart_path
+
+
+class ReportRenderer:
+    """
+    Renders report charts in a background thread while the evaluation goes on.
+
+    Charts are re-rendered as results arrive. When the same chart is requested again before its previous request
+    was rendered, only the latest results are drawn.
+    """
+
+    def __init__(self, output_dir, chart_format=None):
+        """
+        Initializes an instance of the ReportRenderer class.
+
+        :param output_dir: The directory the charts are saved to.
+        :param chart_format: Optional. "png" or "html", see plot_model_comparisons, or "none" to draw no charts.
+        Defaults to CHART_FORMAT.
+        """
+        self.output_dir = output_dir
+        self.chart_format = chart_format or CHART_FORMAT
+        # A single worker, the charts of a run are rendered one at a time
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="report-renderer")
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def submit(self, plot_function, results_df):
+        """
+        Queues a chart to be rendered from a snapshot of the results.
+
+        :param plot_function: One of the plot_* functions of this module.
+        :param results_df: The results to plot.
+        :return: None
+        """
+        if self.chart_format == "none":
+            return
+        with self._lock:
+            queued = plot_function in self._pending
+            self._pending[plot_function] = results_df.copy()
+        if not queued:
+            self._executor.submit(self._render, plot_function)
+
+    def _render(self, plot_function):
+        # Take the latest results of the chart, later submissions start a new render
+        with self._lock:
+            results_df = self._pending.pop(plot_function)
+        try:
+            plot_function(results_df, self.output_dir, self.chart_format)
+        except Exception:
+            logger.exception("Could not render %s", plot_function.__name__)
+
+    def close(self, wait=True):
+        """
+        Stops the renderer once the queued charts are rendered.
+
+        :param wait: Optional. Set to False to return without waiting for the queued charts.
+        :return: None
+        """
+        self._executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -1,101 +1,160 @@
-# TODO: Edit model versions available to choose
-# TODO: We need to validate the Claude 3 Haiku pricing, it seems to be constantly returning 0
-def calculate_input_price(token_number, model_id):
+import functools
+import json
+import logging
+import os
+import pandas as pd
+from dotenv import load_dotenv
+
+# Setting up a logger with default settings
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+# Loading environment variables from a .env file
+load_dotenv()
+
+# The versioned price table, a JSON file (see pricing_tables/bedrock.json) or a CSV file with model_id, tier, input
+# and output columns. Prices are per 1000 tokens, provisioned tiers may give an hourly price per model unit instead.
+PRICE_TABLE_PATH = os.getenv("price_table_path",
+                             os.path.join(os.path.dirname(os.path.abspath(__file__)), "pricing_tables", "bedrock.json"))
+# The pricing tier used when none is given, e.g. "on_demand" or "batch"
+DEFAULT_PRICING_TIER = os.getenv("pricing_tier", "on_demand")
+PRICE_COLUMNS = ["input", "output", "hourly"]
+# Prompt caching prices relative to the input price: reading a cached prefix costs a tenth of the input price,
+# writing it to the cache costs a quarter more than sending it uncached
+CACHE_READ_PRICE_RATIO = float(os.getenv("cache_read_price_ratio", "0.1"))
+CACHE_WRITE_PRICE_RATIO = float(os.getenv("cache_write_price_ratio", "1.25"))
+
+
+def load_price_table(path=PRICE_TABLE_PATH):
+    """
+    Loads a price table into a DataFrame indexed by model ID and tier.
+
+    :param path: The path of the JSON or CSV price table.
+    :return: A DataFrame with the input and output prices per 1000 tokens and the hourly price of every (model_id,
+    tier) pair. The version of the table is kept in its attrs.
+    """
+    if path.lower().endswith(".csv"):
+        prices_df = pd.read_csv(path)
+        version = str(prices_df.pop("version").iloc[0]) if "version" in prices_df else None
+    else:
+        with open(path) as price_file:
+            table = json.load(price_file)
+        version = table.get("version")
+        prices_df = pd.DataFrame([{"model_id": model_id, "tier": tier, **prices}
+                                  for model_id, tiers in table["models"].items() for tier, prices in tiers.items()])
+    prices_df = prices_df.reindex(columns=["model_id", "tier"] + PRICE_COLUMNS).set_index(["model_id", "tier"])
+    prices_df[PRICE_COLUMNS] = prices_df[PRICE_COLUMNS].astype(float)
+    prices_df.attrs["version"] = version
+    logger.info("Loaded price table %s (version %s, %d prices)", path, version, len(prices_df))
+    return prices_df
+
+
+@functools.lru_cache(maxsize=None)
+def get_price_table(path=PRICE_TABLE_PATH):
+    """
+    Returns the price table, loaded once per process.
+
+    :param path: Optional. The path of the price table.
+    :return: The DataFrame returned by load_price_table.
+    """
+    return load_price_table(path)
+
+
+def tier_prices(tier, price_table=None):
+    """
+    Returns the prices of one pricing tier.
+
+    :param tier: The pricing tier, e.g. "on_demand" or "batch".
+    :param price_table: Optional. A DataFrame returned by load_price_table, defaults to the configured price table.
+    :return: The rows of the tier, indexed by model ID.
+    :raises ValueError: If the price table has no price in that tier.
+    """
+    price_table = get_price_table() if price_table is None else price_table
+    tiers = price_table.index.get_level_values("tier").unique()
+    if tier not in tiers:
+        raise ValueError(f"Unknown pricing tier {tier!r}, the price table (version "
+                         f"{price_table.attrs.get('version')}) has: {', '.join(sorted(tiers))}")
+    return price_table.xs(tier, level="tier")
+
+
+@functools.lru_cache(maxsize=None)
+def _token_prices(tier):
+    # Per-tier {model_id: (input price, output price)} lookup for the per-invocation functions
+    tier_df = tier_prices(tier).fillna({"input": 0, "output": 0})
+    return {model_id: (float(row.input), float(row.output)) for model_id, row in tier_df.iterrows()}
+
+
+def _inference_profile_model_id(model_id, priced_model_ids):
+    # Cross-region inference profiles (e.g. "us.anthropic...") are priced as the model they route to
+    if (isinstance(model_id, str) and model_id not in priced_model_ids and model_id.count(".") > 1
+            and model_id.split(".", 1)[1] in priced_model_ids):
+        return model_id.split(".", 1)[1]
+    return model_id
+
+
+def _priced_model_id(model_id, tier):
+    return _inference_profile_model_id(model_id, _token_prices(tier))
+
+
+@functools.lru_cache(maxsize=None)
+def _warn_unknown_model(model_id, tier):
+    # Warn once per model, an unknown model is priced at 0
+    logger.warning("No %s price for %s in the price table (version %s), its cost is reported as 0", tier, model_id,
+                   get_price_table().attrs.get("version"))
+
+
+def is_priced(model_id, tier=DEFAULT_PRICING_TIER):
+    """
+    Checks whether the price table has token prices for a model.
+
+    :param model_id: Identifier of the model (str).
+    :param tier: Optional. The pricing tier.
+    :return: True if the model has a price in that tier.
+    :raises ValueError: If the price table has no price in the tier.
+    """
+    return _priced_model_id(model_id, tier) in _token_prices(tier)
+
+
+def calculate_input_price(token_number, model_id, tier=DEFAULT_PRICING_TIER):
     """
     Calculate the cost for a given number of input tokens based on the model used.
 
     :param token_number: Number of input tokens (int).
     :param model_id: Identifier of the model (str).
-    :return: The cost calculated based on the input tokens and the model used (float).Returns 0 if the model_id is not
-    found in the predefined dictionary.
-    """
-    # Dictionary containing prices per 1000 tokens for different models
-    model_input_token_prices = {
-        'amazon.titan-embed-text-v1': 0.0001,
-        'amazon.titan-embed-text-v2:0': 0.00002,
-        'amazon.titan-text-lite-v1': 0.0003,
-        'amazon.titan-text-express-v1': 0.0075,
-        'ai21.j2-mid-v1': 0.0125,
-        'ai21.j2-ultra-v1': 0.0188,
-        'anthropic.claude-instant-v1': 0.00080,
-        'anthropic.claude-v2': 0.00800,
-        'anthropic.claude-v2:1': 0.00800,
-        'anthropic.claude-3-sonnet-20240229-v1:0': 0.00300,
-        'anthropic.claude-3-haiku-20240307-v1:0': 0.0002500,
-        'cohere.command-text-v14': 0.0015,
-        'cohere.command-light-text-v14': 0.0003,
-        'cohere.embed-english-v3': 0.0001,
-        'cohere.embed-multilingual-v3': 0.0001,
-        'meta.llama2-13b-chat-v1': 0.00075,
-        'meta.llama2-70b-chat-v1': 0.00195,
-        'meta.llama3-8b-instruct-v1:0': 0.0004,
-        'meta.llama3-70b-instruct-v1:0': 0.00265,
-        'mistral.mistral-large-2402-v1:0': 0.008,
-        'mistral.mistral-7b-instruct-v0:2': 0.00015,
-        'mistral.mixtral-8x7b-instruct-v0:1': 0.00045,
-        'gpt-4-0125-preview': 0.01,
-        'gpt-4-32k': 0.06
-    }
-
-    # Check if the provided model_id exists in our dictionary
-    if model_id in model_input_token_prices:
-        # Get the price per 1000 input tokens for the given model_id
-        price_per_1000_tokens = model_input_token_prices[model_id]
-        # Calculate the cost for the given number of input tokens
-        cost = (token_number / 1000) * price_per_1000_tokens
-        # return the final input token cost, rounded to the 8 decimal place
-        return round(cost, 8)
-    else:
-        # Return 0 if the model_id is not found in the dictionary
+    :param tier: Optional. The pricing tier, e.g. "on_demand" or "batch".
+    :return: The cost calculated based on the input tokens and the model used (float). Returns 0, and logs a warning,
+    if the model_id is not found in the price table.
+    :raises ValueError: If the price table has no price in the tier.
+    """
+    # Check if the provided model_id exists in the price table
+    model_id = _priced_model_id(model_id, tier)
+    if model_id not in _token_prices(tier):
+        _warn_unknown_model(model_id, tier)
         return 0
+    # Calculate the cost for the given number of input tokens, rounded to the 8 decimal place
+    return round((token_number / 1000) * _token_prices(tier)[model_id][0], 8)
 
 
-def calculate_output_price(token_number, model_id):
+def calculate_output_price(token_number, model_id, tier=DEFAULT_PRICING_TIER):
     """
     Calculate the cost for a given number of output tokens based on the model used.
 
     :param token_number: Number of output tokens (int).
     :param model_id: Identifier of the model (str).
-    :return: The cost calculated based on the output tokens and the model used (float).
-             Returns 0 if the model_id is not found in the predefined dictionary.
-    """
-    # Dictionary containing prices per 1000 output tokens for different models
-    model_output_token_prices = {
-        'amazon.titan-text-lite-v1': 0.0004,
-        'amazon.titan-text-express-v1': 0.0016,
-        'ai21.j2-mid-v1': 0.0125,
-        'ai21.j2-ultra-v1': 0.0188,
-        'anthropic.claude-instant-v1': 0.00240,
-        'anthropic.claude-v2': 0.02400,
-        'anthropic.claude-v2:1': 0.02400,
-        'anthropic.claude-3-sonnet-20240229-v1:0': 0.01500,
-        'anthropic.claude-3-haiku-20240307-v1:0': 0.0012500,
-        'cohere.command-text-v14': 0.00200,
-        'cohere.command-light-text-v14': 0.00060,
-        'meta.llama2-13b-chat-v1': 0.00100,
-        'meta.llama2-70b-chat-v1': 0.00256,
-        'meta.llama3-8b-instruct-v1:0': 0.0006,
-        'meta.llama3-70b-instruct-v1:0': 0.0035,
-        'mistral.mistral-large-2402-v1:0': 0.024,
-        'mistral.mistral-7b-instruct-v0:2': 0.00020,
-        'mistral.mixtral-8x7b-instruct-v0:1': 0.00070,
-        'gpt-4-0125-preview': 0.03,
-        'gpt-4-32k': 0.12
-    }
-    # Check if the provided model_id exists in our dictionary
-    if model_id in model_output_token_prices:
-        # Get the price per 1000 output tokens for the given model_id
-        price_per_1000_tokens = model_output_token_prices[model_id]
-        # Calculate the cost for the given number of output tokens
-        cost = (token_number / 1000) * price_per_1000_tokens
-        # return the final output token cost, rounded to the 8 decimal place
-        return round(cost, 8)
-    else:
-        # Return 0 if the model_id is not found in the dictionary
+    :param tier: Optional. The pricing tier, e.g. "on_demand" or "batch".
+    :return: The cost calculated based on the output tokens and the model used (float). Returns 0, and logs a
+    warning, if the model_id is not found in the price table.
+    :raises ValueError: If the price table has no price in the tier.
+    """
+    # Check if the provided model_id exists in the price table
+    model_id = _priced_model_id(model_id, tier)
+    if model_id not in _token_prices(tier):
+        _warn_unknown_model(model_id, tier)
         return 0
+    # Calculate the cost for the given number of output tokens, rounded to the 8 decimal place
+    return round((token_number / 1000) * _token_prices(tier)[model_id][1], 8)
+
 
-# TODO: Document this function better
-def calculate_total_price(input_tokens, output_tokens, model):
+def calculate_total_price(input_tokens, output_tokens, model, tier=DEFAULT_PRICING_TIER):
     """
     Calculate the input token cost, output token cost, total cost for one invocation and total cost for 1000 invocations based on
     a given number of input and output tokens and on the specific model used.
@@ -103,14 +162,132 @@ def calculate_total_price(input_tokens, output_tokens, model):
     :param input_tokens: Number of input tokens (int).
     :param output_tokens: Number of output tokens (int).
     :param model: Identifier of the model (str).
+    :param tier: Optional. The pricing tier, e.g. "on_demand" or "batch".
     :return: The input token cost, output token cost, and total cost, and total cost per 1000 invocations calculated based on
     the input and output tokens and the model used (float).
     """
     # Calculate the input and output token costs
-    input_cost = calculate_input_price(input_tokens, model)
-    output_cost = calculate_output_price(output_tokens, model)
+    input_cost = calculate_input_price(input_tokens, model, tier)
+    output_cost = calculate_output_price(output_tokens, model, tier)
     # Calculate the total cost
     total_cost = round(input_cost + output_cost, 6)
     total_cost_1000 = round(total_cost * 1000, 6)
     # return the final total cost, rounded to the 8 decimal place
     return input_cost, output_cost, total_cost, total_cost_1000
+
+
+def calculate_prompt_cache_price(cache_read_tokens, cache_write_tokens, model, tier=DEFAULT_PRICING_TIER):
+    """
+    Calculate the cost of the prompt cache tokens of an invocation, and what these tokens would have cost uncached.
+
+    Bedrock reports the input tokens read from and written to the prompt cache separately from the other input
+    tokens, so this cost comes on top of calculate_total_price.
+
+    :param cache_read_tokens: Number of input tokens read from the prompt cache (int).
+    :param cache_write_tokens: Number of input tokens written to the prompt cache (int).
+    :param model: Identifier of the model (str).
+    :param tier: Optional. The pricing tier, e.g. "on_demand" or "batch".
+    :return: The cost of the cache tokens and the cost of the same tokens sent without prompt caching (float).
+    """
+    # The price of the same tokens sent as plain input tokens
+    uncached_cost = calculate_input_price(cache_read_tokens + cache_write_tokens, model, tier)
+    # Cache reads and writes are priced relative to the input price
+    cache_cost = round(calculate_input_price(cache_read_tokens, model, tier) * CACHE_READ_PRICE_RATIO +
+                       calculate_input_price(cache_write_tokens, model, tier) * CACHE_WRITE_PRICE_RATIO, 8)
+    return cache_cost, uncached_cost
+
+
+def calculate_map_reduce_price(map_reduce_usage, model):
+    """
+    Calculate the cost of the map step and of the reduce step of a map-reduce summarization separately.
+
+    :param map_reduce_usage: The map_reduce_usage dictionary of a map-reduce summarization, holding the input and
+    output tokens of the map step and of the reduce step.
+    :param model: Identifier of the model (str).
+    :return: The total cost of the map step and the total cost of the reduce step (float).
+    """
+    # Calculate the cost of the chunk summaries
+    _, _, map_cost, _ = calculate_total_price(map_reduce_usage["map_input_tokens"],
+                                              map_reduce_usage["map_output_tokens"], model)
+    # Calculate the cost of merging the chunk summaries and completing the task
+    _, _, reduce_cost, _ = calculate_total_price(map_reduce_usage["reduce_input_tokens"],
+                                                 map_reduce_usage["reduce_output_tokens"], model)
+    # return the map and reduce costs
+    return map_cost, reduce_cost
+
+
+def price_token_columns(results_df, model_column="Model", input_tokens_column="Input Tokens",
+                        output_tokens_column="Output Tokens", tier=DEFAULT_PRICING_TIER, price_table=None,
+                        warn_unpriced=True):
+    """
+    Prices whole columns of token counts at once, e.g. the per-document results of a corpus evaluation.
+
+    :param results_df: A DataFrame with a model ID column and input and output token count columns.
+    :param model_column: Optional. The name of the model ID column.
+    :param input_tokens_column: Optional. The name of the input token count column.
+    :param output_tokens_column: Optional. The name of the output token count column.
+    :param tier: Optional. The pricing tier, e.g. "on_demand" or "batch".
+    :param price_table: Optional. A DataFrame returned by load_price_table, defaults to the configured price table.
+    :param warn_unpriced: Optional. Set to False to not log the models missing from the price table.
+    :return: A DataFrame aligned with results_df with the Input Cost, Output Cost and Total Cost of every row, and a
+    Priced column that is False (and the costs NaN) for the models missing from the price table.
+    :raises ValueError: If the price table has no price in the tier.
+    """
+    price_table = get_price_table() if price_table is None else price_table
+    tier_df = tier_prices(tier, price_table)
+    # Price the inference profiles of every row as their model, like the per-invocation functions
+    models = results_df[model_column]
+    priced_model_ids = set(tier_df.index)
+    priced_models = models.map({model_id: _inference_profile_model_id(model_id, priced_model_ids)
+                                for model_id in models.unique()})
+    # Look the prices of every row up in one pass
+    input_prices = priced_models.map(tier_df["input"])
+    output_prices = priced_models.map(tier_df["output"])
+    priced = input_prices.notna()
+    if warn_unpriced and not priced.all():
+        logger.warning("No %s price in the price table (version %s) for: %s", tier, price_table.attrs.get("version"),
+                       ", ".join(sorted(models[~priced].astype(str).unique())))
+    input_costs = results_df[input_tokens_column] / 1000 * input_prices
+    output_costs = results_df[output_tokens_column] / 1000 * output_prices.fillna(0).where(priced)
+    return pd.DataFrame({
+        "Input Cost": input_costs,
+        "Output Cost": output_costs,
+        "Total Cost": input_costs + output_costs,
+        "Priced": priced,
+    }, index=results_df.index)
+
+
+def project_costs(results_df, calls_per_day, model_column="Model", input_tokens_column="Input Tokens",
+                  output_tokens_column="Output Tokens", tiers=None, price_table=None):
+    """
+    Projects the daily and monthly cost of every model at a given volume from measured token counts, e.g. what
+    summarizing 1M documents a day would cost with each model.
+
+    :param results_df: A DataFrame with one row per measured call, see price_token_columns.
+    :param calls_per_day: The projected number of calls per day.
+    :param model_column: Optional. The name of the model ID column.
+    :param input_tokens_column: Optional. The name of the input token count column.
+    :param output_tokens_column: Optional. The name of the output token count column.
+    :param tiers: Optional. The pricing tiers to compare. Defaults to every token-priced tier of the price table.
+    :param price_table: Optional. A DataFrame returned by load_price_table, defaults to the configured price table.
+    :return: A DataFrame with one row per model and tier: the mean tokens and cost per call, and the daily and
+    30-day cost. Models without a price in a tier are left out of that tier.
+    """
+    price_table = get_price_table() if price_table is None else price_table
+    if tiers is None:
+        tiers = price_table["input"].dropna().index.get_level_values("tier").unique()
+    # Average the measured calls of every model, then price the averages of all models at once per tier
+    mean_df = results_df.groupby(model_column)[[input_tokens_column, output_tokens_column]].mean().reset_index()
+    projections = []
+    for tier in tiers:
+        # Not every model is offered in every tier, those are simply left out of the tier
+        costs_df = price_token_columns(mean_df, model_column, input_tokens_column, output_tokens_column, tier,
+                                       price_table, warn_unpriced=False)
+        tier_df = mean_df.assign(**{"Tier": tier, "Cost Per Call": costs_df["Total Cost"]})[costs_df["Priced"]]
+        projections.append(tier_df)
+    projection_df = pd.concat(projections, ignore_index=True) if projections else pd.DataFrame()
+    if projection_df.empty:
+        return projection_df
+    projection_df["Daily Cost"] = projection_df["Cost Per Call"] * calls_per_day
+    projection_df["Monthly Cost"] = projection_df["Daily Cost"] * 30
+    return projection_df.sort_values(by=["Tier", "Daily Cost"]).reset_index(drop=True)
@@ -0,0 +1,458 @@
+import asyncio
+import collections
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+# Setting up a logger with default settings
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+# Loading environment variables from a .env file
+load_dotenv()
+
+# The rate limiter every Bedrock call waits on while set, see limit_bedrock_calls
+bedrock_rate_limiter = contextvars.ContextVar("bedrock_rate_limiter", default=None)
+# Concurrency every model starts with, the adaptive limiter raises it while Bedrock does not throttle
+BEDROCK_INITIAL_CONCURRENCY = int(os.getenv("bedrock_initial_concurrency", "4"))
+# Bounds of the concurrency of every model
+BEDROCK_MIN_CONCURRENCY = int(os.getenv("bedrock_min_concurrency", "1"))
+BEDROCK_MAX_CONCURRENCY = int(os.getenv("bedrock_max_concurrency", "32"))
+# Requests per second budget of every model, 0 for no budget
+BEDROCK_REQUESTS_PER_SECOND = float(os.getenv("bedrock_requests_per_second", "0"))
+# Retries of a throttled call, and the base and cap of its jittered exponential backoff in seconds
+BEDROCK_MAX_RETRIES = int(os.getenv("bedrock_max_retries", "6"))
+BEDROCK_BACKOFF_BASE = float(os.getenv("bedrock_backoff_base", "0.5"))
+BEDROCK_BACKOFF_MAX = float(os.getenv("bedrock_backoff_max", "20"))
+# Error codes of a call rejected because the model is over its quota, the concurrency of the model is reduced.
+# Codes are compared case-insensitively, errors in a response stream arrive as e.g. "throttlingException"
+THROTTLING_ERROR_CODES = {"ThrottlingException", "TooManyRequestsException", "ServiceQuotaExceededException"}
+# Error codes of transient failures, the call is retried without reducing the concurrency
+TRANSIENT_ERROR_CODES = {"ServiceUnavailableException", "InternalServerException", "ModelNotReadyException",
+                         "ModelStreamErrorException"}
+# The outcomes of a call passed to AdaptiveConcurrencyLimiter.release: a success raises the concurrency, a throttle
+# lowers it, any other failure leaves it as it is
+SUCCEEDED = "succeeded"
+THROTTLED = "throttled"
+FAILED = "failed"
+# The adaptive limiter of every model ID, see get_model_limiter
+_model_limiters = {}
+_model_limiters_lock = threading.Lock()
+
+
+class RateLimiter:
+    """
+    Token bucket capping the number of requests sent per second, shared by coroutines and worker threads.
+    """
+
+    def __init__(self, requests_per_second, burst=None):
+        """
+        Initializes an instance of the RateLimiter class.
+
+        :param requests_per_second: The sustained number of requests allowed per second.
+        :param burst: Optional. The number of requests that may be sent at once after an idle period. Defaults to
+        one second worth of requests.
+        """
+        self.requests_per_second = requests_per_second
+        self.capacity = burst or max(1.0, requests_per_second)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Takes the next token of the bucket, possibly one that is not available yet. Tokens are reserved in the order
+        the requests arrived, so waiters are served in that order.
+
+        :return: The number of seconds to wait before the request may be sent.
+        """
+        with self._lock:
+            # Refill the bucket for the time elapsed since the last request
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.requests_per_second)
+            self.updated = now
+            self.tokens -= 1
+            # A negative balance is the tokens reserved ahead of their refill
+            return max(0.0, -self.tokens / self.requests_per_second)
+
+    async def acquire(self):
+        """
+        Waits until a request may be sent.
+
+        :return: None
+        """
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+    def acquire_blocking(self):
+        """
+        Blocks the calling thread until a request may be sent, for the calls made from worker threads.
+
+        :return: None
+        """
+        delay = self.reserve()
+        if delay:
+            time.sleep(delay)
+
+
+@contextmanager
+def limit_bedrock_calls(rate_limiter):
+    """
+    Context manager making every candidate and judge call started inside it wait on the given rate limiter,
+    including the calls of tasks created inside it. Every attempt sent by call_with_backoff or
+    call_with_backoff_async waits on it, retries included, responses served from the cache do not.
+
+    :param rate_limiter: The RateLimiter shared by the calls.
+    :return: The rate limiter.
+    """
+    token = bedrock_rate_limiter.set(rate_limiter)
+    try:
+        yield rate_limiter
+    finally:
+        bedrock_rate_limiter.reset(token)
+
+
+async def wait_for_rate_limit():
+    """
+    Waits on the active rate limiter, if any, before a Bedrock call.
+
+    :return: None
+    """
+    rate_limiter = bedrock_rate_limiter.get()
+    if rate_limiter is not None:
+        await rate_limiter.acquire()
+
+
+def wait_for_rate_limit_blocking():
+    """
+    Waits on the active rate limiter, if any, before a Bedrock call made from a worker thread, e.g. the chunk calls
+    of a map-reduce summarization. The thread must run in a copy of the caller's context to see the limiter.
+
+    :return: None
+    """
+    rate_limiter = bedrock_rate_limiter.get()
+    if rate_limiter is not None:
+        rate_limiter.acquire_blocking()
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD concurrency limiter for the calls to one model, usable from threads and from event loops.
+
+    The number of calls in flight grows by one for every window of successful calls (additive increase) and is
+    halved when Bedrock throttles (multiplicative decrease). Only a throttled call sent after the last decrease
+    decreases it again, so the throttles of a burst of calls sent under the previous limit count once. Calls can
+    also be held to a requests per second budget with a token bucket.
+    """
+
+    def __init__(self, model_id, initial=None, minimum=None, maximum=None, requests_per_second=None, burst=None,
+                 decrease_factor=0.5):
+        """
+        Initializes an instance of the AdaptiveConcurrencyLimiter class.
+
+        :param model_id: The ID of the model the limiter is for, used in its metrics.
+        :param initial: Optional. The initial concurrency. Defaults to BEDROCK_INITIAL_CONCURRENCY.
+        :param minimum: Optional. The lowest concurrency. Defaults to BEDROCK_MIN_CONCURRENCY.
+        :param maximum: Optional. The highest concurrency. Defaults to BEDROCK_MAX_CONCURRENCY.
+        :param requests_per_second: Optional. The requests per second budget, 0 or None for no budget. Defaults to
+        BEDROCK_REQUESTS_PER_SECOND.
+        :param burst: Optional. The number of requests of the budget that may be sent at once after an idle period.
+        :param decrease_factor: Optional. The factor the concurrency is multiplied by on a throttle.
+        """
+        self.model_id = model_id
+        self.minimum = max(1, minimum or BEDROCK_MIN_CONCURRENCY)
+        self.maximum = max(self.minimum, maximum or BEDROCK_MAX_CONCURRENCY)
+        self.limit = float(min(self.maximum, max(self.minimum, initial or BEDROCK_INITIAL_CONCURRENCY)))
+        self.requests_per_second = (BEDROCK_REQUESTS_PER_SECOND if requests_per_second is None
+                                    else requests_per_second)
+        self.capacity = burst or max(1.0, self.requests_per_second)
+        self.tokens = self.capacity
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self.counters = collections.Counter()
+        self._updated = time.monotonic()
+        # Number of decreases so far, a call remembers the epoch it was sent in
+        self._epoch = 0
+        self._lock = threading.Lock()
+        # Callbacks waking the threads and tasks waiting for a slot
+        self._waiters = []
+
+    def _try_acquire(self):
+        # Called with the lock held, returns 0 when a slot was taken, otherwise the longest time to wait for one
+        if self.in_flight >= int(self.limit):
+            # Wait for a call to end, waking up regularly in case a wake up was missed
+            return 1.0
+        if self.requests_per_second:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.requests_per_second)
+            self._updated = now
+            if self.tokens < 1:
+                return (1 - self.tokens) / self.requests_per_second
+            self.tokens -= 1
+        self.in_flight += 1
+        self.counters["calls"] += 1
+        self.counters["max_in_flight"] = max(self.counters["max_in_flight"], self.in_flight)
+        return 0
+
+    def acquire(self):
+        """
+        Blocks the calling thread until a call may be sent.
+
+        :return: The epoch of the call, to pass to release.
+        """
+        while True:
+            with self._lock:
+                wait = self._try_acquire()
+                if not wait:
+                    return self._epoch
+                event = threading.Event()
+                self._waiters.append(event.set)
+            event.wait(wait)
+
+    async def acquire_async(self):
+        """
+        Waits, without blocking the event loop, until a call may be sent.
+
+        :return: The epoch of the call, to pass to release.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                wait = self._try_acquire()
+                if not wait:
+                    return self._epoch
+                future = loop.create_future()
+                self._waiters.append(lambda: loop.call_soon_threadsafe(_wake, future))
+            await asyncio.wait([future], timeout=wait)
+
+    def release(self, outcome=SUCCEEDED, epoch=None):
+        """
+        Ends a call, adapting the concurrency to its outcome and waking the waiting calls.
+
+        :param outcome: Optional. SUCCEEDED, THROTTLED when Bedrock throttled the call, or FAILED for any other
+        failure, which frees the slot without changing the concurrency.
+        :param epoch: Optional. The epoch returned by acquire, a throttled call sent before the last decrease does
+        not decrease the concurrency again.
+        :return: None
+        """
+        with self._lock:
+            self.in_flight -= 1
+            if outcome == THROTTLED:
+                self.counters["throttles"] += 1
+                if epoch is None or epoch == self._epoch:
+                    self.limit = max(self.minimum, self.limit * self.decrease_factor)
+                    self._epoch += 1
+            elif outcome == SUCCEEDED:
+                # One more slot after a full window of successful calls
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            waiters, self._waiters = self._waiters, []
+        # Every waiter tries again, the ones finding no slot wait again
+        for wake in waiters:
+            try:
+                wake()
+            except RuntimeError:
+                # The event loop of the waiter is closed
+                pass
+
+    def count(self, counter):
+        """
+        Counts an event of the calls of the limiter, e.g. a retry, reported by metrics.
+
+        :param counter: The name of the counter, "retries" or "failures".
+        :return: None
+        """
+        with self._lock:
+            self.counters[counter] += 1
+
+    def metrics(self):
+        """
+        Returns the current state and counters of the limiter.
+
+        :return: A dictionary with the concurrency limit, the calls in flight, the highest number of calls in
+        flight, and the number of calls, throttles, retries and failed calls.
+        """
+        with self._lock:
+            return {"concurrency_limit": round(self.limit, 2), "in_flight": self.in_flight,
+                    "max_in_flight": self.counters["max_in_flight"], "calls": self.counters["calls"],
+                    "throttles": self.counters["throttles"], "retries": self.counters["retries"],
+                    "failures": self.counters["failures"]}
+
+
+def _wake(future):
+    # Resolve a waiter's future on its own event loop, unless it stopped waiting
+    if not future.done():
+        future.set_result(None)
+
+
+def get_model_limiter(model_id):
+    """
+    Returns the adaptive limiter of a model, shared by every candidate and judge call to it in the process.
+
+    :param model_id: The ID of the model.
+    :return: The AdaptiveConcurrencyLimiter of the model.
+    """
+    with _model_limiters_lock:
+        if model_id not in _model_limiters:
+            _model_limiters[model_id] = AdaptiveConcurrencyLimiter(model_id)
+        return _model_limiters[model_id]
+
+
+def configure_model_limiter(model_id, **limits):
+    """
+    Replaces the limiter of a model, e.g. to give a model with a higher quota a higher maximum concurrency or its
+    own requests per second budget.
+
+    :param model_id: The ID of the model.
+    :param limits: The keyword arguments of AdaptiveConcurrencyLimiter.
+    :return: The new AdaptiveConcurrencyLimiter of the model.
+    """
+    with _model_limiters_lock:
+        _model_limiters[model_id] = AdaptiveConcurrencyLimiter(model_id, **limits)
+        return _model_limiters[model_id]
+
+
+def bedrock_limiter_metrics():
+    """
+    Returns the metrics of the limiter of every model called so far, e.g. to log them at the end of a run.
+
+    :return: A dictionary mapping every model ID to the metrics of its limiter.
+    """
+    with _model_limiters_lock:
+        limiters = dict(_model_limiters)
+    return {model_id: limiter.metrics() for model_id, limiter in limiters.items()}
+
+
+def error_code(error):
+    """
+    Returns the AWS error code of an exception raised by a Bedrock call.
+
+    :param error: The exception, e.g. a botocore ClientError.
+    :return: The error code, or None if the exception is not an AWS error.
+    """
+    response = getattr(error, "response", None)
+    if isinstance(response, dict):
+        return response.get("Error", {}).get("Code")
+    return None
+
+
+def is_error_code(code, codes):
+    """
+    Returns whether an AWS error code is one of the given codes, ignoring case.
+
+    :param code: The error code, or None.
+    :param codes: The codes, e.g. THROTTLING_ERROR_CODES.
+    :return: True if the code is one of them.
+    """
+    return code is not None and code.lower() in {known.lower() for known in codes}
+
+
+def backoff_delay(attempt):
+    """
+    Returns the time to wait before retrying a call, exponential in the attempt with full jitter.
+
+    :param attempt: The number of the failed attempt, starting at 0.
+    :return: The delay in seconds.
+    """
+    return random.uniform(0, min(BEDROCK_BACKOFF_MAX, BEDROCK_BACKOFF_BASE * 2 ** attempt))
+
+
+def _should_retry(limiter, epoch, error, attempt):
+    # Release the slot of a failed call and decide whether to retry it
+    code = error_code(error)
+    throttled = is_error_code(code, THROTTLING_ERROR_CODES)
+    limiter.release(THROTTLED if throttled else FAILED, epoch)
+    retry = (throttled or is_error_code(code, TRANSIENT_ERROR_CODES)) and attempt < BEDROCK_MAX_RETRIES
+    limiter.count("retries" if retry else "failures")
+    if retry:
+        logger.info("%s returned %s, retrying (attempt %d of %d)", limiter.model_id, code, attempt + 1,
+                    BEDROCK_MAX_RETRIES)
+    return retry
+
+
+def call_with_backoff(model_id, function, *args, **kwargs):
+    """
+    Calls a synchronous Bedrock function under the adaptive limiter of the model, retrying throttled and transient
+    failures with jittered exponential backoff. Every attempt also waits on the active rate limiter, if any.
+
+    :param model_id: The ID of the model called.
+    :param function: The function sending the request, e.g. client.invoke_model.
+    :param args: The positional arguments of the function.
+    :param kwargs: The keyword arguments of the function.
+    :return: The result of the function.
+    """
+    return timed_call_with_backoff(model_id, function, *args, **kwargs)[0]
+
+
+def timed_call_with_backoff(model_id, function, *args, **kwargs):
+    """
+    Version of call_with_backoff also measuring the latency of the request.
+
+    Only the attempt that succeeded is timed, the time queued for a slot of the model's limiter or for the rate
+    limiter and the backoff between retries are left out, like wait_for_rate_limit is left out of timed_invoke.
+
+    :return: A tuple containing the result of the function and the duration of the successful attempt in seconds.
+    """
+    limiter = get_model_limiter(model_id)
+    attempt = 0
+    while True:
+        epoch = limiter.acquire()
+        try:
+            wait_for_rate_limit_blocking()
+            start = time.perf_counter()
+            result = function(*args, **kwargs)
+            latency = time.perf_counter() - start
+        except Exception as error:
+            if not _should_retry(limiter, epoch, error, attempt):
+                raise
+            time.sleep(backoff_delay(attempt))
+            attempt += 1
+            continue
+        limiter.release()
+        return result, latency
+
+
+async def call_with_backoff_async(model_id, coroutine_function, *args, **kwargs):
+    """
+    Asynchronous version of call_with_backoff, the coroutine function is awaited once per attempt.
+
+    :param model_id: The ID of the model called.
+    :param coroutine_function: The coroutine function sending the request.
+    :param args: The positional arguments of the coroutine function.
+    :param kwargs: The keyword arguments of the coroutine function.
+    :return: The result of the coroutine function.
+    """
+    return (await timed_call_with_backoff_async(model_id, coroutine_function, *args, **kwargs))[0]
+
+
+async def timed_call_with_backoff_async(model_id, coroutine_function, *args, **kwargs):
+    """
+    Asynchronous version of timed_call_with_backoff.
+
+    :return: A tuple containing the result of the coroutine function and the duration of the successful attempt in
+    seconds.
+    """
+    limiter = get_model_limiter(model_id)
+    attempt = 0
+    while True:
+        epoch = await limiter.acquire_async()
+        try:
+            await wait_for_rate_limit()
+            start = time.perf_counter()
+            result = await coroutine_function(*args, **kwargs)
+            latency = time.perf_counter() - start
+        except asyncio.CancelledError:
+            limiter.release(FAILED)
+            raise
+        except Exception as error:
+            if not _should_retry(limiter, epoch, error, attempt):
+                raise
+            await asyncio.sleep(backoff_delay(attempt))
+            attempt += 1
+            continue
+        limiter.release()
+        return result, latency
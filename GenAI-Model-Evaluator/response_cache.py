@@ -0,0 +1,246 @@
+import collections
+import contextvars
+import functools
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from timeit import default_timer as timer
+from dotenv import load_dotenv
+
+# Setting up a logger with default settings
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+# Loading environment variables from a .env file
+load_dotenv()
+
+# Location of the on-disk cache, cached_responses/ is already ignored by git
+CACHE_PATH = os.getenv("cache_path", os.path.join("cached_responses", "responses.sqlite3"))
+# Upper bound of the cached values in bytes, the least recently used entries are evicted beyond it
+CACHE_MAX_BYTES = int(os.getenv("cache_max_bytes", str(256 * 1024 * 1024)))
+# Set no_cache=true in the environment to bypass the cache for every invocation
+CACHE_DISABLED = os.getenv("no_cache", "false").lower() in ("1", "true", "yes")
+# The cache setting of the current run, overriding ResponseCache.enabled, see use_response_cache
+response_cache_override = contextvars.ContextVar("response_cache_override", default=None)
+
+
+class CachedInvocation(tuple):
+    """
+    The (output text, input tokens, output tokens) tuple of a candidate invocation served from the cache.
+
+    It unpacks like the tuple returned by the invoke_* functions, and carries the latency (and the streaming
+    metrics, if the response was streamed) measured when the response was first generated so reported latencies
+    stay those of a real call.
+    """
+
+    def __new__(cls, response, cached_latency, stream_metrics=None):
+        invocation = super().__new__(cls, response)
+        invocation.cached_latency = cached_latency
+        invocation.stream_metrics = stream_metrics
+        return invocation
+
+
+class ResponseCache:
+    """
+    Persistent, size-bounded, content-addressed cache of model responses stored in SQLite.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_bytes=CACHE_MAX_BYTES, enabled=not CACHE_DISABLED):
+        """
+        Initializes an instance of the ResponseCache class, the database is opened on first use.
+
+        :param path: The path of the SQLite database file.
+        :param max_bytes: The maximum total size of the cached values in bytes.
+        :param enabled: Whether lookups and writes go through the cache, unless a run overrides it with
+        use_response_cache.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = collections.Counter()
+        self.misses = collections.Counter()
+        self.evictions = 0
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def is_enabled(self):
+        """
+        Returns whether the calls of the current run go through the cache.
+
+        :return: The setting of the enclosing use_response_cache, if any, else enabled.
+        """
+        override = response_cache_override.get()
+        return self.enabled if override is None else override
+
+    @staticmethod
+    def make_key(namespace, **parts):
+        """
+        Builds the content address of a cache entry from everything that determines the response.
+
+        :param namespace: The kind of response being cached, e.g. "candidate" or "judge".
+        :param parts: The values the response depends on, such as model ID, prompt, source text and max tokens.
+        :return: The hex digest of the namespace and parts.
+        """
+        payload = json.dumps({"namespace": namespace, **parts}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _connect(self):
+        # Open the database and create the table the first time the cache is used
+        if self._connection is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, namespace TEXT, value TEXT, "
+                "size INTEGER, created REAL, last_access REAL)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        return self._connection
+
+    def get(self, namespace, key):
+        """
+        Looks up a cached value and counts the hit or miss.
+
+        :param namespace: The namespace the key was built with.
+        :param key: The key returned by make_key.
+        :return: The cached value, or None if it is not cached or the cache is disabled.
+        """
+        if not self.is_enabled():
+            return None
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses[namespace] += 1
+                return None
+            # Refresh the access time so eviction is least recently used
+            connection.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            connection.commit()
+            self.hits[namespace] += 1
+            return json.loads(row[0])
+
+    def put(self, namespace, key, value):
+        """
+        Stores a value, then evicts the least recently used entries while the cache is larger than max_bytes.
+
+        :param namespace: The namespace the key was built with.
+        :param key: The key returned by make_key.
+        :param value: A JSON serializable value.
+        :return: None
+        """
+        if not self.is_enabled():
+            return
+        serialized = json.dumps(value)
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                               (key, namespace, serialized, len(serialized), now, now))
+            total_size = connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total_size > self.max_bytes:
+                # Collect the oldest entries until enough space is freed
+                evicted_keys = []
+                for evicted_key, size in connection.execute(
+                        "SELECT key, size FROM responses ORDER BY last_access"):
+                    if total_size <= self.max_bytes:
+                        break
+                    evicted_keys.append((evicted_key,))
+                    total_size -= size
+                connection.executemany("DELETE FROM responses WHERE key = ?", evicted_keys)
+                self.evictions += len(evicted_keys)
+            connection.commit()
+
+    def clear(self):
+        """
+        Removes every cached entry and resets the counters.
+
+        :return: None
+        """
+        with self._lock:
+            self._connect().execute("DELETE FROM responses")
+            self._connection.commit()
+        self.hits.clear()
+        self.misses.clear()
+        self.evictions = 0
+
+    def stats(self):
+        """
+        Returns the hit/miss counters of this process and the size of the cache.
+
+        :return: A dictionary with the hits and misses per namespace, evictions, entries and bytes.
+        """
+        with self._lock:
+            entries, size = self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {
+            "hits": dict(self.hits),
+            "misses": dict(self.misses),
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": size,
+        }
+
+
+# Process wide cache shared by the candidate invocations and the judge
+response_cache = ResponseCache()
+
+
+@contextmanager
+def use_response_cache(enabled):
+    """
+    Context manager turning the response cache on or off for the calls started inside it, including the calls of
+    the tasks and worker threads started with a copy of its context. Other runs keep their own setting.
+
+    :param enabled: True or False, or None to keep the cache's own setting.
+    :return: None
+    """
+    token = response_cache_override.set(enabled)
+    try:
+        yield
+    finally:
+        response_cache_override.reset(token)
+
+
+def cached_invocation(invoke_function):
+    """
+    Decorator making an invoke_* function consult the response cache before calling Bedrock.
+
+    The key covers the model ID, prompt, source text and max tokens. A cached response is returned as a
+    CachedInvocation carrying the latency of the original call. Pass use_cache=False to the wrapped function to
+    always call Bedrock, e.g. when measuring latency.
+
+    :param invoke_function: A function with the (model_id, prompt, prompt_context, max_tokens) signature returning
+    (output text, input tokens, output tokens).
+    :return: The wrapped function.
+    """
+    @functools.wraps(invoke_function)
+    def wrapper(model_id, prompt="", prompt_context="", max_tokens="4096", use_cache=True):
+        if not (use_cache and response_cache.is_enabled()):
+            return invoke_function(model_id, prompt, prompt_context, max_tokens)
+        key = ResponseCache.make_key("candidate", model_id=model_id, prompt=prompt, source_text=prompt_context,
+                                     max_tokens=str(max_tokens))
+        cached = response_cache.get("candidate", key)
+        if cached is not None:
+            return CachedInvocation(cached["response"], cached["latency"], cached.get("stream_metrics"))
+        # Time the real call so a later cache hit can report it, the request alone when the call measured it
+        start = timer()
+        response = invoke_function(model_id, prompt, prompt_context, max_tokens)
+        latency = getattr(response, "latency", None)
+        response_cache.put("candidate", key, {"response": list(response),
+                                              "latency": timer() - start if latency is None else latency,
+                                              "stream_metrics": getattr(response, "stream_metrics", None)})
+        return response
+    return wrapper
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Inspect or clear the Model Evaluator response cache.")
+    parser.add_argument("command", choices=["stats", "clear"])
+    args = parser.parse_args()
+    if args.command == "clear":
+        response_cache.clear()
+    print(json.dumps(response_cache.stats(), indent=2))
@@ -0,0 +1,73 @@
+import json
+import logging
+import os
+from typing import Optional
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from response_cache import ResponseCache, response_cache
+
+# Setting up a logger with default settings
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+# Loading environment variables from a .env file
+load_dotenv()
+
+# Set rag_replay=true in the environment to serve retrievals and answers from the cache only, without calling AWS
+RAG_REPLAY = os.getenv("rag_replay", "false").lower() in ("1", "true", "yes")
+
+
+class ReplayMissError(LookupError):
+    """
+    Raised in replay mode when a retrieval or an answer was never recorded.
+    """
+
+
+def retrieval_cache_key(knowledge_base_id, question, retrieval_config):
+    """
+    Builds the cache key of a knowledge base retrieval.
+
+    :param knowledge_base_id: The ID of the knowledge base.
+    :param question: The question sent to the knowledge base.
+    :param retrieval_config: The retrieval configuration, e.g. the number of results.
+    :return: The key returned by ResponseCache.make_key.
+    """
+    return ResponseCache.make_key("retrieval", knowledge_base_id=knowledge_base_id, question=question,
+                                  retrieval_config=retrieval_config)
+
+
+class CachedKnowledgeBaseRetriever(BaseRetriever):
+    """
+    Retriever recording the documents of a knowledge base retriever in the response cache, and replaying them.
+
+    Outside of replay mode a miss is retrieved from the wrapped retriever and recorded. In replay mode the
+    recorded documents stand in for the knowledge base and a miss raises ReplayMissError.
+    """
+
+    knowledge_base_id: str
+    retrieval_config: dict
+    retriever: Optional[BaseRetriever] = None
+    replay: bool = False
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        """
+        Returns the documents recorded for the question, retrieving and recording them on a miss.
+
+        :param query: The question.
+        :param run_manager: The callback manager of the run.
+        :return: The list of retrieved documents.
+        """
+        key = retrieval_cache_key(self.knowledge_base_id, query, self.retrieval_config)
+        cached = response_cache.get("retrieval", key)
+        if cached is not None:
+            return [Document(page_content=document["page_content"], metadata=document["metadata"])
+                    for document in cached]
+        if self.replay or self.retriever is None:
+            raise ReplayMissError(f"No recorded retrieval for knowledge base {self.knowledge_base_id} and question "
+                                  f"{query!r}, run the evaluation once without replay to record it")
+        documents = self.retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        # Round trip the metadata through JSON so scores and locations are stored as plain values
+        response_cache.put("retrieval", key, [
+            {"page_content": document.page_content, "metadata": json.loads(json.dumps(document.metadata, default=str))}
+            for document in documents])
+        return documents
@@ -4,9 +4,18 @@ import boto3
 import json
 import os
 from botocore.exceptions import ClientError
+from botocore.config import Config
 import logging
-import streamlit as st
 import csv
+import math
+import contextvars
+import numpy as np
+from timeit import default_timer as timer
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from response_cache import cached_invocation
+from model_adapters import build_invoke_arguments, get_adapter, get_context_window
+from usage_tracker import count_tokens
+from rate_limiter import timed_call_with_backoff
 
 # Setting up a logger with default settings
 logger = logging.getLogger()
@@ -22,37 +31,144 @@ else:
 # Setting up the default boto3 session with a specified AWS profile name
 boto3.setup_default_session(profile_name=os.getenv("profile_name"))
 
-# Instantiating the Amazon Bedrock Runtime Client
-
+# Instantiating the Amazon Bedrock Runtime Client, the connection pool is sized for concurrent candidate invocations.
+# Throttled calls are retried by call_with_backoff, which adapts the concurrency per model, not by botocore
 client = boto3.client(
-    service_name="bedrock-runtime",region_name=region_name)
+    service_name="bedrock-runtime",region_name=region_name,
+    config=Config(max_pool_connections=int(os.getenv("max_pool_connections", "50")),
+                  retries={"total_max_attempts": 1}))
+
+# Candidate models are streamed to measure time-to-first-token, set stream_candidates=false to use invoke_model
+STREAM_CANDIDATES = os.getenv("stream_candidates", "true").lower() in ("1", "true", "yes")
+# Extracted texts longer than this many characters are logged as possibly too long for some models
+LONG_TEXT_WARNING_CHARS = 12000
+
+
+# PDFs with fewer pages are extracted in the calling process, starting worker processes would cost more
+PARALLEL_EXTRACTION_MIN_PAGES = int(os.getenv("parallel_extraction_min_pages", "32"))
+# Number of pages extracted by a worker process in one task
+EXTRACTION_BATCH_PAGES = int(os.getenv("extraction_batch_pages", "16"))
+# Conservative number of characters per token used to estimate token counts before invoking a model
+CHARS_PER_TOKEN = float(os.getenv("chars_per_token", "3"))
+# Number of chunk summaries generated at the same time in the map step of map-reduce summarization
+MAP_CONCURRENCY = int(os.getenv("map_concurrency", "4"))
+# Tokens kept free in every request for the instructions wrapped around the context
+PROMPT_OVERHEAD_TOKENS = 200
+# Instructions of the map step, every chunk is summarized with regard to the task
+MAP_PROMPT = ("The context is section {index} of {count} of a longer document. Extract and summarize everything in "
+              "it that is relevant to the following task, your summary will be combined with the summaries of the "
+              "other sections to complete the task.\n\nTask: {prompt}")
+# Instructions used to merge partial summaries that together are still too long for one request
+COLLAPSE_PROMPT = ("The context holds summaries of consecutive sections of a longer document. Merge them into a "
+                   "single summary keeping everything relevant to the following task.\n\nTask: {prompt}")
+# Instructions of the reduce step, the task is completed from the summaries of all the sections
+REDUCE_PROMPT = ("{prompt}\n\nThe document was too long to be read at once, the context holds summaries of its "
+                 "consecutive sections, in order.")
+
+
+class TimedInvocation(tuple):
+    """
+    The (output text, input tokens, output tokens) tuple of an invocation sent to Bedrock.
+
+    It carries the latency of the request that succeeded, without the time queued for the limiters of the call or
+    waited between retries.
+    """
+
+    def __new__(cls, response, latency=None):
+        invocation = super().__new__(cls, response)
+        invocation.latency = latency
+        return invocation
+
+
+class StreamedInvocation(TimedInvocation):
+    """
+    The (output text, input tokens, output tokens) tuple of a streamed invocation.
+
+    It unpacks like the tuple returned by invoke_model, and carries the latency metrics measured while streaming.
+    """
+
+    def __new__(cls, response, stream_metrics, latency=None):
+        invocation = super().__new__(cls, response, latency)
+        invocation.stream_metrics = stream_metrics
+        return invocation
+
+
+class MapReduceInvocation(tuple):
+    """
+    The (output text, input tokens, output tokens) tuple of a map-reduce summarization, the token counts add up
+    every map and reduce call.
+
+    It carries the map_reduce_usage dictionary holding the number of chunks, and the token counts and wall time of
+    the map step and of the reduce step, and whether every map and reduce call was served from the response cache.
+    """
+
+    def __new__(cls, response, map_reduce_usage, cached=False):
+        invocation = super().__new__(cls, response)
+        invocation.map_reduce_usage = map_reduce_usage
+        invocation.cached = cached
+        return invocation
+
+
+def extract_page_range(pdf_path, start, stop):
+    """
+    Extracts the text of a range of pages of a PDF file, used as the task of an extraction worker process.
+
+    :param pdf_path: The path to the PDF file.
+    :param start: The index of the first page to extract.
+    :param stop: The index after the last page to extract.
+    :return: The list of the extracted page texts.
+    """
+    # Every worker opens its own reader, only the requested pages are parsed
+    reader = PdfReader(pdf_path)
+    return [reader.pages[index].extract_text() for index in range(start, stop)]
 
-# Define request headers, for Amazon Bedrock Model invocations
-accept = 'application/json'
-contentType = 'application/json'
 
+def iter_page_texts(pdf_path, first_page=0, last_page=None, workers=None):
+    """
+    Yields the text of the pages of a PDF file in order, as soon as each page is extracted, so callers can start
+    processing the beginning of a document before its last page is parsed.
+
+    Long page ranges are extracted in parallel by a process pool, in batches of EXTRACTION_BATCH_PAGES pages.
 
-def text_extraction(pdf_path):
+    :param pdf_path: The path to the PDF file.
+    :param first_page: Optional. The index of the first page to extract. Defaults to 0.
+    :param last_page: Optional. The index after the last page to extract. Defaults to the end of the document.
+    :param workers: Optional. The number of worker processes, 1 extracts the pages in the calling process.
+    Defaults to the CPU count.
+    :return: A generator of page texts.
+    """
+    # Creating a PdfReader object to count the pages of the PDF file
+    reader = PdfReader(pdf_path)
+    last_page = len(reader.pages) if last_page is None else min(last_page, len(reader.pages))
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or last_page - first_page < PARALLEL_EXTRACTION_MIN_PAGES:
+        # Extracting the pages one after another with the reader already open
+        for index in range(first_page, last_page):
+            yield reader.pages[index].extract_text()
+        return
+    # Extracting batches of pages in worker processes, and yielding them in page order
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        batches = [executor.submit(extract_page_range, pdf_path, start, min(start + EXTRACTION_BATCH_PAGES, last_page))
+                   for start in range(first_page, last_page, EXTRACTION_BATCH_PAGES)]
+        for batch in batches:
+            yield from batch.result()
+
+
+def text_extraction(pdf_path, workers=None):
     """
     Extracts text from a PDF file.
 
     :param pdf_path: The path to the PDF file.
+    :param workers: Optional. The number of worker processes extracting pages in parallel, see iter_page_texts.
     :return: The extracted text from the PDF file as a string.
     """
-    # Creating a PdfReader object to read the PDF file
-    reader = PdfReader(pdf_path)
-    # Initializing an empty string to store the extracted text
-    text = ""
-    # Looping through each page of the PDF and extracting text
-    for page in reader.pages:
-        # Extracting text from the current page and appending it to the text variable
-        text += page.extract_text()
-        # Adding a newline character after each page's text to separate them
-        text += "\n"
+    # Joining the text of every page, followed by a newline character to separate them
+    text = "".join(page_text + "\n" for page_text in iter_page_texts(pdf_path, workers=workers))
     # Returning the concatenated text extracted from all pages of the PDF file
-    if len(text) > 12000:
-        st.warning("The extracted text from the PDF may be longer than some of the models input tokens. Proceed with Caution")
-        print("extracted text from the PDF may be longer than some model's input token maximums... proceeding with caution ")
+    if len(text) > LONG_TEXT_WARNING_CHARS:
+        # Library code only logs, the Streamlit app and the command line decide how to surface it
+        logger.warning("The extracted text from the PDF may be longer than some of the models input tokens. "
+                       "Proceed with Caution")
 
     return text
 
@@ -71,13 +187,13 @@ def csv_extraction(csv_path):
             for row in reader:
                 text.append(row[0])
     except FileNotFoundError:
-        print(f"Error: The file '{csv_path}' does not exist.")
+        logger.error("The file '%s' does not exist.", csv_path)
         return []
     except IndexError:
-        print(f"Error: The CSV file '{csv_path}' does not have any data in the first column.")
+        logger.error("The CSV file '%s' does not have any data in the first column.", csv_path)
         return []
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("Could not read %s: %s", csv_path, e)
         return []
 
     return text
@@ -94,318 +210,325 @@ def text_formatter(text_list):
         formatted_text +=  f"{i+1}. {text}\n"
     return formatted_text
 
-def invoke_anthropic(model_id, prompt="", prompt_context="", max_tokens="4096"):
+@cached_invocation
+def invoke_model(model_id, prompt="", prompt_context="", max_tokens="4096"):
     """
-    Invokes an Anthropic model using Amazon Bedrock and the specified parameters.
+    Invokes any supported text model using Amazon Bedrock, the provider adapter of the model builds the request
+    body and extracts the output text and token counts. Models are streamed when possible (see stream_model).
 
-    :param model_id: The ID of the Anthropic model to invoke.
+    :param model_id: The ID of the model to invoke.
     :param prompt: Optional. The default prompt highlighting the task the model is trying to perform, defined in the orchestrator.py file.
     :param prompt_context: The prompt context includes the extracted text from the PDF file.
     :param max_tokens: Optional. The maximum number of tokens to generate. Defaults to the value of the 'max_tokens' environment variable.
-    :return: A tuple containing the generated output text, the number of input tokens used, and the number of output tokens generated.
+    :return: A TimedInvocation with the generated output text, the number of input tokens used, and the number of
+    output tokens generated, a StreamedInvocation when the model was streamed.
     """
-    # Print the model ID (for debugging purposes)
-    # TODO: Do we want to take this out?
-    
+    # Find the adapter of the model's provider
+    adapter = get_adapter(model_id)
+    if adapter is None:
+        raise ValueError(f"Unsupported model: {model_id}")
     if max_tokens is None:
         max_tokens = "4096"
-    
-    print(model_id)
-    # If prompt_context is provided, prepend it to the prompt
-    if prompt_context:
-        prompt=f"Human: \n\n {prompt} \n\n <context>{prompt_context}</context> \n Assistant: \n\n"
-    # Define the request body for invoking the Anthropic model, using the messages API structure
-    request_body = {
-        "anthropic_version": "bedrock-2023-05-31",
-        "max_tokens": max_tokens,
-        "messages": [
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": prompt,
-                    }
-                ],
-            }
-        ],
-    }
-
+    logger.debug("Invoking %s", model_id)
+    # Build the request with the adapter of the model's provider
+    invoke_arguments = build_invoke_arguments(adapter, model_id, prompt, prompt_context, max_tokens)
     try:
-        # Invoke the Anthropic model through Bedrock using the defined request body
-        response = client.invoke_model(
-            modelId=model_id,
-            body=json.dumps(request_body),
-        )
-        # Extract information from the response
-        result = json.loads(response.get("body").read())
-        # Extract the input tokens from the response
-        input_tokens = result["usage"]["input_tokens"]
-        # Extract the output tokens from the response
-        output_tokens = result["usage"]["output_tokens"]
-        # Extract the output text from the response
-        output_text = result["content"][0]["text"]
+        # Stream the response when the provider supports it, to measure the latency of the first tokens. Calls go
+        # through the adaptive limiter of the model, throttled calls are retried with backoff
+        if STREAM_CANDIDATES and adapter.supports_streaming:
+            invocation, latency = timed_call_with_backoff(model_id, stream_model, adapter, invoke_arguments)
+            invocation.latency = latency
+            return invocation
+
+        def send_request():
+            # Invoke the model through Bedrock using the request built by the adapter, reading the body is part of
+            # the request
+            response = client.invoke_model(**invoke_arguments)
+            return response, json.loads(response.get('body').read())
+
+        (response, response_body), latency = timed_call_with_backoff(model_id, send_request)
         # Return the output text, input tokens, and output tokens
-        return output_text, input_tokens, output_tokens
+        return TimedInvocation(adapter.parse_response(response, response_body), latency)
     except ClientError as err:
         # Log and raise an error if invoking the model fails
         logger.error(
-            "Couldn't invoke {model_id}. Here's why: %s: %s",
+            "Couldn't invoke %s. Here's why: %s: %s",
+            model_id,
             err.response["Error"]["Code"],
             err.response["Error"]["Message"],
         )
         raise
 
 
+def stream_model(adapter, invoke_arguments):
+    """
+    Invokes a model with invoke_model_with_response_stream and measures the latency of the streamed output.
+
+    The inter-token latencies are the gaps between chunks carrying text, a chunk may hold more than one token.
+
+    :param adapter: The adapter of the model's provider.
+    :param invoke_arguments: The keyword arguments built by build_invoke_arguments.
+    :return: A StreamedInvocation with the output text and token counts, and a stream_metrics dictionary holding
+    the time to first token, the p50/p90/p99 inter-token latencies (seconds) and the output tokens per second.
+    """
+    # Start timer
+    start = timer()
+    response = client.invoke_model_with_response_stream(**invoke_arguments)
+    output_text = []
+    # Arrival time of every chunk carrying text
+    chunk_times = []
+    invocation_metrics = {}
+    for event in response.get("body"):
+        chunk = json.loads(event["chunk"]["bytes"])
+        text = adapter.parse_stream_chunk(chunk)
+        if text:
+            chunk_times.append(timer())
+            output_text.append(text)
+        # Bedrock appends the token counts of the invocation to the last chunk
+        invocation_metrics = chunk.get("amazon-bedrock-invocationMetrics", invocation_metrics)
+    # end timer
+    end = timer()
+    if invocation_metrics:
+        input_tokens = invocation_metrics.get("inputTokenCount", 0)
+        output_tokens = invocation_metrics.get("outputTokenCount", 0)
+    else:
+        # Bedrock did not report the usage, count the request body and the output with the local tokenizer
+        input_tokens = count_tokens(invoke_arguments["body"])
+        output_tokens = count_tokens("".join(output_text))
+    # calculate the time to first token, and the generation speed once the first token arrived
+    time_to_first_token = (chunk_times[0] if chunk_times else end) - start
+    generation_time = end - start - time_to_first_token
+    # calculate the inter-token latency percentiles, they need at least two chunks
+    if len(chunk_times) > 1:
+        p50, p90, p99 = (round(float(value), 4) for value in np.percentile(np.diff(chunk_times), [50, 90, 99]))
+    else:
+        p50 = p90 = p99 = None
+    stream_metrics = {
+        "time_to_first_token": round(time_to_first_token, 4),
+        "inter_token_latency_p50": p50,
+        "inter_token_latency_p90": p90,
+        "inter_token_latency_p99": p99,
+        "tokens_per_second": round(output_tokens / generation_time, 2) if generation_time > 0 else None,
+    }
+    return StreamedInvocation(("".join(output_text), input_tokens, output_tokens), stream_metrics)
+
+
+def invoke_anthropic(model_id, prompt="", prompt_context="", max_tokens="4096"):
+    """
+    Invokes an Anthropic model using Amazon Bedrock and the specified parameters.
+
+    :return: A tuple containing the generated output text, the number of input tokens used, and the number of output tokens generated.
+    """
+    return invoke_model(model_id, prompt, prompt_context, max_tokens)
+
+
 def invoke_meta(model_id, prompt="", prompt_context="", max_tokens='4096'):
     """
     Invokes a Meta model using Amazon Bedrock and the specified parameters.
 
-    :param model_id: The ID of the Meta model to invoke.
-    :param prompt: Optional. The default prompt highlighting the task the model is trying to perform, defined in the orchestrator.py file.
-    :param prompt_context: The prompt context includes the extracted text from the PDF file.
-    :param max_tokens: Optional. The maximum number of tokens to generate. Defaults to the value of the 'max_tokens' environment variable.
     :return: A tuple containing the generated output text, the number of input tokens used, and the number of output tokens generated.
     """
-    # Print the model ID (for debugging purposes)
-    # TODO: Do we want to take this out?
-    print(model_id)
-    
-    # If prompt_context is provided, prepend it to the prompt
-    if prompt_context:
-        prompt=f"{prompt} \n\n <context>{prompt_context}</context>"
-    # Define the request body for invoking the Meta model
-    request_body = json.dumps({"prompt": prompt,
-                               "max_gen_len": max_tokens,
-                               "temperature": 0.5,
-                               "top_p": 0.5
-                               })
-    try:
-        # Invoke the Meta model using the defined request body and headers
-        response = client.invoke_model(
-            modelId=model_id,
-            body=request_body,
-            accept=accept,
-            contentType=contentType
-        )
-        # Extract information from the response
-        response_body = json.loads(response.get('body').read())
-        # Extract the input tokens from the response
-        input_tokens = response_body['prompt_token_count']
-        # Extract the output tokens from the response
-        output_tokens = response_body['generation_token_count']
-        # Extract the output text from the response
-        output_text = response_body['generation']
-        # Return the output text, input tokens, and output tokens
-        return output_text, input_tokens, output_tokens
-    except ClientError as err:
-        # Log and raise an error if invoking the model fails
-        logger.error(
-            "Couldn't invoke {model_id}. Here's why: %s: %s",
-            err.response["Error"]["Code"],
-            err.response["Error"]["Message"],
-        )
-        raise
+    return invoke_model(model_id, prompt, prompt_context, max_tokens)
 
 
 def invoke_mistral(model_id, prompt="", prompt_context="", max_tokens='4096'):
     """
-        Invokes a Mistral model using Amazon Bedrock and the specified parameters.
-
-        :param model_id: The ID of the Mistral model to invoke.
-        :param prompt: Optional. The default prompt highlighting the task the model is trying to perform, defined in the orchestrator.py file.
-        :param prompt_context: The prompt context includes the extracted text from the PDF file.
-        :param max_tokens: Optional. The maximum number of tokens to generate. Defaults to the value of the 'max_tokens' environment variable.
-        :return: A tuple containing the generated output text, the number of input tokens used, and the number of output tokens generated.
-        """
-    # Print the model ID (for debugging purposes)
-    # TODO: Do we want to take this out?
-    print(model_id)
-    # If prompt_context is provided, prepend it to the prompt
-    if prompt_context:
-        prompt=f"{prompt} \n\n <context>{prompt_context}</context>"
-    # Define the request body for invoking the Mistral model
-    request_body = json.dumps({"prompt": prompt,
-                               "max_tokens": max_tokens,
-                               "temperature": 0,
-                               "top_k": 200,
-                               "top_p": 0.5
-                               })
-    try:
-        # Invoke the Mistral model using the defined request body and headers
-        response = client.invoke_model(
-            modelId=model_id,
-            body=request_body,
-            accept=accept,
-            contentType=contentType
-        )
-        # Extract information from the response
-        response_body = json.loads(response.get('body').read())
-        # Extract the input tokens from the response
-        input_tokens = int(response['ResponseMetadata']['HTTPHeaders']['x-amzn-bedrock-input-token-count'])
-        # Extract the output tokens from the response
-        output_tokens = int(response['ResponseMetadata']['HTTPHeaders']['x-amzn-bedrock-output-token-count'])
-        # Extract the output text from the response
-        output_text = response_body['outputs'][0]['text']
-        # Return the output text, input tokens, and output tokens
-        return output_text, input_tokens, output_tokens
-    except ClientError as err:
-        # Log and raise an error if invoking the model fails
-        logger.error(
-            "Couldn't invoke {model_id}. Here's why: %s: %s",
-            err.response["Error"]["Code"],
-            err.response["Error"]["Message"],
-        )
-        raise
+    Invokes a Mistral model using Amazon Bedrock and the specified parameters.
 
+    :return: A tuple containing the generated output text, the number of input tokens used, and the number of output tokens generated.
+    """
+    return invoke_model(model_id, prompt, prompt_context, max_tokens)
 
-def invoke_cohere(model_id, prompt="", prompt_context="",  max_tokens='4096'):
-    """
-        Invokes a Cohere model using Amazon Bedrock and the specified parameters.
-
-        :param model_id: The ID of the Cohere model to invoke.
-        :param prompt: Optional. The default prompt highlighting the task the model is trying to perform, defined in the orchestrator.py file.
-        :param prompt_context: The prompt context includes the extracted text from the PDF file.
-        :param max_tokens: Optional. The maximum number of tokens to generate. Defaults to the value of the 'max_tokens' environment variable.
-        :return: A tuple containing the generated output text, the number of input tokens used, and the number of output tokens generated.
-        """
-    # Print the model ID (for debugging purposes)
-    # TODO: Do we want to take this out?
-    print(model_id)
-    # If prompt_context is provided, prepend it to the prompt
-    if prompt_context:
-        prompt=f"{prompt} \n\n <context>{prompt_context}</context>"
-    # Define the request body for invoking the Cohere model
-    request_body = json.dumps({"prompt": prompt,
-                               "max_tokens": max_tokens,
-                               "temperature": 0.5,
-                               })
-    try:
-        # Invoke the Cohere model using the defined request body and headers
-        response = client.invoke_model(
-            modelId=model_id,
-            body=request_body,
-            accept=accept,
-            contentType=contentType
-        )
-        # Extract information from the response
-        response_body = json.loads(response.get('body').read())
-        # Extract the input tokens from the response
-        input_tokens = int(response['ResponseMetadata']['HTTPHeaders']['x-amzn-bedrock-input-token-count'])
-        # Extract the output tokens from the response
-        output_tokens = int(response['ResponseMetadata']['HTTPHeaders']['x-amzn-bedrock-output-token-count'])
-        # Extract the output text from the response
-        output_text = response_body['generations'][0]['text']
-        # Return the output text, input tokens, and output tokens
-        return output_text, input_tokens, output_tokens
-    except ClientError as err:
-        # Log and raise an error if invoking the model fails
-        logger.error(
-            "Couldn't invoke {model_id}. Here's why: %s: %s",
-            err.response["Error"]["Code"],
-            err.response["Error"]["Message"],
-        )
-        raise
+
+def invoke_cohere(model_id, prompt="", prompt_context="", max_tokens='4096'):
+    """
+    Invokes a Cohere model using Amazon Bedrock and the specified parameters.
+
+    :return: A tuple containing the generated output text, the number of input tokens used, and the number of output tokens generated.
+    """
+    return invoke_model(model_id, prompt, prompt_context, max_tokens)
 
 
 def invoke_amazon(model_id, prompt="", prompt_context="", max_tokens='4096'):
     """
-        Invokes an Amazon model using Amazon Bedrock and the specified parameters.
-
-        :param model_id: The ID of the Amazon model to invoke.
-        :param prompt: Optional. The default prompt highlighting the task the model is trying to perform, defined in the orchestrator.py file.
-        :param prompt_context: The prompt context includes the extracted text from the PDF file.
-        :param max_tokens: Optional. The maximum number of tokens to generate. Defaults to the value of the 'max_tokens' environment variable.
-        :return: A tuple containing the generated output text, the number of input tokens used, and the number of output tokens generated.
-        """
-    # Print the model ID (for debugging purposes)
-    # TODO: Do we want to take this out?
-    print(model_id)
-    # If prompt_context is provided, prepend it to the prompt
-    if prompt_context:
-        prompt=f"{prompt} \n\n <context>{prompt_context}</context>"
-    # Define the request body for invoking the Amazon model
-    request_body = json.dumps({"inputText": prompt,
-                               "textGenerationConfig": {
-                                   "maxTokenCount": max_tokens,
-                                   "stopSequences": [],
-                                   "temperature": 0.5,
-                                   "topP": 0.5
-                               }})
-    try:
-        # Invoke the Amazon model using the defined request body and headers
-        response = client.invoke_model(
-            modelId=model_id,
-            body=request_body,
-            accept=accept,
-            contentType=contentType
-        )
-        # Extract information from the response
-        response_body = json.loads(response.get('body').read())
-        # Extract the input tokens from the response
-        input_tokens = response_body['inputTextTokenCount']
-        # Extract the output tokens from the response
-        output_tokens = response_body['results'][0]['tokenCount']
-        # Extract the output text from the response
-        output_text = response_body['results'][0]['outputText']
-        # Return the output text, input tokens, and output tokens
-        return output_text, input_tokens, output_tokens
-    except ClientError as err:
-        # Log and raise an error if invoking the model fails
-        logger.error(
-            "Couldn't invoke {model_id}. Here's why: %s: %s",
-            err.response["Error"]["Code"],
-            err.response["Error"]["Message"],
-        )
-        raise
+    Invokes an Amazon model using Amazon Bedrock and the specified parameters.
+
+    :return: A tuple containing the generated output text, the number of input tokens used, and the number of output tokens generated.
+    """
+    return invoke_model(model_id, prompt, prompt_context, max_tokens)
 
 
 def invoke_AI21(model_id, prompt="", prompt_context="", max_tokens='4096'):
     """
-        Invokes an AI21 model using Amazon Bedrock and the spescified parameters.
-
-        :param model_id: The ID of the AI21 model to invoke.
-        :param prompt: Optional. The default prompt highlighting the task the model is trying to perform, defined in the orchestrator.py file.
-        :param prompt_context: The prompt context includes the extracted text from the PDF file.
-        :param max_tokens: Optional. The maximum number of tokens to generate. Defaults to the value of the 'max_tokens' environment variable.
-        :return: A tuple containing the generated output text, the number of input tokens used, and the number of output tokens generated.
-        """
-    # Print the model ID (for debugging purposes)
-    # TODO: Do we want to take this out?
-    print(model_id)
-    # If prompt_context is provided, prepend it to the prompt
-    if prompt_context:
-        prompt=f"{prompt} \n\n <context>{prompt_context}</context>"
-    # Define the request body for invoking the AI21 model
-    request_body = json.dumps({"prompt": prompt,
-                               "maxTokens": max_tokens,
-                               "temperature": 0.5,
-                               "topP": 0.5,
-                               "stopSequences": [],
-                               })
-    try:
-        # Invoke the AI21 model using the defined request body and headers
-        response = client.invoke_model(
-            modelId=model_id,
-            body=request_body,
-            accept=accept,
-            contentType=contentType
-        )
-        # Extract information from the response
-        response_body = json.loads(response.get('body').read())
-        # Extract the input tokens from the response
-        input_tokens = int(response['ResponseMetadata']['HTTPHeaders']['x-amzn-bedrock-input-token-count'])
-        # Extract the output tokens from the response
-        output_tokens = int(response['ResponseMetadata']['HTTPHeaders']['x-amzn-bedrock-output-token-count'])
-        # Extract the output text from the response
-        output_text = response_body['completions'][0]['data']['text']
-        # Return the output text, input tokens, and output tokens
-        return output_text, input_tokens, output_tokens
-    except ClientError as err:
-        # Log and raise an error if invoking the model fails
-        logger.error(
-            "Couldn't invoke {model_id}. Here's why: %s: %s",
-            err.response["Error"]["Code"],
-            err.response["Error"]["Message"],
-        )
-        raise
+    Invokes an AI21 model using Amazon Bedrock and the specified parameters.
+
+    :return: A tuple containing the generated output text, the number of input tokens used, and the number of output tokens generated.
+    """
+    return invoke_model(model_id, prompt, prompt_context, max_tokens)
+
+
+def estimate_tokens(text):
+    """
+    Estimates the number of tokens of a text from its length.
+
+    :param text: The text to measure.
+    :return: The estimated number of tokens, rounded up.
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def output_token_budget(model_id, max_tokens):
+    """
+    Returns the number of output tokens reserved in every request, at most half of the model's context window.
+
+    :param model_id: The ID of the model.
+    :param max_tokens: The maximum number of tokens requested.
+    :return: The number of output tokens.
+    """
+    return min(int(max_tokens or 4096), get_context_window(model_id) // 2)
+
+
+def context_token_budget(model_id, prompt, max_tokens):
+    """
+    Returns how many tokens of context fit in one request to a model, once the prompt and output are reserved.
+
+    :param model_id: The ID of the model.
+    :param prompt: The task prompt sent with the context.
+    :param max_tokens: The maximum number of tokens requested.
+    :return: The number of context tokens.
+    """
+    return (get_context_window(model_id) - output_token_budget(model_id, max_tokens) - estimate_tokens(prompt)
+            - PROMPT_OVERHEAD_TOKENS)
+
+
+def needs_map_reduce(model_id, prompt, prompt_context, max_tokens):
+    """
+    Checks whether a text is too long to be summarized by a model in one request.
+
+    :return: True if the estimated tokens of the text exceed the model's context budget.
+    """
+    return estimate_tokens(prompt_context) > context_token_budget(model_id, prompt, max_tokens)
+
+
+def chunk_text(text, chunk_tokens, overlap_tokens=100):
+    """
+    Splits a text into chunks of at most chunk_tokens estimated tokens, cutting at paragraph, line or sentence
+    boundaries when possible. Consecutive chunks overlap by about overlap_tokens so no sentence loses its context.
+
+    :param text: The text to split.
+    :param chunk_tokens: The maximum number of estimated tokens per chunk.
+    :param overlap_tokens: Optional. The number of estimated tokens repeated at the start of the next chunk.
+    :return: The list of chunks.
+    """
+    chunk_chars = max(1, int(chunk_tokens * CHARS_PER_TOKEN))
+    overlap_chars = min(int(overlap_tokens * CHARS_PER_TOKEN), chunk_chars // 4)
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_chars, len(text))
+        if end < len(text):
+            # Cut at the last paragraph, line or sentence break in the second half of the chunk
+            window = text[start + chunk_chars // 2:end]
+            for separator in ("\n\n", "\n", ". "):
+                cut = window.rfind(separator)
+                if cut != -1:
+                    end = start + chunk_chars // 2 + cut + len(separator)
+                    break
+        chunks.append(text[start:end])
+        if end >= len(text):
+            break
+        start = max(end - overlap_chars, start + 1)
+    return chunks
+
+
+def summarize_map_reduce(model_id, prompt="", prompt_context="", max_tokens="4096", use_cache=True):
+    """
+    Summarizes a text longer than a model's context window: the text is split into chunks that fit the window, the
+    chunks are summarized in parallel (map), and the task is completed from the chunk summaries (reduce). Partial
+    summaries that together are still too long are first merged in groups.
+
+    Every map, merge and reduce call waits on the active rate limiter, see limit_bedrock_calls.
+
+    :param model_id: The ID of the model to invoke.
+    :param prompt: The task prompt.
+    :param prompt_context: The text extracted from the PDF file.
+    :param max_tokens: Optional. The maximum number of tokens to generate in the final summary.
+    :param use_cache: Optional. Set to False to always call Bedrock. Defaults to True.
+    :return: A MapReduceInvocation with the final summary and the total token counts of every call.
+    """
+    context_tokens = context_token_budget(model_id, prompt, max_tokens)
+    # Chunk summaries are kept short enough for several of them to fit in one reduce request
+    map_max_tokens = min(output_token_budget(model_id, max_tokens), max(context_tokens // 4, 1))
+    usage = {"chunks": 0, "map_input_tokens": 0, "map_output_tokens": 0, "map_time": 0.0,
+             "reduce_input_tokens": 0, "reduce_output_tokens": 0, "reduce_time": 0.0}
+    chunks = chunk_text(prompt_context, context_tokens)
+    usage["chunks"] = len(chunks)
+    responses = []
+
+    def invoke_chunk(chunk_prompt, chunk_context):
+        response = invoke_model(model_id, chunk_prompt, chunk_context, map_max_tokens, use_cache=use_cache)
+        responses.append(response)
+        return response
+
+    def submit(executor, chunk_prompt, chunk_context):
+        # The worker threads run in a copy of the caller's context, so they see its rate limiter
+        return executor.submit(contextvars.copy_context().run, invoke_chunk, chunk_prompt, chunk_context)
+
+    # Map, summarize every chunk in parallel
+    start = timer()
+    with ThreadPoolExecutor(max_workers=MAP_CONCURRENCY) as executor:
+        partial_summaries = [future.result() for future in [
+            submit(executor, MAP_PROMPT.format(index=index, count=len(chunks), prompt=prompt), chunk)
+            for index, chunk in enumerate(chunks, start=1)]]
+        usage["map_time"] = round(timer() - start, 2)
+        usage["map_input_tokens"] = sum(summary[1] for summary in partial_summaries)
+        usage["map_output_tokens"] = sum(summary[2] for summary in partial_summaries)
+        partial_texts = [summary[0] for summary in partial_summaries]
+        # Reduce, merge the partial summaries in groups while they do not fit in one request
+        start = timer()
+        while len(partial_texts) > 1 and estimate_tokens("\n\n".join(partial_texts)) > context_tokens:
+            groups = [[]]
+            for partial_text in partial_texts:
+                if groups[-1] and estimate_tokens("\n\n".join(groups[-1] + [partial_text])) > context_tokens:
+                    groups.append([])
+                groups[-1].append(partial_text)
+            if len(groups) == len(partial_texts):
+                # Every summary fills a request on its own, merging cannot shorten them any further
+                break
+            collapsed = [future.result() for future in [
+                submit(executor, COLLAPSE_PROMPT.format(prompt=prompt), "\n\n".join(group)) for group in groups]]
+            usage["reduce_input_tokens"] += sum(summary[1] for summary in collapsed)
+            usage["reduce_output_tokens"] += sum(summary[2] for summary in collapsed)
+            partial_texts = [summary[0] for summary in collapsed]
+    # Complete the task from the summaries of all the sections
+    reduced = invoke_model(model_id, REDUCE_PROMPT.format(prompt=prompt), "\n\n".join(partial_texts), max_tokens,
+                           use_cache=use_cache)
+    responses.append(reduced)
+    output_text, input_tokens, output_tokens = reduced
+    usage["reduce_time"] = round(timer() - start, 2)
+    usage["reduce_input_tokens"] += input_tokens
+    usage["reduce_output_tokens"] += output_tokens
+    # The summarization was only free when every call was served from the cache
+    return MapReduceInvocation((output_text, usage["map_input_tokens"] + usage["reduce_input_tokens"],
+                                usage["map_output_tokens"] + usage["reduce_output_tokens"]), usage,
+                               cached=all(hasattr(response, "cached_latency") for response in responses))
+
+
+def summarize_document(model_id, prompt="", prompt_context="", max_tokens="4096", map_reduce=None, use_cache=True):
+    """
+    Summarizes a document with a model, in a single request or with map-reduce summarization.
+
+    :param model_id: The ID of the model to invoke.
+    :param prompt: The task prompt.
+    :param prompt_context: The text extracted from the PDF file.
+    :param max_tokens: Optional. The maximum number of tokens to generate.
+    :param map_reduce: Optional. True to always use map-reduce summarization, False to always send the whole text.
+    Defaults to None, map-reduce is used only when the text does not fit in the model's context window.
+    :param use_cache: Optional. Set to False to always call Bedrock. Defaults to True.
+    :return: The invoke_model or summarize_map_reduce result.
+    """
+    if map_reduce is None:
+        map_reduce = needs_map_reduce(model_id, prompt, prompt_context, max_tokens)
+    if map_reduce:
+        return summarize_map_reduce(model_id, prompt, prompt_context, max_tokens, use_cache=use_cache)
+    return invoke_model(model_id, prompt, prompt_context, max_tokens, use_cache=use_cache)
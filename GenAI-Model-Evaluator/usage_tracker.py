@@ -0,0 +1,235 @@
+import collections
+import contextvars
+import functools
+import logging
+import os
+import statistics
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from pricing_calculator import calculate_prompt_cache_price, calculate_total_price
+
+# Setting up a logger with default settings
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+# Loading environment variables from a .env file
+load_dotenv()
+
+# Characters per token assumed when no local tokenizer is installed
+CHARS_PER_TOKEN = float(os.getenv("chars_per_token", "3"))
+
+# The usage trackers every model call is recorded in while set, see track_usage
+usage_trackers = contextvars.ContextVar("usage_trackers", default=())
+
+
+@functools.lru_cache(maxsize=None)
+def _get_encoding():
+    # Load the tokenizer on first use, tiktoken is optional and its encoding may not be downloadable (e.g. offline)
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        logger.warning("No local tokenizer available, token counts are estimated from the text length")
+        return None
+
+
+def count_tokens(text):
+    """
+    Counts the tokens of a text with the local tokenizer, for calls whose response does not report its usage.
+
+    :param text: The text to count.
+    :return: The number of tokens, estimated from the length of the text if tiktoken is not installed.
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return max(1, round(len(text) / CHARS_PER_TOKEN))
+
+
+def tokens_from_llm_result(response):
+    """
+    Reads the token usage Bedrock reported for a LangChain LLM call.
+
+    :param response: The LLMResult passed to on_llm_end.
+    :return: A tuple containing the input and output tokens, or None if the response carries no usage.
+    """
+    # Chat models attach the usage to every generated message
+    input_tokens = output_tokens = 0
+    found = False
+    for generations in response.generations:
+        for generation in generations:
+            usage_metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage_metadata:
+                input_tokens += usage_metadata.get("input_tokens", 0)
+                output_tokens += usage_metadata.get("output_tokens", 0)
+                found = True
+    if found:
+        return input_tokens, output_tokens
+    # Otherwise it is only combined in the llm_output of the call
+    usage = (response.llm_output or {}).get("usage") or {}
+    if "prompt_tokens" in usage:
+        return usage["prompt_tokens"], usage.get("completion_tokens", 0)
+    if "input_tokens" in usage:
+        return usage["input_tokens"], usage.get("output_tokens", 0)
+    return None
+
+
+class UsageTracker:
+    """
+    Thread-safe record of the token usage of model calls, aggregated per model and priced per model.
+    """
+
+    def __init__(self):
+        """
+        Initializes an instance of the UsageTracker class.
+        """
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def record(self, model_id, input_tokens, output_tokens, kind="candidate", source="bedrock", cached=False,
+               cache_read_tokens=0, cache_write_tokens=0, latency=None):
+        """
+        Records the usage of one call.
+
+        :param model_id: The ID of the model called.
+        :param input_tokens: The number of input tokens, not counting the prompt cache tokens.
+        :param output_tokens: The number of output tokens.
+        :param kind: Optional. What the call was made for, e.g. "candidate", "judge", "rag_answer" or "embedding".
+        :param source: Optional. "bedrock" when the counts were reported by Bedrock, "tokenizer" when they were
+        counted locally.
+        :param cached: Optional. Whether the response was served from the response cache, nothing was spent on it.
+        :param cache_read_tokens: Optional. The number of input tokens Bedrock read from its prompt cache.
+        :param cache_write_tokens: Optional. The number of input tokens Bedrock wrote to its prompt cache.
+        :param latency: Optional. The latency of the call in seconds.
+        :return: None
+        """
+        with self._lock:
+            self.calls.append({"model_id": model_id, "kind": kind, "input_tokens": int(input_tokens or 0),
+                               "output_tokens": int(output_tokens or 0), "source": source, "cached": cached,
+                               "cache_read_tokens": int(cache_read_tokens or 0),
+                               "cache_write_tokens": int(cache_write_tokens or 0), "latency": latency})
+
+    def _calls(self, kind=None, include_cached=True):
+        # Copy the recorded calls of a kind, optionally leaving out the ones served from the response cache
+        with self._lock:
+            return [call for call in self.calls if (kind is None or call["kind"] == kind)
+                    and (include_cached or not call["cached"])]
+
+    def by_model(self, kind=None, include_cached=True):
+        """
+        Aggregates the recorded calls per model.
+
+        :param kind: Optional. Only aggregate the calls of this kind.
+        :param include_cached: Optional. Set to False to only aggregate the calls actually sent to Bedrock.
+        :return: A dictionary mapping every model ID to its number of calls, cached calls, input tokens, output
+        tokens and prompt cache read and write tokens.
+        """
+        usage = collections.defaultdict(lambda: {"calls": 0, "cached_calls": 0, "input_tokens": 0,
+                                                 "output_tokens": 0, "cache_read_tokens": 0,
+                                                 "cache_write_tokens": 0})
+        for call in self._calls(kind, include_cached):
+            model_usage = usage[call["model_id"]]
+            model_usage["calls"] += 1
+            model_usage["cached_calls"] += call["cached"]
+            for field in ("input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens"):
+                model_usage[field] += call[field]
+        return dict(usage)
+
+    def costs(self, kind=None, include_cached=True):
+        """
+        Prices the usage of every model with calculate_total_price and calculate_prompt_cache_price.
+
+        :param kind: Optional. Only price the calls of this kind.
+        :param include_cached: Optional. Set to False to only price the calls actually sent to Bedrock.
+        :return: A dictionary mapping every model ID to its input cost (including the prompt cache tokens), output
+        cost, prompt cache cost and total cost.
+        """
+        costs = {}
+        for model_id, usage in self.by_model(kind, include_cached).items():
+            input_cost, output_cost, total_cost, _ = calculate_total_price(usage["input_tokens"],
+                                                                           usage["output_tokens"], model_id)
+            cache_cost, _ = calculate_prompt_cache_price(usage["cache_read_tokens"], usage["cache_write_tokens"],
+                                                         model_id)
+            costs[model_id] = {"input_cost": round(input_cost + cache_cost, 8), "output_cost": output_cost,
+                               "cache_cost": cache_cost, "total_cost": round(total_cost + cache_cost, 6)}
+        return costs
+
+    def prompt_cache_summary(self, kind=None):
+        """
+        Summarizes the effect of Bedrock prompt caching on the calls sent to Bedrock, per model.
+
+        :param kind: Optional. Only summarize the calls of this kind, e.g. "judge".
+        :return: A dictionary mapping every model ID to its calls, calls that read the prompt cache, cached and
+        uncached input tokens, the input cost with and without prompt caching, the saving, and the mean latency
+        of the calls that read the cache and of the other calls (None when there are no such calls).
+        """
+        calls_by_model = collections.defaultdict(list)
+        for call in self._calls(kind, include_cached=False):
+            calls_by_model[call["model_id"]].append(call)
+        usage_by_model = self.by_model(kind, include_cached=False)
+        summary = {}
+        for model_id, calls in calls_by_model.items():
+            usage = usage_by_model[model_id]
+            cache_cost, uncached_cost = calculate_prompt_cache_price(usage["cache_read_tokens"],
+                                                                     usage["cache_write_tokens"], model_id)
+            hit_latencies = [call["latency"] for call in calls
+                             if call["cache_read_tokens"] and call["latency"] is not None]
+            miss_latencies = [call["latency"] for call in calls
+                              if not call["cache_read_tokens"] and call["latency"] is not None]
+            summary[model_id] = {
+                "calls": len(calls),
+                "cache_hits": sum(1 for call in calls if call["cache_read_tokens"]),
+                "cached_input_tokens": usage["cache_read_tokens"],
+                # Tokens written to the cache were processed like any other input token
+                "uncached_input_tokens": usage["input_tokens"] + usage["cache_write_tokens"],
+                "cost_with_cache": cache_cost,
+                "cost_without_cache": uncached_cost,
+                "saving": round(uncached_cost - cache_cost, 8),
+                "mean_latency_cache_hit": statistics.mean(hit_latencies) if hit_latencies else None,
+                "mean_latency_cache_miss": statistics.mean(miss_latencies) if miss_latencies else None,
+            }
+        return summary
+
+    def summary(self):
+        """
+        Summarizes the usage and cost of every model, e.g. to log it at the end of a run.
+
+        :return: A dictionary mapping every model ID to its usage (see by_model) and the total cost of the calls
+        sent to Bedrock.
+        """
+        costs = self.costs(include_cached=False)
+        # A model whose calls were all served from the response cache spent nothing
+        return {model_id: {**usage, "spent": costs[model_id]["total_cost"] if model_id in costs else 0}
+                for model_id, usage in self.by_model().items()}
+
+
+@contextmanager
+def track_usage(tracker=None):
+    """
+    Context manager recording the usage of every model call made inside it, including calls made by tasks and
+    threads started with asyncio inside it. Trackers nest, a call is recorded in every active tracker, so a run
+    can be tracked as a whole and per model or knowledge base.
+
+    :param tracker: Optional. The UsageTracker to record in, a new one is created by default.
+    :return: The tracker.
+    """
+    tracker = tracker or UsageTracker()
+    token = usage_trackers.set(usage_trackers.get() + (tracker,))
+    try:
+        yield tracker
+    finally:
+        usage_trackers.reset(token)
+
+
+def record_usage(model_id, input_tokens, output_tokens, kind="candidate", source="bedrock", cached=False,
+                 cache_read_tokens=0, cache_write_tokens=0, latency=None):
+    """
+    Records the usage of one call in the active trackers, if any. See UsageTracker.record for the parameters.
+
+    :return: None
+    """
+    for tracker in usage_trackers.get():
+        tracker.record(model_id, input_tokens, output_tokens, kind, source, cached, cache_read_tokens,
+                       cache_write_tokens, latency)